@@ -23,4 +23,5 @@ eventmq. (e.g. one who requests jobs)
 
    client/messages
    client/jobs
+   client/results
 """
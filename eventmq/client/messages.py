@@ -16,14 +16,17 @@
 :mod:`messages` -- Client Messaging
 ===================================
 """
+import itertools
 from json import dumps as serialize
 import logging
 
 from past.builtins import basestring
 
 from .. import conf
+from ..tracing import trace
 from ..utils.functions import name_from_callable, split_callable_name
-from ..utils.messages import send_emqp_message
+from ..utils.headers import Headers
+from ..utils.messages import generate_msgid, send_emqp_message
 
 logger = logging.getLogger(__name__)
 
@@ -110,8 +113,8 @@ def schedule(socket, func, interval_secs=None, args=(), kwargs=None,
 def defer_job(
         socket, func, args=(), kwargs=None, class_args=(),
         class_kwargs=None, reply_requested=False, guarantee=False,
-        retry_count=0, timeout=0, debounce_secs=False,
-        queue=conf.DEFAULT_QUEUE_NAME):
+        retry_count=0, timeout=0, debounce_secs=False, dedupe_key=None,
+        delay_secs=0, eta=None, queue=conf.DEFAULT_QUEUE_NAME):
     """
     Used to send a job to a worker to execute via `socket`.
 
@@ -138,8 +141,17 @@ def defer_job(
             or immediately fail)
         timeout (int): How many seconds should we wait before killing the job
             default: 0 which means infinite timeout
-        debounce_secs (secs): Number of seconds to debounce the job.   See
-            `debounce_deferred_job` for more information.
+        debounce_secs (secs): Number of seconds to debounce the job. The
+            router drops this job if an identical job (same queue, callable
+            and arguments, or same `dedupe_key`) was accepted in the last
+            `debounce_secs` seconds.
+        dedupe_key (str): Identifies jobs that should be deduplicated. The
+            router drops this job if another job with the same key is still
+            waiting for a worker (or inside the `debounce_secs` window).
+        delay_secs (int): Number of seconds the router should wait before
+            sending the job to a worker.
+        eta (float): Unix timestamp of when the router should send the job to
+            a worker. Takes precedence over `delay_secs`.
         queue (str): Name of queue to use when executing the job. If this value
             evaluates to False, the default is used. Default: is configured
             default queue name
@@ -149,13 +161,116 @@ def defer_job(
         str: ID for the message/deferred job. This value will be None if there
             was an error.
     """
-    callable_name = None
-    path = None
-
     # Just incase this was passed None
     if not queue:
         queue = conf.DEFAULT_QUEUE_NAME
 
+    msg = _job_message(func, args=args, kwargs=kwargs, class_args=class_args,
+                       class_kwargs=class_kwargs)
+    if msg is None:
+        return
+
+    msgid = send_request(socket, msg,
+                         reply_requested=reply_requested,
+                         guarantee=guarantee,
+                         retry_count=retry_count,
+                         timeout=timeout,
+                         debounce_secs=debounce_secs,
+                         dedupe_key=dedupe_key,
+                         delay_secs=delay_secs,
+                         eta=eta,
+                         queue=queue)
+
+    return msgid
+
+
+def defer_jobs(
+        socket, jobs, reply_requested=False, guarantee=False, retry_count=0,
+        timeout=0, delay_secs=0, eta=None, queue=conf.DEFAULT_QUEUE_NAME,
+        batch_size=1000):
+    """
+    Send many jobs to the same queue with REQUEST_BATCH messages. This is
+    much cheaper for the client and the router than calling
+    :func:`defer_job` for each job.
+
+    .. note::
+
+       All passed class & fuction kwargs/args MUST be json serializable.
+
+    Args:
+        socket (socket): eventmq socket to use for sending the message
+        jobs (iterable): The jobs to defer. Each job is a callable (or string
+            path to a callable) or a tuple of ``(func, args, kwargs)``.
+            ``args`` and ``kwargs`` are optional.
+        reply_requested (bool): request the return value of each job as a
+            reply
+        retry_count (int): How many times each job should be retried when
+            encountering an Exception or some other failure before giving up.
+        timeout (int): How many seconds should we wait before killing a job
+            default: 0 which means infinite timeout
+        delay_secs (int): Number of seconds the router should wait before
+            sending the jobs to a worker.
+        eta (float): Unix timestamp of when the router should send the jobs to
+            a worker. Takes precedence over `delay_secs`.
+        queue (str): Name of queue to use when executing the jobs. If this
+            value evaluates to False, the default is used.
+        batch_size (int): Max number of jobs to send in one message
+    Raises:
+        TypeError: When one or more parameters are not JSON serializable.
+    Returns:
+        list: The ID for each deferred job in the same order as `jobs`. The
+            ID is None for jobs that had an error.
+    """
+    if not queue:
+        queue = conf.DEFAULT_QUEUE_NAME
+
+    msgids = []
+    # (index in msgids, message) of the jobs waiting to be sent
+    batch = []
+    # Marks the end of `jobs` so the last batch is sent
+    end = object()
+
+    for job in itertools.chain(jobs, (end, )):
+        if job is not end:
+            if isinstance(job, (tuple, list)):
+                msg = _job_message(*job)
+            else:
+                msg = _job_message(job)
+
+            msgids.append(None)
+            if msg is not None:
+                batch.append((len(msgids) - 1, msg))
+
+            if len(batch) < batch_size:
+                continue
+
+        if not batch:
+            continue
+
+        batch_msgids = send_request_batch(socket, [m for _, m in batch],
+                                          reply_requested=reply_requested,
+                                          guarantee=guarantee,
+                                          retry_count=retry_count,
+                                          timeout=timeout,
+                                          delay_secs=delay_secs,
+                                          eta=eta,
+                                          queue=queue)
+        for (index, _), msgid in zip(batch, batch_msgids):
+            msgids[index] = msgid
+        batch = []
+
+    return msgids
+
+
+def _job_message(func, args=(), kwargs=None, class_args=(),
+                 class_kwargs=None):
+    """
+    Build the ``run`` message for a job
+
+    Returns:
+        list: The message for :func:`send_request`, or None if `func` isn't a
+            valid callable
+    """
     if not class_kwargs:
         class_kwargs = {}
 
@@ -179,7 +294,7 @@ def defer_job(
         logger.error('Encountered invalid callable, will not proceed.')
         return
 
-    msg = ['run', {
+    return ['run', {
         'callable': callable_name,
         'path': path,
         'args': args,
@@ -188,18 +303,29 @@ def defer_job(
         'class_kwargs': class_kwargs,
     }]
 
-    msgid = send_request(socket, msg,
-                         reply_requested=reply_requested,
-                         guarantee=guarantee,
-                         retry_count=retry_count,
-                         timeout=timeout,
-                         queue=queue)
 
-    return msgid
+def _request_headers(reply_requested=False, guarantee=False, retry_count=0,
+                     timeout=0, debounce_secs=False, dedupe_key=None,
+                     delay_secs=0, eta=None):
+    """
+    Returns:
+        str: The headers for a REQUEST as sent on the wire
+    """
+    return Headers(
+        reply_requested=bool(reply_requested),
+        guarantee=bool(guarantee),
+        retry_count=retry_count if retry_count > 0 else None,
+        timeout=timeout if timeout > 0 else None,
+        debounce=debounce_secs or None,
+        dedupe_key=dedupe_key or None,
+        eta=eta or None,
+        delay=delay_secs if not eta and delay_secs > 0 else None,
+    ).encode()
 
 
 def send_request(socket, message, reply_requested=False, guarantee=False,
-                 retry_count=0, timeout=0, queue=None):
+                 retry_count=0, timeout=0, debounce_secs=False,
+                 dedupe_key=None, delay_secs=0, eta=None, queue=None):
     """
     Send a REQUEST command.
 
@@ -236,34 +362,92 @@ def send_request(socket, message, reply_requested=False, guarantee=False,
             or immediatly fail)
         timeout (int): How many seconds should we wait before killing the job
             default: 0 which means infinite timeout
+        debounce_secs (int): Drop this request if an identical one was
+            accepted by the router in the last `debounce_secs` seconds.
+        dedupe_key (str): Drop this request if one with the same key is still
+            waiting for a worker on the router.
+        delay_secs (int): Number of seconds the router should wait before
+            sending the job to a worker.
+        eta (float): Unix timestamp of when the router should send the job to
+            a worker. Takes precedence over `delay_secs`.
         queue (str): Name of queue to use when executing the job. Default: is
             configured default queue name
 
     Returns:
         str: ID of the message
     """
-    headers = []
-
-    if reply_requested:
-        headers.append('reply-requested')
-
-    if guarantee:
-        headers.append('guarantee')
-
-    if retry_count > 0:
-        headers.append('retry-count:%d' % retry_count)
-
-    if timeout > 0:
-        headers.append('timeout:%d' % timeout)
+    headers = _request_headers(reply_requested=reply_requested,
+                               guarantee=guarantee,
+                               retry_count=retry_count,
+                               timeout=timeout,
+                               debounce_secs=debounce_secs,
+                               dedupe_key=dedupe_key,
+                               delay_secs=delay_secs,
+                               eta=eta)
 
     msgid = send_emqp_message(socket, 'REQUEST',
                               (queue or conf.DEFAULT_QUEUE_NAME,
-                               ",".join(headers),
+                               headers,
                                serialize(message)))
+    trace('client.enqueue', msgid)
 
     return msgid
 
 
+def send_request_batch(socket, messages, reply_requested=False,
+                       guarantee=False, retry_count=0, timeout=0, delay_secs=0,
+                       eta=None, queue=None):
+    """
+    Send a REQUEST_BATCH command. The router handles each message like a
+    REQUEST with the same queue and headers and acknowledges the batch with a
+    single ACK listing the msgids of the accepted jobs.
+
+    Args:
+        socket (socket): Socket to use when sending `messages`
+        messages (list): The messages to send. See :func:`send_request` for
+            the format of each message.
+        reply_requested (bool): request the return value of each job as a
+            reply
+        guarantee (bool): (Give your best effort) to guarantee that the jobs
+            are executed.
+        retry_count (int): How many times each job should be retried when
+            encountering an Exception or some other failure before giving up.
+        timeout (int): How many seconds should we wait before killing a job
+            default: 0 which means infinite timeout
+        delay_secs (int): Number of seconds the router should wait before
+            sending the jobs to a worker.
+        eta (float): Unix timestamp of when the router should send the jobs to
+            a worker. Takes precedence over `delay_secs`.
+        queue (str): Name of queue to use when executing the jobs. Default: is
+            configured default queue name
+
+    Returns:
+        list: The ID of each job in the same order as `messages`
+    """
+    headers = _request_headers(reply_requested=reply_requested,
+                               guarantee=guarantee,
+                               retry_count=retry_count,
+                               timeout=timeout,
+                               delay_secs=delay_secs,
+                               eta=eta)
+
+    msgids = []
+    frames = [queue or conf.DEFAULT_QUEUE_NAME, headers]
+
+    for message in messages:
+        msgid = generate_msgid()
+        msgids.append(msgid)
+        frames.append(msgid)
+        frames.append(serialize(message))
+
+    send_emqp_message(socket, 'REQUEST_BATCH', frames)
+
+    for msgid in msgids:
+        trace('client.enqueue', msgid)
+
+    return msgids
+
+
 def send_schedule_request(socket, message, interval_secs=-1, headers=(),
                           queue=None, unschedule=False, cron=''):
     """
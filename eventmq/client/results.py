@@ -0,0 +1,228 @@
+# This file is part of eventmq.
+#
+# eventmq is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 2.1 of the License, or (at your option)
+# any later version.
+#
+# eventmq is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with eventmq.  If not, see <http://www.gnu.org/licenses/>.
+"""
+:mod:`results` -- Job Results
+=============================
+Handles for the return values of jobs deferred with ``reply_requested=True``.
+
+Usage:
+    msgid = defer_job(socket, func, reply_requested=True)
+    result = AsyncResult(socket, msgid)
+    result.get(timeout=10)
+
+    # Wait for several jobs at once
+    gather([AsyncResult(socket, m) for m in msgids], timeout=10)
+"""
+from json import loads as deserialize
+import logging
+from weakref import WeakKeyDictionary
+
+from ..exceptions import (
+    InvalidMessageError, ResultNotFoundError, ResultTimeoutError)
+from ..utils.messages import parse_message, send_emqp_message
+from ..utils.timeutils import monotonic
+
+logger = logging.getLogger(__name__)
+
+#: Results received on each socket that haven't been collected yet.
+#: Key: socket, Value: dict of serialized results by REQUEST msgid
+_received = WeakKeyDictionary()
+
+
+def _received_for(socket):
+    try:
+        return _received[socket]
+    except KeyError:
+        _received[socket] = {}
+        return _received[socket]
+
+
+def recv_results(socket, timeout=0):
+    """
+    Receive the results waiting on `socket`. ACKs (1-frame REPLYs) and any
+    other messages are discarded.
+
+    Args:
+        socket (socket): eventmq socket the REQUESTs were sent with
+        timeout (float): Seconds to wait for the first message. None waits
+            forever, 0 doesn't wait at all.
+
+    Returns:
+        dict: The serialized results received so far by REQUEST msgid
+    """
+    received = _received_for(socket)
+    timeout_ms = None if timeout is None else max(int(timeout * 1000), 0)
+
+    while socket.zsocket.poll(timeout_ms):
+        # Only wait for the first message, then drain what's left
+        timeout_ms = 0
+
+        try:
+            command, msgid, msg = parse_message(socket.recv_multipart())
+        except InvalidMessageError:
+            logger.exception('Invalid message while waiting for results')
+            continue
+
+        if command == 'REPLY' and len(msg) >= 2:
+            received[msg[0]] = msg[1]
+
+    return received
+
+
+def request_results(socket, msgids):
+    """
+    Ask the router to send the stored results of `msgids`
+
+    Args:
+        socket (socket): eventmq socket to use for sending the message
+        msgids (list): msgids of ``reply-requested`` REQUESTs
+
+    Returns:
+        str: ID of the message
+    """
+    return send_emqp_message(socket, 'RESULT', tuple(msgids))
+
+
+class AsyncResult(object):
+    """
+    Handle for the return value of a job that was deferred with
+    ``reply_requested=True``.
+    """
+    def __init__(self, socket, msgid):
+        """
+        Args:
+            socket (socket): The eventmq socket the job was deferred with.
+                Results are routed back to the socket that sent the REQUEST.
+            msgid (str): The msgid returned by
+                :func:`eventmq.client.messages.defer_job`
+        """
+        self.socket = socket
+        self.msgid = msgid
+
+        #: True once a RESULT was sent for this job, so the router is only
+        #: asked once
+        self.requested = False
+
+    def __repr__(self):
+        return '<AsyncResult {}>'.format(self.msgid)
+
+    def ready(self):
+        """
+        Returns:
+            bool: True if the result has been received
+        """
+        return self.msgid in recv_results(self.socket, timeout=0)
+
+    def get(self, timeout=None):
+        """
+        Wait for the result of the job
+
+        Args:
+            timeout (float): Max number of seconds to wait. None waits forever
+
+        Raises:
+            ResultTimeoutError: The result wasn't received in time
+            ResultNotFoundError: The router has no result for the job
+
+        Returns:
+            The return value of the job
+        """
+        deadline = None if timeout is None else monotonic() + timeout
+
+        while True:
+            received = recv_results(self.socket, timeout=0)
+            if self.msgid in received:
+                return self._decode(received.pop(self.msgid))
+
+            if not self.requested:
+                # The result may have been sent before this socket was
+                # listening, or to a different socket, so ask for it.
+                request_results(self.socket, (self.msgid, ))
+                self.requested = True
+
+            remaining = None if deadline is None else deadline - monotonic()
+            if remaining is not None and remaining <= 0:
+                raise ResultTimeoutError(
+                    'Timed out waiting for the result of {}'.format(
+                        self.msgid))
+
+            recv_results(self.socket, timeout=remaining)
+
+    @classmethod
+    def _decode(cls, reply):
+        value = deserialize(reply)
+        if isinstance(value, dict):
+            if 'value' in value:
+                return value['value']
+            elif 'error' in value:
+                # The router has no result for the job
+                raise ResultNotFoundError(value['error'])
+        return value
+
+
+def gather(results, timeout=None):
+    """
+    Wait for the results of several jobs. The router is asked for all the
+    missing results in a single RESULT message.
+
+    Args:
+        results (list): :class:`AsyncResult` objects to wait for
+        timeout (float): Max number of seconds to wait for all of the results.
+            None waits forever
+
+    Raises:
+        ResultTimeoutError: Some of the results weren't received in time
+        ResultNotFoundError: The router has no result for one of the jobs
+
+    Returns:
+        list: The return values in the same order as `results`
+    """
+    deadline = None if timeout is None else monotonic() + timeout
+    values = {}
+    pending = list(results)
+
+    while pending:
+        for result in pending:
+            received = recv_results(result.socket, timeout=0)
+            if result.msgid in received:
+                values[result] = result._decode(received.pop(result.msgid))
+
+        pending = [r for r in pending if r not in values]
+        if not pending:
+            break
+
+        by_socket = {}
+        for result in pending:
+            if not result.requested:
+                by_socket.setdefault(result.socket, []).append(result)
+
+        for socket, socket_results in by_socket.items():
+            request_results(socket, [r.msgid for r in socket_results])
+            for result in socket_results:
+                result.requested = True
+
+        remaining = None if deadline is None else deadline - monotonic()
+        if remaining is not None and remaining <= 0:
+            raise ResultTimeoutError(
+                'Timed out waiting for the results of {}'.format(
+                    ', '.join(r.msgid for r in pending)))
+
+        # Wait on the socket of the oldest pending result. Don't block on it
+        # for long if results are expected on other sockets too.
+        if len(set(r.socket for r in pending)) > 1:
+            remaining = 0.1 if remaining is None else min(remaining, 0.1)
+        recv_results(pending[0].socket, timeout=remaining)
+
+    return [values[r] for r in results]
@@ -22,6 +22,16 @@
 #: Default: False
 SUPER_DEBUG = False
 
+#: Level of the eventmq logs. super_debug implies DEBUG.
+#: Default: 'INFO'
+LOG_LEVEL = 'INFO'
+
+#: Write the logs from a background thread so log I/O doesn't block the event
+#: loops. At most LOG_QUEUE_SIZE records wait to be written, more are dropped.
+#: Default: True
+LOG_QUEUE = True
+LOG_QUEUE_SIZE = 10000
+
 #: Don't show HEARTBEAT message when debug logging is enabled
 #: Default: True
 HIDE_HEARTBEAT_LOGS = True
@@ -59,6 +69,11 @@ CONFIG_FILE = '/etc/eventmq.conf'
 # https://docs.python.org/3/library/codecs.html#standard-encodings
 DEFAULT_ENCODING = 'utf-8'
 
+#: Only allow bytes and text as message frames. Other objects raise a
+#: MessageError instead of being encoded recursively.
+#: Default: False
+STRICT_FRAMES = False
+
 # Default addresses to localhost
 # Router:
 FRONTEND_ADDR = 'tcp://127.0.0.1:47291'
@@ -78,24 +93,145 @@ PUBLISHER_OUTGOING_ADDR = 'tcp://127.0.0.1:47299'
 
 # How many jobs should the job manager concurrently handle?
 CONCURRENT_JOBS = 4
+# Autoscale the job manager's pool of workers between these bounds, starting
+# at CONCURRENT_JOBS. 0 for MAX_CONCURRENT_JOBS disables autoscaling.
+MIN_CONCURRENT_JOBS = 1
+MAX_CONCURRENT_JOBS = 0
+# Add a worker once every worker has been busy for this many seconds, sooner
+# if the router reports jobs waiting for the job manager's queues
+SCALE_UP_WINDOW = 5.0
+# Retire a worker once a worker has been idle for this many seconds
+SCALE_DOWN_COOLDOWN = 60.0
+# Run the jobs of these queues with another executor than the pool of
+# worker processes. Key: queue name, Value: 'process', 'thread' or 'asyncio'
+QUEUE_EXECUTORS = {}
+# Number of threads of the 'thread' executor
+THREAD_POOL_SIZE = 32
+# Max number of jobs the 'asyncio' executor runs at once
+ASYNCIO_CONCURRENCY = 1000
 HWM = 10000
 
+# Share the slots of a worker between its queues in proportion to the queue
+# weights (deficit round robin). When False, a worker always takes jobs from
+# its highest weighted queue with waiting jobs first.
+QUEUE_FAIR_SHARE = True
+
+# Per queue limits enforced by the router. Jobs over a limit stay buffered on
+# the router until they can be sent. Both are JSON objects keyed by queue
+# name, e.g. queue_rate_limits={"push_notifications": 50}
+# Max number of jobs per second sent to the workers of a queue
+QUEUE_RATE_LIMITS = {}
+# Max number of jobs of a queue running at the same time
+QUEUE_MAX_IN_FLIGHT = {}
+
+# Jobs sent with the ``guarantee`` header are sent to another worker if their
+# worker goes away before reporting them finished, or if they run longer than
+# this many seconds (plus their ``timeout`` header, or GLOBAL_TIMEOUT, for each
+# attempt and the longest backoff before each retry)
+VISIBILITY_TIMEOUT = 600.0
+
 # Redis settings
 RQ_HOST = 'localhost'
 RQ_PORT = 6379
 RQ_DB = 0
 RQ_PASSWORD = ''
 
+# How the scheduler handles executions missed while it was stalled or down.
+# One of 'once', 'all', or 'skip'. Can be overridden per schedule with the
+# ``misfire:<policy>`` header
+MISFIRE_POLICY = 'once'
+# Seconds an execution may be late before it's considered a misfire
+MISFIRE_GRACE_TIME = 30.0
+# Max number of late (catch-up) requests the scheduler sends per second
+MISFIRE_CATCHUP_RATE = 10.0
+# Window (in seconds) to spread the executions of schedules over. Each
+# schedule gets a fixed offset in the window derived from its hash. Can be
+# overridden per schedule with the ``jitter:<secs>`` header
+SCHEDULE_JITTER = 0.0
+
+# Where the router keeps the results of ``reply-requested`` jobs so clients
+# can fetch them with the RESULT command. One of 'memory', 'redis' (uses the
+# rq_* settings) or 'file'. An empty value disables storing results.
+RESULT_BACKEND = 'memory'
+# Seconds to keep a result
+RESULT_TTL = 3600
+# Max number of results the memory and file backends keep
+RESULT_MAX_ENTRIES = 10000
+# Directory the file backend writes results to
+RESULT_FILE_PATH = '/tmp/eventmq-results'
+
+# Worker processes are recycled (replaced by a new process) between jobs once
+# one of these is hit. 0 disables a policy.
+# Number of jobs
 MAX_JOB_COUNT = 1024
+# Resident memory in MB
+WORKER_MAX_RSS = 0
+# Growth of the resident memory in MB since the first job
+WORKER_MAX_RSS_GROWTH = 0
+# Seconds since the process started
+WORKER_MAX_AGE = 0.0
 
 # Path/Callable to run on start of a worker process
 SETUP_PATH = ''
 SETUP_CALLABLE = ''
+# Job modules the job manager imports before it starts its workers. The
+# workers are forked from the job manager, so they share the imported modules
+# copy-on-write instead of each importing them on their first job.
+PRELOAD_MODULES = []
+# Run the setup callable once in the job manager before the workers are
+# forked instead of in each worker. The setup must not leave anything that
+# can't be shared across a fork (e.g. open sockets).
+PRELOAD_SETUP = False
 
 # Time to wait after receiving SIGTERM to kill the workers in the jobmanager
 # forecfully
 KILL_GRACE_PERIOD = 300
 GLOBAL_TIMEOUT = 300
+# Seconds a job that ran past its timeout gets to stop after JobTimeoutError
+# is raised in it. A worker whose job doesn't stop in time exits and is
+# replaced. 0 replaces the worker right away.
+TIMEOUT_GRACE_PERIOD = 10.0
+
+# Failed jobs sent with the ``retry-count:N`` header are retried after an
+# exponential backoff: RETRY_BACKOFF_BASE * 2^attempt seconds (capped at
+# RETRY_BACKOFF_MAX), with up to half of it randomized
+RETRY_BACKOFF_BASE = 1.0
+RETRY_BACKOFF_MAX = 300.0
+# Number of jobs that ran out of retries to keep in memory for inspection
+DEAD_LETTER_MAX = 1000
+# Log jobs that ran out of retries to this file. Empty disables it.
+DEAD_LETTER_LOG = ''
+
+# Queues whose jobs the jobmanager runs in batches. Key: queue name, Value:
+# max number of jobs in a batch. Jobs for the same callable are collected
+# for up to BATCH_LINGER seconds and run back to back by one worker, or with
+# one call to ``func.batch(list_of_args)`` if the callable defines it.
+BATCH_QUEUES = {}
+BATCH_LINGER = 0.05
+
+# Bodies of REQUESTs this many bytes or larger are handed from the jobmanager
+# to its worker processes through a file in SHARED_MEMORY_DIR instead of
+# being decoded by the jobmanager and pickled through its queue. 0 disables
+# it.
+SHARED_MEMORY_THRESHOLD = 1048576
+# tmpfs directory for the shared bodies. The temp directory is used if it
+# doesn't exist.
+SHARED_MEMORY_DIR = '/dev/shm'
+
+# Port to serve metrics on as OpenMetrics text (for Prometheus). Set it in
+# the section of each device, e.g. [router] and [jobmanager], so they don't
+# share a port. 0 disables it.
+METRICS_PORT = 0
+METRICS_HOST = '127.0.0.1'
+
+# Fraction (0 to 1) of the jobs to trace. Each device records when the
+# sampled jobs pass through it (see eventmq.tracing). 0 disables tracing.
+TRACE_SAMPLE_RATE = 0.0
+# Where spans are sent. 'jsonl' appends them to TRACE_FILE, 'memory' keeps the
+# last TRACE_BUFFER_SIZE spans in memory.
+TRACE_EXPORTER = 'jsonl'
+TRACE_FILE = '/tmp/eventmq-trace.jsonl'
+TRACE_BUFFER_SIZE = 10000
 
 WAL = '/var/log/eventmq/wal.log'
 WAL_ENABLED = False
@@ -15,6 +15,12 @@ class CLIENT_TYPE(object):
     scheduler = 'scheduler'
 
 
+class MISFIRE_POLICY(object):
+    once = 'once'     # Run a late schedule one time, then resume the cadence
+    all = 'all'       # Run every missed execution (rate limited)
+    skip = 'skip'     # Drop executions that are later than the grace time
+
+
 # See doc/protocol.rst
 PROTOCOL_VERSION = 'eMQP/1.0'
 
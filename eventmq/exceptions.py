@@ -68,3 +68,23 @@ class ConnectionError(EventMQError):
     """
     Raised when there is an error connecting to a network service.
     """
+
+
+class ResultTimeoutError(EventMQError):
+    """
+    Raised when the result of a job isn't received before the timeout.
+    """
+
+
+class ResultNotFoundError(EventMQError):
+    """
+    Raised when the router has no result for a job and isn't waiting for
+    one, e.g. the job wasn't ``reply-requested``, its result expired or it
+    was lost with its worker.
+    """
+
+
+class JobTimeoutError(EventMQError):
+    """
+    Raised in the thread running a job when the job runs past its timeout
+    """
@@ -17,29 +17,38 @@
 ================================
 Ensures things about jobs and spawns the actual tasks
 """
+from collections import deque
+import heapq
+import itertools
 from json import dumps as serializer, loads as deserializer
 
 import logging
 from multiprocessing import Manager as MPManager
 import os
+import random
 import signal
 import sys
 import time
 
 import zmq
 
-from eventmq.log import setup_logger
+from eventmq.log import log_level, setup_logger, setup_wal_logger
 from . import conf
 from .constants import KBYE, STATUS
+from .metrics import MetricsRegistry
 from .poller import Poller, POLLIN
 from .sender import Sender
+from .tracing import trace
 from .utils.classes import EMQPService, HeartbeatMixin
 from .utils.devices import generate_device_name
-from .utils.functions import get_timeout_from_headers
+from .utils.functions import retry_backoff
+from .utils.headers import parse_headers
 from .utils.messages import send_emqp_message as sendmsg
 from .utils.settings import import_settings
+from .utils.sharedmem import unlink_shared, write_shared
 from .utils.timeutils import monotonic
-from .worker import MultiprocessWorker as Worker
+from .worker import (
+    EXECUTORS, MultiprocessWorker as Worker, preload, ThreadExecutor)
 
 
 if sys.version[0] == '2':
@@ -49,6 +58,7 @@ else:
 
 
 logger = logging.getLogger(__name__)
+dead_letter_logger = logging.getLogger('eventmq-dead-letter')
 
 
 class JobManager(HeartbeatMixin, EMQPService):
@@ -119,6 +129,79 @@ class JobManager(HeartbeatMixin, EMQPService):
         #: Keep track of what pids are servicing our requests
         #: Key: pid, Value: # of jobs completed on the process with that pid
         self.pid_distribution = {}
+        #: Resident memory of the worker processes after their last job
+        #: Key: pid, Value: bytes
+        self.pid_rss = {}
+        #: Number of worker processes recycled by their recycling policies
+        #: Key: reason (e.g. ``rss``), Value: # of processes
+        self.recycled_workers = {}
+
+        #: Failed jobs waiting to be retried. Heap of
+        #: (monotonic time to retry at, sequence #, payload)
+        self.retry_queue = []
+        # Breaks ties in `retry_queue` so payloads are never compared
+        self._retry_seq = itertools.count()
+
+        #: msgids of finished jobs whose worker died, so they couldn't be
+        #: reported with READY yet. They are sent with the READY of the
+        #: replacement worker.
+        self.unreported_msgids = []
+
+        #: Jobs that failed and ran out of retries. The oldest are dropped
+        #: once there are more than ``conf.DEAD_LETTER_MAX``
+        self.dead_letters = deque(maxlen=conf.DEAD_LETTER_MAX)
+
+        #: Jobs collected for a batch (see ``conf.BATCH_QUEUES``).
+        #: Key: (queue name, path, callable, class args, class kwargs),
+        #: Value: (monotonic time to send the batch at, list of payloads)
+        self.pending_batches = {}
+
+        #: The REQUEST frames (queue name, headers, body) of the jobs
+        #: received that haven't finished, so the jobs no worker has started
+        #: can be returned to the router. Key: msgid
+        self.job_requests = {}
+        #: Files in shared memory holding the bodies of large jobs for the
+        #: worker processes to decode (see ``conf.SHARED_MEMORY_THRESHOLD``).
+        #: Key: msgid
+        self.shared_bodies = {}
+        #: Number of payloads (jobs or batches) put on :attr:`request_queue`
+        #: that the workers haven't finished
+        self.busy_slots = 0
+        #: Executors for the queues that don't run in the pool of worker
+        #: processes (see ``conf.QUEUE_EXECUTORS``). Key: executor name
+        self.executors = {}
+        #: Responses from the jobs run by :attr:`executors`
+        self.executor_results = Queue.Queue()
+        #: msgids of the jobs taken back from the workers when the connection
+        #: was reset. They are returned to the router once it ACKs the new
+        #: connection.
+        self.held_jobs = []
+        #: True after a reset until the new connection is ACKed
+        self.resuming = False
+        #: Set by :meth:`sigterm_handler` for the event loop to shut down
+        self.shutdown_requested = False
+
+        #: Number of worker processes the pool should have. Between
+        #: ``conf.MIN_CONCURRENT_JOBS`` and ``conf.MAX_CONCURRENT_JOBS`` when
+        #: autoscaling is enabled, otherwise ``conf.CONCURRENT_JOBS``.
+        self.pool_size = conf.CONCURRENT_JOBS
+        #: Slots the router still counts for workers that were retired. The
+        #: next slots that open up aren't given back to the router.
+        self.surplus_slots = 0
+        #: Number of jobs waiting for this jobmanager's queues, as reported
+        #: by the router with its last HEARTBEAT
+        self.router_backlog = 0
+        # monotonic time since every worker has been busy, or since at least
+        # one worker has been idle
+        self._busy_since = None
+        self._idle_since = None
+        # monotonic time to check for dead worker processes at
+        self._next_health_check = 0
+
+        #: Counters, gauges and histograms served on ``conf.METRICS_PORT``
+        self.metrics = MetricsRegistry()
+        self.setup_metrics()
+        self.metrics_server = None
 
         #: Setup worker queues
         self._mp_manager = MPManager()
@@ -133,15 +216,142 @@ class JobManager(HeartbeatMixin, EMQPService):
     @property
     def workers(self):
         if not hasattr(self, '_workers'):
+            # The workers are forked from this process, so they share what's
+            # preloaded
+            preload()
+
             self._workers = {}
-            for i in range(0, conf.CONCURRENT_JOBS):
-                w = Worker(self.request_queue, self.finished_queue,
-                           os.getpid())
-                w.start()
-                self._workers[w.pid] = w
+            low, high = self.pool_bounds()
+            self.pool_size = min(max(conf.CONCURRENT_JOBS, low), high)
+            for i in range(0, self.pool_size):
+                self.start_worker()
+
+            self.start_executors()
 
         return self._workers.values()
 
+    def start_worker(self):
+        """
+        Start a worker process. It sends READY once it's running.
+        """
+        w = Worker(self.request_queue, self.finished_queue, os.getpid())
+        w.start()
+        self._workers[w.pid] = w
+
+    def start_executors(self):
+        """
+        Start the executors named in ``conf.QUEUE_EXECUTORS``. Like the
+        worker processes, they send READY for each of their slots once
+        they're running. Without asyncio (Python 2) the queues meant for the
+        asyncio executor run in threads instead.
+        """
+        for name in sorted(set(conf.QUEUE_EXECUTORS.values())):
+            if name == 'process' or name in self.executors:
+                continue
+
+            if name not in EXECUTORS:
+                logger.error('Unknown executor {}. Its queues run in the '
+                             'worker processes.'.format(name))
+                continue
+
+            try:
+                executor = EXECUTORS[name](self.executor_results)
+            except ImportError as e:
+                logger.error('Unable to start the {} executor ({}). Its '
+                             'queues run in threads.'.format(name, e))
+                executor = ThreadExecutor(self.executor_results, name=name)
+
+            executor.start()
+            self.executors[name] = executor
+
+    def executors_busy(self):
+        """
+        Returns:
+            bool: True if any of the :attr:`executors` is running a job
+        """
+        return any(executor.busy for executor in self.executors.values())
+
+    @staticmethod
+    def pool_bounds():
+        """
+        Returns:
+            tuple: The (min, max) number of worker processes. Both are
+                ``conf.CONCURRENT_JOBS`` unless autoscaling is enabled with
+                ``conf.MAX_CONCURRENT_JOBS``.
+        """
+        if conf.MAX_CONCURRENT_JOBS <= 0:
+            return conf.CONCURRENT_JOBS, conf.CONCURRENT_JOBS
+
+        return (min(max(conf.MIN_CONCURRENT_JOBS, 1),
+                    conf.MAX_CONCURRENT_JOBS),
+                conf.MAX_CONCURRENT_JOBS)
+
+    def autoscale(self, now=None):
+        """
+        Grow or shrink the pool of worker processes when autoscaling is
+        enabled. While every worker is busy, the pool grows by the backlog
+        the router reported with its last HEARTBEAT, or by one worker after
+        ``conf.SCALE_UP_WINDOW`` seconds. It shrinks by one worker each
+        ``conf.SCALE_DOWN_COOLDOWN`` seconds that a worker stays idle.
+
+        Args:
+            now (float): monotonic time to check the pool at
+        """
+        if conf.MAX_CONCURRENT_JOBS <= 0 or self.status != STATUS.running or \
+           not hasattr(self, '_workers'):
+            return
+
+        now = now or monotonic()
+        low, high = self.pool_bounds()
+
+        if self.busy_slots >= self.pool_size:
+            self._idle_since = None
+            if self._busy_since is None:
+                self._busy_since = now
+        else:
+            # The backlog is only a reason to grow while the workers can't
+            # keep up
+            self._busy_since = None
+            self.router_backlog = 0
+            if self._idle_since is None:
+                self._idle_since = now
+
+        if self._busy_since is not None and self.pool_size < high and \
+           (self.router_backlog or
+                now - self._busy_since >= conf.SCALE_UP_WINDOW):
+            self.scale_up(min(high - self.pool_size,
+                              max(self.router_backlog, 1)))
+            self.router_backlog = 0
+            self._busy_since = now
+        elif self._idle_since is not None and self.pool_size > low and \
+                now - self._idle_since >= conf.SCALE_DOWN_COOLDOWN:
+            self.scale_down()
+            self._idle_since = now
+
+    def scale_up(self, count):
+        """
+        Add `count` worker processes to the pool
+        """
+        logger.info('Adding {} worker(s) to the pool of {}'.format(
+            count, self.pool_size))
+
+        for _ in range(count):
+            self.pool_size += 1
+            self.start_worker()
+
+    def scale_down(self):
+        """
+        Retire an idle worker process. The router still counts its slot, so
+        the next slot that opens up is kept instead of sent with READY.
+        """
+        logger.info('Retiring an idle worker from the pool of {}'.format(
+            self.pool_size))
+
+        self.pool_size -= 1
+        self.surplus_slots += 1
+        # Only idle workers are waiting on the queue
+        self.request_queue.put('DONE')
+
     def _start_event_loop(self):
         """
         Starts the actual event loop. Usually called by :meth:`start`
@@ -150,9 +360,15 @@ class JobManager(HeartbeatMixin, EMQPService):
 
         try:
             while True:
+                if self.shutdown_requested and not self.received_disconnect:
+                    self.shutdown()
+
                 # Clear any workers if it's time to shut down
                 if self.received_disconnect and self.status != STATUS.stopping:
                     self.status = STATUS.stopping
+                    for key in list(self.pending_batches):
+                        self.send_batch(key)
+
                     for _ in range(len(self.workers)):
                         logger.debug('Requesting worker death')
                         self.request_queue.put_nowait('DONE')
@@ -160,19 +376,30 @@ class JobManager(HeartbeatMixin, EMQPService):
                     self.disconnect_time = monotonic()
                 else:
                     # Call appropiate callbacks for each finished job
-                    while True:
-                        try:
-                            resp = self.finished_queue.get_nowait()
-                        except Queue.Empty:
-                            break
-                        else:
-                            self.handle_response(resp)
+                    for results in (self.finished_queue,
+                                    self.executor_results):
+                        while True:
+                            try:
+                                resp = results.get_nowait()
+                            except Queue.Empty:
+                                break
+                            else:
+                                self.handle_response(resp)
+
+                    self.release_due_retries()
+                    self.release_due_batches()
+                    self.check_due_worker_health()
+                    self.autoscale()
 
                     if self.status == STATUS.stopping and \
                        not self.should_reset:
-                        if len(self._workers) > 0:
+                        if len(self._workers) > 0 or self.executors_busy():
                             time.sleep(0.1)
                         else:
+                            for executor in self.executors.values():
+                                executor.stop()
+                            for msgid in list(self.shared_bodies):
+                                self.release_shared_body(msgid)
                             sys.exit(0)
 
                         if monotonic() > self.disconnect_time + \
@@ -180,10 +407,12 @@ class JobManager(HeartbeatMixin, EMQPService):
                             logger.debug("Killing unresponsive workers")
                             for pid in self._workers.keys():
                                 self.kill_worker(pid, signal.SIGKILL)
+                            for msgid in list(self.shared_bodies):
+                                self.release_shared_body(msgid)
                             sys.exit(0)
                     else:
                         try:
-                            events = self.poller.poll(1000)
+                            events = self.poller.poll(self.poll_timeout())
                         except zmq.ZMQError as e:
                             logger.debug('Disconnecting due to ZMQError while'
                                          ' polling: {}'.format(e))
@@ -240,16 +469,45 @@ class JobManager(HeartbeatMixin, EMQPService):
 
         if conf.SUPER_DEBUG:
             logger.debug(resp)
+
+        self.record_worker_stats(resp)
+
+        if 'batch' in resp:
+            self.handle_batch_response(resp)
+            return
+
         pid = resp['pid']
         msgid = resp['msgid']
         callback = resp['callback']
         death = resp['death']
+        result = 'succeeded'
+
+        if resp.get('failed') and msgid in self.jobs_in_flight:
+            payload = self.jobs_in_flight[msgid][1]
+            if self.retry_job(payload):
+                # The job isn't finished yet. It keeps its slot, unless the
+                # worker died and its replacement reports the slot instead.
+                payload['holds_slot'] = \
+                    payload.get('holds_slot', True) and not death
+                callback = 'worker_retry'
+                result = 'retried'
+            else:
+                result = 'failed'
+                if payload.get('attempts'):
+                    self.dead_letter(payload, resp['return'])
 
         callback = getattr(self, callback)
         callback(resp['return'], msgid, death, pid)
 
+        if msgid is not None:
+            # Only the responses for jobs have a msgid
+            self.free_slot(resp)
+            if result != 'retried':
+                self.job_requests.pop(msgid, None)
+                self.release_shared_body(msgid)
+
         if msgid in self.jobs_in_flight:
-            del self.jobs_in_flight[msgid]
+            self.record_job_metrics(self.jobs_in_flight.pop(msgid)[0], result)
 
         if not death:
             if pid not in self.pid_distribution:
@@ -257,6 +515,84 @@ class JobManager(HeartbeatMixin, EMQPService):
             else:
                 self.pid_distribution[pid] += 1
 
+    def handle_batch_response(self, resp):
+        """
+        Handles the response from a worker process for a batch of jobs (see
+        :meth:`send_batch`). The batch used one slot, so all of the finished
+        jobs are reported with a single READY.
+
+        Args:
+            resp (dict): Like the `resp` of :meth:`handle_response` with a
+                ``batch`` list of {'msgid', 'return', 'failed'} for each job
+        """
+        pid = resp['pid']
+        death = resp['death']
+        finished_msgids = []
+        # msgid of the retried job that keeps the batch's slot
+        slot_holder = None
+        self.free_slot(resp)
+
+        for job in resp['batch']:
+            msgid = job['msgid']
+            try:
+                started, payload = self.jobs_in_flight.pop(msgid)
+            except KeyError:
+                continue
+
+            if job['failed']:
+                if self.retry_job(payload):
+                    # The batch ran in one slot, which is kept for the first
+                    # retried job. The other retries don't have a slot.
+                    payload['holds_slot'] = slot_holder is None and not death
+                    if payload['holds_slot']:
+                        slot_holder = msgid
+                    self.record_job_metrics(started, 'retried')
+                    continue
+                elif payload.get('attempts'):
+                    self.dead_letter(payload, job['return'])
+
+            self.job_requests.pop(msgid, None)
+            self.release_shared_body(msgid)
+
+            self.record_job_metrics(
+                started, 'failed' if job['failed'] else 'succeeded')
+
+            if payload['callback'] == 'worker_done_with_reply':
+                try:
+                    reply = serializer(job['return'])
+                except TypeError as e:
+                    reply = serializer({"value": str(e)})
+
+                self.send_reply(reply, msgid)
+
+            finished_msgids.append(msgid)
+
+        if death:
+            self.unreported_msgids.extend(finished_msgids)
+        elif self.status != STATUS.stopping:
+            if slot_holder is None:
+                self.send_ready(*finished_msgids)
+            elif finished_msgids:
+                self.send_retire(*finished_msgids)
+
+        if not death:
+            self.pid_distribution[pid] = \
+                self.pid_distribution.get(pid, 0) + len(resp['batch'])
+
+    def free_slot(self, resp):
+        """
+        Count the slot a finished job (or batch) ran in as free, in the pool
+        of worker processes or in the executor that ran it
+
+        Args:
+            resp (dict): The response for the job
+        """
+        executor = self.executors.get(resp.get('executor'))
+        if executor is not None:
+            executor.busy = max(0, executor.busy - 1)
+        else:
+            self.busy_slots = max(0, self.busy_slots - 1)
+
     def on_request(self, msgid, msg):
         """
         Handles a REQUEST command
@@ -289,28 +625,463 @@ class JobManager(HeartbeatMixin, EMQPService):
         # Parse REQUEST message values
 
         self.total_requests += 1
+        self.requests_metric.inc()
+        trace('jobmanager.receive', msgid)
 
-        headers = msg[1]
-        payload = deserializer(msg[2])
-        params = payload[1]
+        headers = parse_headers(msg[1])
+        params = self.share_body(msgid, msg[0], msg[2])
+        if params is None:
+            params = deserializer(msg[2])[1]
 
-        if 'reply-requested' in headers:
+        if headers.reply_requested:
             callback = 'worker_done_with_reply'
         else:
             callback = 'worker_done'
 
-        timeout = get_timeout_from_headers(headers)
-
         payload = {}
         payload['params'] = params
-        payload['timeout'] = timeout
+        payload['timeout'] = headers.timeout
         payload['msgid'] = msgid
         payload['callback'] = callback
+        payload['retries_left'] = headers.retry_count or 0
+        payload['attempts'] = 0
+        payload['queue'] = msg[0]
 
         self.jobs_in_flight[msgid] = (monotonic(), payload)
+        self.job_requests[msgid] = msg[:3]
+
+        batch_size = conf.BATCH_QUEUES.get(msg[0], 0)
+        if batch_size > 1:
+            self.add_to_batch(msg[0], payload, batch_size)
+        else:
+            self.queue_job(payload)
+
+    def share_body(self, msgid, queue_name, body):
+        """
+        Write the body of a large REQUEST to shared memory for the worker
+        process to decode, instead of decoding it here and pickling it
+        through :attr:`request_queue`. Bodies smaller than
+        ``conf.SHARED_MEMORY_THRESHOLD`` and the bodies of jobs that don't
+        run in a worker process alone (batches and executors) are decoded
+        here.
+
+        Args:
+            msgid (str): The msgid of the job
+            queue_name (str): The queue the job was sent to
+            body (str): The body frame of the REQUEST. Text is written
+                encoded to ``conf.DEFAULT_ENCODING``.
+
+        Returns:
+            dict: The params of the payload pointing the worker at the body,
+                or None if the body should be decoded here
+        """
+        if conf.SHARED_MEMORY_THRESHOLD <= 0 or \
+           len(body) < conf.SHARED_MEMORY_THRESHOLD or \
+           conf.BATCH_QUEUES.get(queue_name, 0) > 1 or \
+           conf.QUEUE_EXECUTORS.get(queue_name) in self.executors:
+            return None
+
+        try:
+            if not isinstance(body, bytes):
+                body = body.encode(conf.DEFAULT_ENCODING)
+            path = write_shared(body)
+        except Exception as e:
+            # The body is sent inline instead
+            logger.warning('Unable to write the body of job {} to shared '
+                           'memory: {}'.format(msgid, e))
+            return None
+
+        self.shared_bodies[msgid] = path
+        self.shared_bodies_metric.inc()
+        return {'shared_body': path}
+
+    def release_shared_body(self, msgid):
+        """
+        Remove the shared body of a job that finished or was returned
+        """
+        path = self.shared_bodies.pop(msgid, None)
+        if path is not None:
+            try:
+                unlink_shared(path)
+            except OSError as e:
+                logger.warning('Unable to remove shared body {}: {}'.format(
+                    path, e))
+
+    def queue_job(self, payload):
+        """
+        Put a job (or a batch of jobs) on :attr:`request_queue` for the next
+        free worker process, or submit it to the executor of its queue
 
+        Args:
+            payload (dict): The payload for the worker
+        """
+        executor = self.executors.get(
+            conf.QUEUE_EXECUTORS.get(payload.get('queue')))
+        if executor is not None:
+            executor.submit(payload)
+            return
+
+        self.busy_slots += 1
         self.request_queue.put(payload)
 
+    def add_to_batch(self, queue_name, payload, batch_size):
+        """
+        Collect a job in :attr:`pending_batches` with the other jobs for the
+        same callable. The batch is sent when it has `batch_size` jobs or
+        ``conf.BATCH_LINGER`` seconds after its first job arrived.
+
+        The first job of a batch keeps the slot the router sent it to, which
+        the whole batch runs in. The slots of the other jobs are given back
+        to the router right away so it keeps sending jobs to batch.
+
+        Args:
+            queue_name (str): The queue the job was sent to
+            payload (dict): The payload for the worker
+            batch_size (int): Max number of jobs in a batch for the queue
+        """
+        params = payload['params']
+        key = (queue_name, params.get('path'), params.get('callable'),
+               serializer(params.get('class_args') or ()),
+               serializer(params.get('class_kwargs') or {}, sort_keys=True))
+
+        if key in self.pending_batches:
+            self.pending_batches[key][1].append(payload)
+
+            if self.status != STATUS.stopping:
+                self.send_ready()
+        else:
+            self.pending_batches[key] = (monotonic() + conf.BATCH_LINGER,
+                                         [payload])
+
+        if len(self.pending_batches[key][1]) >= batch_size:
+            self.send_batch(key)
+
+    def send_batch(self, key):
+        """
+        Send the jobs collected in :attr:`pending_batches` under `key` to a
+        worker process as a single payload
+        """
+        payloads = self.pending_batches.pop(key)[1]
+
+        if len(payloads) == 1:
+            self.queue_job(payloads[0])
+            return
+
+        timeouts = [payload['timeout'] for payload in payloads]
+
+        self.queue_job({
+            'msgid': None,
+            'queue': key[0],
+            'batch': [payload['msgid'] for payload in payloads],
+            'params': {'batch': [payload['params'] for payload in payloads]},
+            # The jobs run one after the other
+            'timeout': sum(timeouts) if all(timeouts) else 0,
+        })
+
+    def release_due_batches(self, now=None):
+        """
+        Send the batches in :attr:`pending_batches` that have waited
+        ``conf.BATCH_LINGER`` seconds for more jobs
+        """
+        now = now or monotonic()
+        for key, (send_at, _) in list(self.pending_batches.items()):
+            if send_at <= now:
+                self.send_batch(key)
+
+    def retry_job(self, payload):
+        """
+        Put a failed job in :attr:`retry_queue` if it has any retries left
+
+        Args:
+            payload (dict): The payload that was sent to the worker
+
+        Returns:
+            bool: True if the job will be retried
+        """
+        if payload.get('retries_left', 0) <= 0:
+            return False
+
+        payload['retries_left'] -= 1
+        payload['attempts'] += 1
+        delay = self.retry_delay(payload['attempts'])
+
+        logger.warning('Job {} failed. Retrying in {:.2f}s ({} retries '
+                       'left)'.format(payload['msgid'], delay,
+                                      payload['retries_left']))
+
+        heapq.heappush(self.retry_queue, (monotonic() + delay,
+                                          next(self._retry_seq), payload))
+        return True
+
+    @classmethod
+    def retry_delay(cls, attempt):
+        """
+        Exponential backoff with jitter. Half of the delay is fixed and the
+        other half is random so retries of jobs that failed together (e.g.
+        because a shared service was down) are spread out.
+
+        Args:
+            attempt (int): The number of the retry, starting at 1
+
+        Returns:
+            float: seconds to wait before retrying
+        """
+        delay = retry_backoff(attempt)
+        return delay / 2.0 + random.uniform(0, delay / 2.0)
+
+    def release_due_retries(self, now=None):
+        """
+        Send the jobs in :attr:`retry_queue` that are due back to the workers
+        """
+        now = now or monotonic()
+        while self.retry_queue and self.retry_queue[0][0] <= now:
+            payload = heapq.heappop(self.retry_queue)[2]
+            self.jobs_in_flight[payload['msgid']] = (now, payload)
+            self.queue_job(payload)
+
+    def take_queued_jobs(self):
+        """
+        Take back the jobs no worker has started: the ones waiting in
+        :attr:`request_queue`, the :attr:`executors`,
+        :attr:`pending_batches` and :attr:`retry_queue`. They are no longer
+        in flight here and should be returned to the router with
+        :meth:`return_jobs`.
+
+        Returns:
+            list: The payloads of the jobs, in the order they were queued
+        """
+        queued = []
+        stop_requests = 0
+
+        while True:
+            try:
+                payload = self.request_queue.get_nowait()
+            except Queue.Empty:
+                break
+
+            if payload == 'DONE':
+                stop_requests += 1
+                continue
+
+            self.busy_slots = max(0, self.busy_slots - 1)
+            queued.append(payload)
+
+        for _ in range(stop_requests):
+            self.request_queue.put_nowait('DONE')
+
+        for name in sorted(self.executors):
+            queued.extend(self.executors[name].take_queued())
+
+        payloads = []
+        for payload in queued:
+            if 'batch' in payload:
+                payloads.extend(self.jobs_in_flight[msgid][1]
+                                for msgid in payload['batch']
+                                if msgid in self.jobs_in_flight)
+            else:
+                payloads.append(payload)
+
+        for key in list(self.pending_batches):
+            payloads.extend(self.pending_batches.pop(key)[1])
+
+        payloads.extend(payload for _, _, payload in sorted(
+            self.retry_queue, key=lambda item: item[:2]))
+        self.retry_queue = []
+
+        for payload in payloads:
+            self.jobs_in_flight.pop(payload['msgid'], None)
+
+        return payloads
+
+    def return_jobs(self, payloads):
+        """
+        Send the jobs taken back with :meth:`take_queued_jobs` to the router
+        with RETURN so they run on another worker (or this one after it
+        reconnects) instead of being lost. Jobs that were retried are
+        returned with the retries they have left.
+
+        Args:
+            payloads (list): The payloads of the jobs to return
+        """
+        # The router puts each returned job at the head of its queue, so the
+        # last one is returned first to keep them in order
+        for payload in reversed(payloads):
+            msgid = payload['msgid']
+            self.release_shared_body(msgid)
+            try:
+                queue_name, headers, body = self.job_requests.pop(msgid)
+            except KeyError:
+                logger.warning('Unable to return job {}, its request is '
+                               'unknown'.format(msgid))
+                continue
+
+            if payload['attempts']:
+                headers = parse_headers(headers).replace(
+                    retry_count=payload['retries_left']).encode()
+
+            trace('jobmanager.return', msgid)
+            sendmsg(self.outgoing, 'RETURN',
+                    [msgid, queue_name, headers, body])
+
+        if payloads:
+            logger.info('Returned {} queued job(s) to the router'.format(
+                len(payloads)))
+
+    def poll_timeout(self):
+        """
+        Returns:
+            int: milliseconds to poll for, so the next retry or batch isn't
+                late
+        """
+        deadlines = [send_at for send_at, _ in self.pending_batches.values()]
+        if self.retry_queue:
+            deadlines.append(self.retry_queue[0][0])
+
+        if not deadlines:
+            return 1000
+
+        wait = (min(deadlines) - monotonic()) * 1000
+        return int(min(max(wait, 0), 1000))
+
+    def dead_letter(self, payload, reply):
+        """
+        Record a job that failed and ran out of retries in
+        :attr:`dead_letters` and the dead letter log (see
+        ``conf.DEAD_LETTER_LOG``)
+
+        Args:
+            payload (dict): The payload that was sent to the worker
+            reply (dict): The last return value of the job
+        """
+        params = payload['params']
+        if 'shared_body' in params and payload['msgid'] in self.job_requests:
+            # The shared body is removed once the job is done
+            params = deserializer(self.job_requests[payload['msgid']][2])[1]
+
+        entry = {
+            'msgid': payload['msgid'],
+            'params': params,
+            'attempts': payload['attempts'] + 1,
+            'error': reply.get('value') if isinstance(reply, dict) else reply,
+            'ts': time.time(),
+        }
+        self.dead_letters.append(entry)
+
+        logger.error('Job {} failed after {} attempts'.format(
+            entry['msgid'], entry['attempts']))
+        try:
+            dead_letter_logger.info(serializer(entry))
+        except TypeError:
+            dead_letter_logger.info(str(entry))
+
+    def setup_metrics(self):
+        """
+        Define the metrics of the jobmanager. The event loop only updates the
+        counters and histograms. The gauges are computed from the state of
+        the jobmanager by the metrics server thread when they are scraped.
+        """
+        metrics = self.metrics
+
+        self.requests_metric = metrics.counter(
+            'eventmq_jobmanager_requests', 'REQUESTs received from the router')
+        self.jobs_metric = metrics.counter(
+            'eventmq_jobmanager_jobs',
+            'Jobs run by the workers by result (succeeded, failed or '
+            'retried)', ('result', ))
+        self.job_duration_metric = metrics.histogram(
+            'eventmq_jobmanager_job_duration_seconds',
+            'Time from receiving a job to it finishing', ('result', ))
+
+        self.shared_bodies_metric = metrics.counter(
+            'eventmq_jobmanager_shared_bodies',
+            'Job bodies handed to the worker processes through shared memory')
+        metrics.gauge(
+            'eventmq_jobmanager_jobs_in_flight',
+            'Jobs received that haven\'t finished',
+            func=lambda: len(self.jobs_in_flight))
+        metrics.gauge(
+            'eventmq_jobmanager_workers', 'Running worker processes',
+            func=lambda: len(getattr(self, '_workers', ())))
+        metrics.gauge(
+            'eventmq_jobmanager_pool_size',
+            'Worker processes the pool should have',
+            func=lambda: self.pool_size)
+        metrics.gauge(
+            'eventmq_jobmanager_executor_busy',
+            'Jobs running in each executor other than the worker processes',
+            ('executor', ),
+            func=lambda: {(name, ): executor.busy for name, executor in
+                          list(self.executors.items())})
+        metrics.gauge(
+            'eventmq_jobmanager_retry_queue', 'Failed jobs waiting to retry',
+            func=lambda: len(self.retry_queue))
+        metrics.gauge(
+            'eventmq_jobmanager_dead_letters',
+            'Jobs that ran out of retries kept in memory',
+            func=lambda: len(self.dead_letters))
+        self.timeouts_metric = metrics.counter(
+            'eventmq_jobmanager_timeouts',
+            'Jobs that ran past their timeout. A soft timeout stopped the '
+            'job, a hard timeout replaced its worker', ('kind', ))
+        self.recycled_metric = metrics.counter(
+            'eventmq_jobmanager_recycled_workers',
+            'Worker processes recycled by reason (job_count, rss, rss_growth '
+            'or age)', ('reason', ))
+        metrics.gauge(
+            'eventmq_jobmanager_pid_rss_bytes',
+            'Resident memory of each worker process after its last job',
+            ('pid', ),
+            func=lambda: {(pid, ): rss for pid, rss in
+                          list(self.pid_rss.items())})
+        metrics.gauge(
+            'eventmq_jobmanager_pid_jobs',
+            'Jobs completed by each worker process', ('pid', ),
+            func=lambda: {(pid, ): count for pid, count in
+                          list(self.pid_distribution.items())})
+
+    def record_job_metrics(self, started, result):
+        """
+        Args:
+            started (float): monotonic time the job was received at
+            result (str): ``succeeded``, ``failed`` or ``retried``
+        """
+        self.jobs_metric.inc((result, ))
+        self.job_duration_metric.observe(monotonic() - started, (result, ))
+
+    def record_worker_stats(self, resp):
+        """
+        Record the memory sampled by a worker process after a job, why the
+        process is exiting if one of its recycling policies was hit, and
+        whether the job timed out
+
+        Args:
+            resp (dict): A response from a worker process
+        """
+        pid = resp['pid']
+        if resp.get('rss'):
+            self.pid_rss[pid] = resp['rss']
+
+        timeout = resp.get('timeout')
+        if timeout:
+            kind = 'hard' if timeout['hard'] else 'soft'
+            self.timeouts_metric.inc((kind, ))
+            logger.warning('Job {} timed out after {}s ({} timeout{})'.format(
+                resp['msgid'] or ','.join(job['msgid'] for job in
+                                          resp.get('batch', ())),
+                timeout['seconds'], kind,
+                ', replacing worker {}'.format(pid) if timeout['hard']
+                else ''))
+
+        reason = resp.get('recycle')
+        if reason:
+            self.recycled_workers[reason] = \
+                self.recycled_workers.get(reason, 0) + 1
+            self.recycled_metric.inc((reason, ))
+            logger.info('Recycling worker {} ({}) after {} jobs using '
+                        '{:.1f}MB'.format(
+                            pid, reason, self.pid_distribution.get(pid, 0) + 1,
+                            resp.get('rss', 0) / 1048576.0))
+
     def premature_death(self, reply, msgid):
         """
         Worker died before running any jobs
@@ -320,13 +1091,16 @@ class JobManager(HeartbeatMixin, EMQPService):
     def worker_death(self, reply, msgid, death, pid):
         """
         Worker died of natural causes, ensure its death and
-        remove from tracking, will be replaced on next heartbeat
+        remove from tracking, will be replaced on the next health check
+        (see :meth:`check_due_worker_health`)
         """
         if pid in self._workers.keys():
             del self._workers[pid]
+        self.pid_rss.pop(pid, None)
 
     def worker_ready(self, reply, msgid, death, pid):
-        self.send_ready()
+        unreported_msgids, self.unreported_msgids = self.unreported_msgids, []
+        self.send_ready(*unreported_msgids)
 
     def worker_done_with_reply(self, reply, msgid, death, pid):
         """
@@ -339,23 +1113,62 @@ class JobManager(HeartbeatMixin, EMQPService):
 
         self.send_reply(reply, msgid)
 
-        if self.status != STATUS.stopping and not death:
-            self.send_ready()
+        self.worker_done(reply, msgid, death, pid)
 
     def worker_done(self, reply, msgid, death, pid):
         """
         Worker finished a job, notify broker of an additional slot opening
         """
-        if self.status != STATUS.stopping and not death:
-            self.send_ready()
+        if death:
+            self.unreported_msgids.append(msgid)
+        elif self.status != STATUS.stopping:
+            if self.jobs_in_flight.get(msgid, (None, {}))[1].get(
+                    'holds_slot', True):
+                self.send_ready(msgid)
+            else:
+                # A retry of a job from a batch, whose slot was already
+                # given back
+                self.send_retire(msgid)
+
+    def worker_retry(self, reply, msgid, death, pid):
+        """
+        Worker failed a job that will be retried. The job keeps its slot
+        until it's retried, so the router doesn't send another job for it
+        while the retry waits for a worker.
+        """
+        return
 
-    def send_ready(self):
+    def send_ready(self, *finished_msgids):
         """
         send the READY command upstream to indicate that JobManager is ready
         for another REQUEST message.
+
+        Args:
+            finished_msgids: msgids of the jobs that finished. The broker
+                uses them to track the jobs in flight of each queue.
         """
+        if self.surplus_slots > 0:
+            # The pool shrank, so the slot isn't given back to the router
+            self.surplus_slots -= 1
+            if finished_msgids:
+                self.send_retire(*finished_msgids)
+            return
+
         self.total_ready_sent += 1
-        sendmsg(self.outgoing, 'READY')
+        if finished_msgids:
+            sendmsg(self.outgoing, 'READY', finished_msgids)
+        else:
+            sendmsg(self.outgoing, 'READY')
+
+    def send_retire(self, *finished_msgids):
+        """
+        Send RETIRE to report jobs that finished without giving a slot back
+        to the router
+
+        Args:
+            finished_msgids: msgids of the jobs that finished
+        """
+        sendmsg(self.outgoing, 'RETIRE', finished_msgids)
 
     def send_reply(self, reply, msgid):
         """
@@ -365,17 +1178,45 @@ class JobManager(HeartbeatMixin, EMQPService):
              reply: Message to send as the reply
              msgid: The unique id that we are acknowledging
          """
+        trace('jobmanager.reply', msgid)
         sendmsg(self.outgoing, 'REPLY', [reply, msgid])
 
     def on_heartbeat(self, msgid, message):
         """
-        a placeholder for a noop command. The actual 'logic' for HEARTBEAT is
-        in :meth:`self.process_message` as every message is counted as a
-        HEARTBEAT
+        The actual 'logic' for HEARTBEAT is in :meth:`self.process_message`
+        as every message is counted as a HEARTBEAT. The router sends the
+        number of jobs waiting for this jobmanager's queues with it, which is
+        used by :meth:`autoscale`.
         """
+        if len(message) > 1:
+            try:
+                self.router_backlog = int(message[1])
+            except ValueError:
+                pass
+
         if self.status == STATUS.running:
             self.check_worker_health()
 
+    def check_due_worker_health(self, now=None):
+        """
+        Run :meth:`check_worker_health` every ``conf.HEARTBEAT_INTERVAL``
+        seconds. The router only sends HEARTBEAT to jobmanagers it hasn't
+        sent anything else, so a busy jobmanager can't wait for one to
+        replace its dead workers.
+
+        Args:
+            now (float): monotonic time to check the pool at
+        """
+        if self.status != STATUS.running or not hasattr(self, '_workers'):
+            return
+
+        now = now or monotonic()
+        if now < self._next_health_check:
+            return
+
+        self._next_health_check = now + conf.HEARTBEAT_INTERVAL
+        self.check_worker_health()
+
     def check_worker_health(self):
         """
         Checks for any dead processes in the pool and recreates them if
@@ -391,14 +1232,12 @@ class JobManager(HeartbeatMixin, EMQPService):
         self._workers = {w.pid: w for w in self.workers
                          if w.is_alive()}
 
-        if len(self._workers) < conf.CONCURRENT_JOBS:
+        if len(self._workers) < self.pool_size:
             logger.warning("{} worker process(es) may have died...recreating"
-                           .format(conf.CONCURRENT_JOBS - len(self.workers)))
+                           .format(self.pool_size - len(self.workers)))
 
-        for i in range(0, conf.CONCURRENT_JOBS - len(self.workers)):
-            w = Worker(self.request_queue, self.finished_queue, os.getpid())
-            w.start()
-            self._workers[w.pid] = w
+        for i in range(0, self.pool_size - len(self.workers)):
+            self.start_worker()
 
     def kill_worker(self, pid, signal):
         try:
@@ -413,6 +1252,43 @@ class JobManager(HeartbeatMixin, EMQPService):
         self.outgoing.unbind(conf.WORKER_ADDR)
         super(JobManager, self).on_disconnect(msgid, msg)
 
+    def reset(self):
+        """
+        Take back the jobs no worker has started before the connection is
+        reset. The router the jobs came from may be gone, so they are
+        returned to the one that ACKs the new connection (see
+        :meth:`on_ack`).
+        """
+        self.held_jobs.extend(self.take_queued_jobs())
+        self.resuming = True
+        # The new connection starts without slots on the router
+        self.surplus_slots = 0
+
+        super(JobManager, self).reset()
+
+    def on_ack(self, msgid, ackd_msgid):
+        """
+        After a reset, return the jobs that were taken back and tell the
+        router about the slots that are free. The jobs still running report
+        their slots with READY when they finish.
+        """
+        super(JobManager, self).on_ack(msgid, ackd_msgid)
+
+        if not self.resuming:
+            return
+        self.resuming = False
+
+        held_jobs, self.held_jobs = self.held_jobs, []
+        self.return_jobs(held_jobs)
+
+        # Workers that haven't started yet send READY when they do
+        workers = min(len(getattr(self, '_workers', ())), self.pool_size)
+        free_slots = max(0, workers - self.busy_slots) + \
+            sum(max(0, executor.size - executor.busy)
+                for executor in self.executors.values())
+        for _ in range(free_slots):
+            self.send_ready()
+
     def on_kbye(self, msgid, msg):
         if not self.is_heartbeat_enabled:
             self.reset()
@@ -426,12 +1302,26 @@ class JobManager(HeartbeatMixin, EMQPService):
         self.received_disconnect = True
 
     def sigterm_handler(self, signum, frame):
-        if not self.received_disconnect:
-            logger.info('Shutting down..')
-            sendmsg(self.outgoing, KBYE)
+        """
+        Ask the event loop to shut down. The handler may interrupt the loop
+        while it's sending a message or handling a response, so it only sets
+        flags and :meth:`shutdown` does the work from the loop.
+        """
+        self.shutdown_requested = True
+        # Stop waiting for the router's ACK so the loop runs
+        self.awaiting_startup_ack = False
 
-            self.awaiting_startup_ack = False
-            self.received_disconnect = True
+    def shutdown(self):
+        """
+        Shut down after SIGTERM. Only the jobs that are running finish here.
+        The router drops messages from a worker after its KBYE, so the rest
+        are returned first.
+        """
+        logger.info('Shutting down..')
+        self.return_jobs(self.take_queued_jobs())
+        sendmsg(self.outgoing, KBYE)
+
+        self.received_disconnect = True
 
     def jobmanager_main(self, broker_addr=None):
         """
@@ -442,6 +1332,7 @@ class JobManager(HeartbeatMixin, EMQPService):
         """
         import_settings()
         import_settings(section='jobmanager')
+        logging.getLogger('eventmq').setLevel(log_level())
 
         # If this manager was passed explicit options, favor those
         if self.queues:
@@ -450,6 +1341,9 @@ class JobManager(HeartbeatMixin, EMQPService):
         if broker_addr:
             conf.WORKER_ADDR = broker_addr
 
+        if conf.DEAD_LETTER_LOG:
+            setup_wal_logger('eventmq-dead-letter', conf.DEAD_LETTER_LOG)
+
         self.start(addr=conf.WORKER_ADDR, queues=conf.QUEUES)
 
 
@@ -17,14 +17,25 @@ log module for eventmq
 
 this needs so much work.
 """
+import atexit
+import copy
 import errno
 import logging
 import os
+import sys
+from threading import Lock, Thread
 import time
 
 import zmq
 import zmq.log.handlers
 
+from . import conf
+
+if sys.version[0] == '2':
+    import Queue
+else:
+    import queue as Queue
+
 
 FORMAT_STANDARD = logging.Formatter(
     '%(asctime)s - %(name)s  %(levelname)s - %(message)s',
@@ -40,6 +51,149 @@ class PUBHandler(zmq.log.handlers.PUBHandler):
     pass
 
 
+class QueueListener(Thread):
+    """
+    Passes the records queued by :class:`QueueHandler` to their handlers in a
+    background thread, so slow log I/O doesn't block the event loops.
+    """
+    def __init__(self, maxsize=None):
+        """
+        Args:
+            maxsize (int): Max number of records waiting to be handled.
+                Default: ``conf.LOG_QUEUE_SIZE``
+        """
+        super(QueueListener, self).__init__(name='eventmq-log')
+        self.daemon = True
+        self.queue = Queue.Queue(maxsize or conf.LOG_QUEUE_SIZE)
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+
+            handler, record = item
+            try:
+                handler.handle(record)
+            except Exception:
+                handler.handleError(record)
+
+    def stop(self, timeout=5):
+        """
+        Handle the records that are queued and stop the thread
+        """
+        self.queue.put(None)
+        self.join(timeout)
+
+
+#: The listener shared by every :class:`QueueHandler` of the process. Started
+#: by the first one.
+_listener = None
+# Held while a handler gets a new lock in a forked process
+_fork_lock = Lock()
+
+
+def get_listener():
+    """
+    Returns:
+        QueueListener: The running listener of this process
+    """
+    global _listener
+
+    if _listener is None:
+        _listener = QueueListener()
+        _listener.start()
+        atexit.register(_listener.stop)
+
+    return _listener
+
+
+class QueueHandler(logging.Handler):
+    """
+    Queues records for `handler` to handle in the :class:`QueueListener`
+    thread. Records are dropped (and counted in :attr:`dropped`) instead of
+    blocking if the queue is full. The message of a record is formatted
+    before it's queued, so the arguments it was logged with can change
+    afterwards.
+
+    The listener thread doesn't exist in processes forked after it was
+    started (e.g. the jobmanager's workers), so they handle their records
+    directly.
+    """
+    def __init__(self, handler):
+        """
+        Args:
+            handler (logging.Handler): The handler that writes the records
+        """
+        super(QueueHandler, self).__init__()
+        self.handler = handler
+        self.pid = os.getpid()
+        self.listener = get_listener()
+
+        #: Number of records dropped because the queue was full
+        self.dropped = 0
+        # The forked process `handler` got a new lock in
+        self._forked_pid = None
+
+    def setFormatter(self, fmt):
+        self.handler.setFormatter(fmt)
+
+    def prepare(self, record):
+        """
+        Returns:
+            logging.LogRecord: A copy of `record` with its message (and
+                traceback) formatted, and without the arguments and exception
+                that were logged
+        """
+        msg = self.format(record)
+        record = copy.copy(record)
+        record.message = msg
+        record.msg = msg
+        record.args = None
+        record.exc_info = None
+        record.exc_text = None
+        return record
+
+    def emit(self, record):
+        if os.getpid() != self.pid:
+            self.handle_forked(record)
+            return
+
+        try:
+            self.listener.queue.put_nowait(
+                (self.handler, self.prepare(record)))
+        except Queue.Full:
+            self.dropped += 1
+
+    def handle_forked(self, record):
+        """
+        Handle `record` directly in a process forked after the listener was
+        started. The listener thread may have held the lock of `handler` at
+        the fork, and it would never be released in this process, so the
+        handler gets a new lock first.
+        """
+        pid = os.getpid()
+        if self._forked_pid != pid:
+            with _fork_lock:
+                if self._forked_pid != pid:
+                    self.handler.createLock()
+                    self._forked_pid = pid
+
+        self.handler.handle(record)
+
+
+def log_level():
+    """
+    Returns:
+        The level to log at according to the settings. ``super_debug``
+        implies DEBUG.
+    """
+    if conf.SUPER_DEBUG:
+        return logging.DEBUG
+
+    return conf.LOG_LEVEL
+
+
 class handlers(object):
     """
     log handlers
@@ -53,10 +207,18 @@ class handlers(object):
 
 
 def setup_logger(base_name, formatter=FORMAT_STANDARD,
-                 handler=handlers.STREAM_HANDLER):
-
+                 handler=handlers.STREAM_HANDLER, level=None, queued=None):
+    """
+    Args:
+        base_name (str): Name of the logger to set up
+        formatter (logging.Formatter): Format of the log lines
+        handler: One of :class:`handlers`
+        level: Level to log at. Default: :func:`log_level`
+        queued (bool): Write the logs from a background thread (see
+            :class:`QueueHandler`). Default: ``conf.LOG_QUEUE``
+    """
     logger = logging.getLogger(base_name)
-    logger.setLevel(logging.DEBUG)
+    logger.setLevel(level if level is not None else log_level())
 
     # remove handlers we don't want
     # for h in logger.handlers:
@@ -76,6 +238,9 @@ def setup_logger(base_name, formatter=FORMAT_STANDARD,
 
     handler.setFormatter(formatter)
 
+    if queued if queued is not None else conf.LOG_QUEUE:
+        handler = QueueHandler(handler)
+
     logger.addHandler(handler)
 
     return logger
@@ -0,0 +1,314 @@
+# This file is part of eventmq.
+#
+# eventmq is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 2.1 of the License, or (at your option)
+# any later version.
+#
+# eventmq is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with eventmq.  If not, see <http://www.gnu.org/licenses/>.
+"""
+:mod:`metrics` -- Metrics
+=========================
+Counters, gauges and histograms for the router, jobmanager and scheduler,
+served as OpenMetrics text over HTTP (see the ``metrics_port`` setting) for
+Prometheus to scrape.
+
+Metrics are only updated from the event loop of the device so the updates
+don't need locks. The HTTP server runs in its own thread and only reads
+them. Gauges that can be derived from the state of the device (e.g. the
+number of waiting messages) are computed when they are scraped so the event
+loop doesn't pay for them.
+"""
+import bisect
+import logging
+import sys
+from threading import Thread
+
+if sys.version[0] == '2':
+    import BaseHTTPServer as http_server
+else:
+    import http.server as http_server
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+
+#: Default buckets for histograms of durations in seconds
+DEFAULT_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60,
+                   300)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"') \
+        .replace('\n', '\\n')
+
+
+def _format_labels(labelnames, labelvalues, extra=()):
+    pairs = list(zip(labelnames, labelvalues)) + list(extra)
+    if not pairs:
+        return ''
+
+    return '{' + ','.join('{}="{}"'.format(name, _escape(value))
+                          for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        if value == float('inf'):
+            return '+Inf'
+        return repr(value)
+    return str(value)
+
+
+class Metric(object):
+    """
+    Base class for metrics. Values are kept per tuple of label values.
+    """
+    TYPE = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        """
+        Args:
+            name (str): Name of the metric family, e.g.
+                ``eventmq_router_requests``
+            documentation (str): Help text for the metric
+            labelnames (tuple): Names of the labels of the metric
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+        #: Key: tuple of label values, Value: the value of the metric
+        self.values = {}
+
+    def samples(self):
+        """
+        Returns:
+            list: (sample name suffix, label values, extra labels, value) of
+                each sample
+        """
+        raise NotImplementedError()
+
+    def render(self):
+        """
+        Returns:
+            list: Lines of OpenMetrics text for this metric
+        """
+        lines = ['# HELP {} {}'.format(self.name, self.documentation),
+                 '# TYPE {} {}'.format(self.name, self.TYPE)]
+
+        for suffix, labelvalues, extra, value in self.samples():
+            lines.append('{}{}{} {}'.format(
+                self.name, suffix,
+                _format_labels(self.labelnames, labelvalues, extra),
+                _format_value(value)))
+
+        return lines
+
+
+class Counter(Metric):
+    """
+    A value that only goes up, e.g. the number of requests received
+    """
+    TYPE = 'counter'
+
+    def inc(self, labelvalues=(), amount=1):
+        """
+        Args:
+            labelvalues (tuple): Values for the labels of the metric
+            amount (int): Amount to add
+        """
+        self.values[labelvalues] = self.values.get(labelvalues, 0) + amount
+
+    def samples(self):
+        # Copying the items is atomic, so the event loop can add label values
+        # while this is scraped
+        return [('_total', labelvalues, (), value)
+                for labelvalues, value in sorted(list(self.values.items()))]
+
+
+class Gauge(Metric):
+    """
+    A value that can go up and down. If `func` is given it's called when the
+    metric is scraped to get the current values.
+    """
+    TYPE = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), func=None):
+        """
+        Args:
+            func (callable): Returns the value of the gauge, or a dict of
+                values by tuple of label values if the gauge has labels
+        """
+        super(Gauge, self).__init__(name, documentation, labelnames)
+        self.func = func
+
+    def set(self, value, labelvalues=()):
+        self.values[labelvalues] = value
+
+    def inc(self, labelvalues=(), amount=1):
+        self.values[labelvalues] = self.values.get(labelvalues, 0) + amount
+
+    def dec(self, labelvalues=(), amount=1):
+        self.inc(labelvalues, -amount)
+
+    def samples(self):
+        if self.func is None:
+            values = list(self.values.items())
+        else:
+            try:
+                values = self.func()
+            except Exception:
+                logger.exception('Unable to collect {}'.format(self.name))
+                return []
+
+            values = list(values.items()) if isinstance(values, dict) \
+                else [((), values)]
+
+        return [('', labelvalues, (), value)
+                for labelvalues, value in sorted(values)]
+
+
+class Histogram(Metric):
+    """
+    Counts observations (e.g. job durations) in buckets
+    """
+    TYPE = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(),
+                 buckets=DEFAULT_BUCKETS):
+        """
+        Args:
+            buckets (tuple): The upper bounds of the buckets
+        """
+        super(Histogram, self).__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, labelvalues=()):
+        """
+        Args:
+            value (float): The observed value
+            labelvalues (tuple): Values for the labels of the metric
+        """
+        try:
+            counts = self.values[labelvalues]
+        except KeyError:
+            # One count per bucket, then +Inf, count and sum
+            counts = self.values[labelvalues] = \
+                [0] * (len(self.buckets) + 1) + [0, 0]
+
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        counts[-2] += 1
+        counts[-1] += value
+
+    def samples(self):
+        samples = []
+        for labelvalues, counts in sorted(list(self.values.items())):
+            counts = list(counts)
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'), ),
+                                    counts[:-2]):
+                cumulative += count
+                samples.append(('_bucket', labelvalues,
+                                (('le', _format_value(float(bound))), ),
+                                cumulative))
+            samples.append(('_count', labelvalues, (), counts[-2]))
+            samples.append(('_sum', labelvalues, (), counts[-1]))
+
+        return samples
+
+
+class MetricsRegistry(object):
+    """
+    The metrics of a device
+    """
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=(), func=None):
+        return self.register(Gauge(name, documentation, labelnames, func))
+
+    def histogram(self, name, documentation, labelnames=(),
+                  buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames,
+                                       buckets))
+
+    def render(self):
+        """
+        Returns:
+            str: All of the metrics as OpenMetrics text
+        """
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        lines.append('# EOF')
+
+        return '\n'.join(lines) + '\n'
+
+
+class MetricsServer(Thread):
+    """
+    Serves the metrics of a registry over HTTP in a daemon thread
+    """
+    def __init__(self, registry, port, host='127.0.0.1'):
+        """
+        Args:
+            registry (MetricsRegistry): The metrics to serve
+            port (int): Port to listen on
+            host (str): Address to listen on
+        """
+        super(MetricsServer, self).__init__(name='eventmq-metrics')
+        self.daemon = True
+
+        class Handler(http_server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = registry.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logger.debug(format % args)
+
+        self.httpd = http_server.HTTPServer((host, port), Handler)
+
+    def run(self):
+        self.httpd.serve_forever()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def start_metrics_server(registry, port, host='127.0.0.1'):
+    """
+    Start serving `registry` on `host`:`port`
+
+    Returns:
+        MetricsServer: The server, or None if it couldn't listen on the port
+    """
+    try:
+        server = MetricsServer(registry, port, host=host)
+    except (IOError, OSError) as e:
+        logger.error('Unable to serve metrics on {}:{}: {}'.format(
+            host, port, e))
+        return None
+
+    server.start()
+    logger.info('Serving metrics on http://{}:{}/'.format(host, port))
+    return server
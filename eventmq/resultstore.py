@@ -0,0 +1,269 @@
+# This file is part of eventmq.
+#
+# eventmq is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 2.1 of the License, or (at your option)
+# any later version.
+#
+# eventmq is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with eventmq.  If not, see <http://www.gnu.org/licenses/>.
+"""
+:mod:`resultstore` -- Result Stores
+===================================
+Stores the return values of jobs that were run with the ``reply-requested``
+header so clients can fetch them later with the RESULT command.
+"""
+from collections import OrderedDict
+import errno
+import logging
+import os
+
+from . import conf
+from .utils.timeutils import monotonic, timestamp
+
+logger = logging.getLogger(__name__)
+
+
+class BaseResultStore(object):
+    """
+    Interface for result stores. Results are the serialized REPLY values sent
+    by the JobManager and are keyed by the msgid of the REQUEST.
+    """
+    def __init__(self, ttl=None):
+        """
+        Args:
+            ttl (int): Number of seconds to keep a result. Default:
+                ``conf.RESULT_TTL``
+        """
+        self.ttl = ttl if ttl is not None else conf.RESULT_TTL
+
+    def set(self, msgid, value):
+        """
+        Store `value` as the result of the REQUEST `msgid`
+        """
+        raise NotImplementedError()
+
+    def get(self, msgid):
+        """
+        Returns:
+            str: The stored result for `msgid` or None if there isn't one or
+                it has expired
+        """
+        raise NotImplementedError()
+
+
+class MemoryResultStore(BaseResultStore):
+    """
+    Keeps results in memory of the router. The least recently used results
+    are evicted when there are more than ``max_entries``.
+    """
+    def __init__(self, ttl=None, max_entries=None):
+        """
+        Args:
+            ttl (int): Number of seconds to keep a result
+            max_entries (int): Max number of results to keep. Default:
+                ``conf.RESULT_MAX_ENTRIES``
+        """
+        super(MemoryResultStore, self).__init__(ttl=ttl)
+        self.max_entries = max_entries or conf.RESULT_MAX_ENTRIES
+
+        #: Key: msgid, Value: (monotonic expire time, value)
+        self._results = OrderedDict()
+
+    def __len__(self):
+        return len(self._results)
+
+    def set(self, msgid, value):
+        if msgid in self._results:
+            del self._results[msgid]
+
+        self._results[msgid] = (monotonic() + self.ttl, value)
+
+        while len(self._results) > self.max_entries:
+            self._results.popitem(last=False)
+
+    def get(self, msgid):
+        try:
+            expires_at, value = self._results.pop(msgid)
+        except KeyError:
+            return None
+
+        if expires_at <= monotonic():
+            return None
+
+        # Re-insert to mark it as the most recently used
+        self._results[msgid] = (expires_at, value)
+        return value
+
+
+class RedisResultStore(BaseResultStore):
+    """
+    Keeps results in redis using the ``rq_*`` settings. Redis expires the
+    results.
+
+    Redis is called from the router's event loop, so a slow redis server
+    delays every message the router handles.
+    """
+    KEY_PREFIX = 'eventmq-result:'
+
+    def __init__(self, ttl=None):
+        super(RedisResultStore, self).__init__(ttl=ttl)
+        import redis
+
+        self.redis_server = redis.StrictRedis(host=conf.RQ_HOST,
+                                              port=conf.RQ_PORT,
+                                              db=conf.RQ_DB,
+                                              password=conf.RQ_PASSWORD)
+
+    def set(self, msgid, value):
+        try:
+            self.redis_server.setex(self.KEY_PREFIX + msgid, self.ttl, value)
+        except Exception as e:
+            logger.warning('Unable to store result for {} in redis: {}'.format(
+                msgid, e))
+
+    def get(self, msgid):
+        try:
+            return self.redis_server.get(self.KEY_PREFIX + msgid)
+        except Exception as e:
+            logger.warning('Unable to read result for {} from redis: '
+                           '{}'.format(msgid, e))
+
+
+class FileResultStore(BaseResultStore):
+    """
+    Keeps one file per result in ``conf.RESULT_FILE_PATH``. Expired results
+    are removed when results are stored, as are the oldest results when
+    there are more than ``max_entries``, so results nobody reads don't pile
+    up.
+
+    The files are read and written on the router's event loop, so a slow
+    disk delays every message the router handles.
+    """
+    def __init__(self, ttl=None, path=None, max_entries=None):
+        """
+        Args:
+            ttl (int): Number of seconds to keep a result
+            path (str): Directory to write the results to. Default:
+                ``conf.RESULT_FILE_PATH``
+            max_entries (int): Max number of results to keep. Default:
+                ``conf.RESULT_MAX_ENTRIES``
+        """
+        super(FileResultStore, self).__init__(ttl=ttl)
+        self.path = path or conf.RESULT_FILE_PATH
+        self.max_entries = max_entries or conf.RESULT_MAX_ENTRIES
+
+        #: Key: file name, Value: unix time the result expires at. Oldest
+        #: first, so the results to remove are at the front.
+        self._expires = OrderedDict()
+
+        try:
+            os.makedirs(self.path)
+        except OSError as e:  # Guard against race condition
+            if e.errno != errno.EEXIST:
+                raise
+
+        # Pick up the results left by an earlier run so they're removed too
+        stored = []
+        for name in os.listdir(self.path):
+            try:
+                stored.append((os.path.getmtime(self._filename(name)), name))
+            except OSError:
+                pass
+        for mtime, name in sorted(stored):
+            self._expires[name] = mtime + self.ttl
+        self.sweep()
+
+    def __len__(self):
+        return len(self._expires)
+
+    def _filename(self, msgid):
+        # msgids are used as file names so don't allow them to walk the fs
+        return os.path.join(self.path, os.path.basename(msgid))
+
+    def _remove(self, msgid):
+        self._expires.pop(os.path.basename(msgid), None)
+        try:
+            os.remove(self._filename(msgid))
+        except OSError:
+            pass
+
+    def set(self, msgid, value):
+        try:
+            with open(self._filename(msgid), 'w') as f:
+                f.write(value)
+        except (IOError, OSError) as e:
+            logger.warning('Unable to store result for {}: {}'.format(
+                msgid, e))
+            return
+
+        name = os.path.basename(msgid)
+        self._expires.pop(name, None)
+        self._expires[name] = timestamp() + self.ttl
+        self.sweep()
+
+    def get(self, msgid):
+        filename = self._filename(msgid)
+        try:
+            if os.path.getmtime(filename) + self.ttl <= timestamp():
+                self._remove(msgid)
+                return None
+
+            with open(filename) as f:
+                return f.read()
+        except (IOError, OSError):
+            return None
+
+    def sweep(self, now=None):
+        """
+        Remove the expired results, and the oldest results while there are
+        more than :attr:`max_entries`. Only the results removed are touched.
+
+        Args:
+            now (float): unix time to check the results at
+        """
+        now = now or timestamp()
+        while self._expires:
+            name, expires_at = next(iter(self._expires.items()))
+            if expires_at > now and len(self._expires) <= self.max_entries:
+                break
+            self._remove(name)
+
+
+#: Result stores by the value of the ``result_backend`` setting
+RESULT_STORES = {
+    'memory': MemoryResultStore,
+    'redis': RedisResultStore,
+    'file': FileResultStore,
+}
+
+
+def get_result_store(backend=None):
+    """
+    Build the result store for `backend`
+
+    Args:
+        backend (str): One of the keys of :attr:`RESULT_STORES`. Default:
+            ``conf.RESULT_BACKEND``
+
+    Returns:
+        BaseResultStore: The result store, or None if results shouldn't be
+            stored
+    """
+    if backend is None:
+        backend = conf.RESULT_BACKEND
+
+    if not backend:
+        return None
+
+    if backend not in RESULT_STORES:
+        logger.error('Unknown result backend {}. Results will not be '
+                     'stored.'.format(backend))
+        return None
+
+    return RESULT_STORES[backend]()
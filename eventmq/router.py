@@ -18,6 +18,8 @@
 Routes messages to workers (that are in named queues).
 """
 from copy import copy
+import heapq
+import itertools
 import json  # deserialize queues in on_inform. should be refactored
 import logging
 import signal
@@ -28,9 +30,16 @@ from .constants import (
     CLIENT_TYPE, DISCONNECT, KBYE, PROTOCOL_VERSION, ROUTER_SHOW_SCHEDULERS,
     ROUTER_SHOW_WORKERS, STATUS
 )
+from .metrics import MetricsRegistry, start_metrics_server
+from .resultstore import get_result_store
+from .tracing import setup_tracing, trace
 from .utils import tuplify
-from .utils.classes import EMQdeque, HeartbeatMixin
+from .utils.classes import (
+    DeliveryTracker, EMQdeque, HeartbeatMixin, LivenessTracker, TokenBucket
+)
 from .utils.devices import generate_device_name
+from .utils.functions import arguments_hash, max_retry_backoff
+from .utils.headers import parse_headers
 from .utils.messages import (
     fwd_emqp_router_message as fwdmsg,
     parse_router_message,
@@ -85,12 +94,19 @@ class Router(HeartbeatMixin):
         #: **Keys**
         #:  * ``queues``: list() of queue names and prioritiess the worker
         #:    belongs to. e.g. (10, 'default')
-        #:  * ``hb``: monotonic timestamp of the last received message from
-        #:    worker
         #:  * ``available_slots``: int count of jobs this manager can still
         #:    process.
         self.workers = {}
 
+        #: When each worker was last heard from and sent a message. Used to
+        #: find dead workers and workers that are due a HEARTBEAT.
+        self.worker_liveness = LivenessTracker()
+
+        #: Jobs sent with the ``guarantee`` header that haven't finished.
+        #: They are sent again if their worker goes away or they run past
+        #: their visibility timeout.
+        self.deliveries = DeliveryTracker()
+
         #: Message buffer. When messages can't be sent because there are no
         #: workers available to take the job
         self.waiting_messages = {}
@@ -123,6 +139,68 @@ class Router(HeartbeatMixin):
         #: Value: (timestamp, queue_name)
         self.job_latencies = {}
 
+        #: Index of accepted REQUESTs that asked to be deduplicated with the
+        #: ``debounce:N`` or ``dedupe-key:K`` headers.
+        #: Key: queue name and dedupe key (or hash of the job)
+        #: Value: (msgid, monotonic time the entry expires). The expire time
+        #:     is None when the entry lives until the REQUEST is sent to a
+        #:     worker
+        self.dedupe_index = {}
+
+        #: Heap of (expire time, key) used to expire ``dedupe_index`` entries
+        #: without scanning the whole index
+        self._dedupe_expiry = []
+
+        #: REQUESTs sent with the ``eta:<ts>`` or ``delay:<secs>`` headers that
+        #: aren't due yet. Heap of (monotonic due time, sequence #, sender,
+        #: msgid, msg). Due REQUESTs are handled like new ones, so they are
+        #: sent to a worker or buffered in :attr:`waiting_messages`.
+        self.delayed_messages = []
+        # Breaks ties in `delayed_messages` so messages are never compared
+        self._delayed_seq = itertools.count()
+
+        #: Deficit round robin state used to share the slots of a worker
+        #: between its queues by weight (see ``conf.QUEUE_FAIR_SHARE``)
+        #: Key: worker id
+        #: Value: [index of the queue being served, {queue name: deficit},
+        #:     list of quantums in the same order as the worker's queues]
+        self.fair_share = {}
+
+        #: Rate limiters of the queues in ``conf.QUEUE_RATE_LIMITS``. Built in
+        #: :meth:`start` once the settings are loaded.
+        #: Key: queue name, Value: :class:`TokenBucket`
+        self.queue_rate_limiters = {}
+
+        #: Number of jobs running for queues in ``conf.QUEUE_MAX_IN_FLIGHT``
+        #: Key: queue name, Value: # of jobs sent to workers and not READY yet
+        self.queue_in_flight = {}
+
+        #: Jobs of the queues in ``conf.QUEUE_MAX_IN_FLIGHT`` that are running
+        #: Key: msgid, Value: (queue name, worker id)
+        self.in_flight_jobs = {}
+
+        #: Names of queues with waiting messages that were held back by the
+        #: queue limits. They are retried from the event loop.
+        self.limited_queues = set()
+
+        #: Clients waiting for the result of a REQUEST sent with the
+        #: ``reply-requested`` header. Entries are removed when the job
+        #: finishes or is lost with its worker.
+        #: Key: msgid of the REQUEST
+        #: Value: [id of the client that sent it, id of the worker running
+        #: the job or None while it waits]
+        self.reply_recipients = {}
+
+        #: Where the results of ``reply-requested`` REQUESTs are kept for
+        #: clients to fetch with the RESULT command. Built in :meth:`start`
+        #: once the settings are loaded. None if results aren't stored.
+        self.result_store = None
+
+        #: Counters, gauges and histograms served on ``conf.METRICS_PORT``
+        self.metrics = MetricsRegistry()
+        self.setup_metrics()
+        self.metrics_server = None
+
         #: Excecuted function tracking dictionary
         #: Key: msgid of msg each REQUEST received and forwarded to a worker
         #: Value: (function_name, queue_name)
@@ -153,6 +231,14 @@ class Router(HeartbeatMixin):
         """
         self.status = STATUS.starting
 
+        self.result_store = get_result_store()
+        self.setup_queue_limits()
+        setup_tracing(device=self.name)
+
+        if conf.METRICS_PORT and self.metrics_server is None:
+            self.metrics_server = start_metrics_server(
+                self.metrics, conf.METRICS_PORT, host=conf.METRICS_HOST)
+
         self.incoming.listen(frontend_addr)
         self.outgoing.listen(backend_addr)
         self.administrative_socket.listen(administrative_addr)
@@ -175,6 +261,15 @@ class Router(HeartbeatMixin):
             now = monotonic()
             events = self.poller.poll()
 
+            if self.delayed_messages and self.delayed_messages[0][0] <= now:
+                self.release_delayed_messages(now)
+
+            if self.deliveries.jobs:
+                self.redeliver(self.deliveries.expired(now))
+
+            if self.limited_queues:
+                self.dispatch_limited_queues()
+
             if events.get(self.incoming) == poller.POLLIN:
                 msg = self.incoming.recv_multipart()
                 self.handle_wal_log(msg)
@@ -210,15 +305,9 @@ class Router(HeartbeatMixin):
             # TODO: Optimization: the calls to functions could be done in
             #     another thread so they don't block the loop. synchronize
             if not conf.DISABLE_HEARTBEATS:
-                # Send a HEARTBEAT if necessary
-                if now - self._meta['last_sent_heartbeat'] >= \
-                   conf.HEARTBEAT_INTERVAL:
-                    self.send_workers_heartbeats()
-
-                if now - self._meta['last_worker_cleanup'] >= 10:
-                    # Loop through the next worker queue and clean up any dead
-                    # ones so the next one is alive
-                    self.clean_up_dead_workers()
+                # Both only look at the workers whose deadline has passed
+                self.send_workers_heartbeats(now)
+                self.clean_up_dead_workers(now)
 
                 if now - self._meta['last_sent_scheduler_heartbeat'] >= \
                    conf.HEARTBEAT_INTERVAL:
@@ -248,9 +337,10 @@ class Router(HeartbeatMixin):
         Returns:
             msgid: The ID of the ACK message
         """
-        logger.info('Sending ACK to %s' % recipient)
-        logger.info('Queue information %s' % self.queues)
-        logger.info('Worker information %s' % self.workers)
+        logger.info('Sending ACK to %s', recipient)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('Queue information %s', self.queues)
+            logger.debug('Worker information %s', self.workers)
         msgid = sendmsg(socket, recipient, 'ACK', msgid)
 
         return msgid
@@ -260,7 +350,7 @@ class Router(HeartbeatMixin):
         msg_id = sendmsg(socket, recipient, KBYE)
         return msg_id
 
-    def send_heartbeat(self, socket, recipient):
+    def send_heartbeat(self, socket, recipient, backlog=None):
         """
         Custom send heartbeat method to take into account the recipient that is
         needed when building messages
@@ -268,22 +358,49 @@ class Router(HeartbeatMixin):
         Args:
             socket (socket): the socket to send the heartbeat with
             recipient (str): Worker I
+            backlog (int): Number of jobs waiting for the worker's queues.
+                Sent to workers so they can grow their pool.
 
         Returns:
             msgid: The ID of the HEARTBEAT message
         """
-        msgid = sendmsg(socket, recipient, 'HEARTBEAT', str(timestamp()))
+        if backlog is None:
+            msg = str(timestamp())
+        else:
+            msg = [str(timestamp()), str(backlog)]
+
+        msgid = sendmsg(socket, recipient, 'HEARTBEAT', msg)
 
         return msgid
 
-    def send_workers_heartbeats(self):
+    def send_workers_heartbeats(self, now=None):
         """
-        Send HEARTBEATs to all registered workers.
+        Send HEARTBEATs to the workers that haven't been sent a message in
+        ``conf.HEARTBEAT_INTERVAL``. Workers treat any message as a
+        HEARTBEAT, so busy workers don't need one.
+
+        Args:
+            now (float): monotonic time to check the workers at
         """
-        self._meta['last_sent_heartbeat'] = monotonic()
+        now = now or monotonic()
 
-        for worker_id in self.workers:
-            self.send_heartbeat(self.outgoing, worker_id)
+        for worker_id in self.worker_liveness.due_heartbeats(now):
+            self._meta['last_sent_heartbeat'] = now
+            self.send_heartbeat(self.outgoing, worker_id,
+                                backlog=self.worker_backlog(worker_id))
+
+    def worker_backlog(self, worker_id):
+        """
+        Returns:
+            int: Number of jobs waiting for the queues of `worker_id`
+        """
+        worker = self.workers.get(worker_id)
+        if not worker:
+            return 0
+
+        return sum(len(self.waiting_messages[queue[1]])
+                   for queue in worker['queues']
+                   if queue[1] in self.waiting_messages)
 
     def send_schedulers_heartbeats(self):
         """
@@ -335,23 +452,207 @@ class Router(HeartbeatMixin):
     def on_reply(self, sender, msgid, msg):
         """
         Handles an REPLY message. Replies are sent by the worker for latanecy
-        measurements
+        measurements and carry the return value of ``reply-requested`` jobs.
+        The return value is saved in :attr:`result_store` and sent back to the
+        client that sent the REQUEST.
         """
 
         orig_msgid = msg[1]
+        reply = msg[0]
+
+        if orig_msgid in self.reply_recipients:
+            client_id = self.reply_recipients.pop(orig_msgid)[0]
+
+            if self.result_store is not None:
+                self.result_store.set(orig_msgid, reply)
+
+            try:
+                sendmsg(self.incoming, client_id, 'REPLY',
+                        (orig_msgid, reply))
+            except exceptions.PeerGoneAwayError:
+                logger.debug('Client {} has gone away. The result of {} can '
+                             'still be fetched with RESULT.'.format(
+                                 client_id, orig_msgid))
         if conf.SUPER_DEBUG:
             logger.debug('Received REPLY from {} (msgid: {}, ACK msgid: {})'.
                          format(sender, msgid, orig_msgid))
 
-        if orig_msgid in self.job_latencies:
-            elapsed_secs = (monotonic()
-                            - self.job_latencies[orig_msgid][0]) * 1000.0
-            logger.info("Completed {queue} job with msgid: {msgid} in "
-                        "{time:.2f}ms".format(
-                            queue=self.job_latencies[orig_msgid][1],
-                            msgid=orig_msgid,
-                            time=elapsed_secs))
-            del self.job_latencies[orig_msgid]
+        queue_name = self.job_latencies.get(orig_msgid, (None, None))[1]
+        elapsed_secs = self.job_finished(orig_msgid)
+        if elapsed_secs is not None:
+            logger.info("Completed %s job with msgid: %s in %.2fms",
+                        queue_name, orig_msgid, elapsed_secs * 1000.0)
+
+    def on_return(self, sender, msgid, msg):
+        """
+        Handles a RETURN message. A worker that is shutting down or
+        reconnecting returns the jobs it received but hasn't started. They
+        are put at the head of their queue's waiting messages so they are the
+        next to run.
+
+        Args:
+            sender (str): The id of the worker returning the job
+            msgid (str): Unique identifier for this message
+            msg: The msgid of the returned REQUEST followed by its queue
+                name, headers and body
+        """
+        if len(msg) < 4:
+            logger.error('Invalid RETURN from {}: {}'.format(sender, msg))
+            return
+
+        returned_msgid = msg[0]
+        queue_name = msg[1]
+
+        self.remove_in_flight(returned_msgid)
+        self.deliveries.remove(returned_msgid)
+        self.track_reply(returned_msgid, None)
+        trace('router.return', returned_msgid, queue=queue_name)
+        self.returned_metric.inc((queue_name, ))
+
+        self.buffer_message(queue_name, returned_msgid, list(msg[1:4]),
+                            head=True)
+        # Send it as soon as a worker has a free slot
+        self.limited_queues.add(queue_name)
+
+    def track_delivery(self, msgid, queue_name, worker_id, msg):
+        """
+        Keep a job sent with the ``guarantee`` header in :attr:`deliveries`
+        until it finishes. The job may run for ``conf.VISIBILITY_TIMEOUT``
+        seconds plus its ``timeout`` (or ``conf.GLOBAL_TIMEOUT``) for each
+        attempt and the longest backoff before each retry, before it's sent
+        again.
+
+        Args:
+            msgid (str): The msgid of the REQUEST
+            queue_name (str): The queue of the job
+            worker_id (str): The worker the job was sent to
+            msg: The REQUEST frames (queue name, headers, body)
+        """
+        if len(msg) < 2:
+            return
+
+        headers = parse_headers(msg[1])
+        if not headers.guarantee:
+            return
+
+        retries = headers.retry_count or 0
+        timeout = conf.VISIBILITY_TIMEOUT + \
+            (headers.timeout or conf.GLOBAL_TIMEOUT) * (retries + 1) + \
+            max_retry_backoff(retries)
+        self.deliveries.add(msgid, worker_id, queue_name, list(msg),
+                            timeout=timeout)
+
+    def redeliver(self, jobs):
+        """
+        Put jobs that were sent to a worker but may not have run at the head
+        of their queues to send them again
+
+        Args:
+            jobs (list): (queue name, msgid, REQUEST frames) of each job, in
+                the order they were sent
+        """
+        # Each job is put at the head of its queue, so the last one goes
+        # first to keep them in order
+        for queue_name, msgid, msg in reversed(jobs):
+            logger.warning('Job %s was not reported finished. Sending it '
+                           'again.', msgid)
+            self.remove_in_flight(msgid)
+            self.track_reply(msgid, None)
+            self.redelivered_metric.inc((queue_name, ))
+
+            self.buffer_message(queue_name, msgid, msg, head=True)
+            self.limited_queues.add(queue_name)
+
+    def track_reply(self, msgid, worker_id):
+        """
+        Remember the worker a ``reply-requested`` job was sent to, so the
+        client stops waiting for it if the worker goes away
+
+        Args:
+            msgid (str): The msgid of the REQUEST
+            worker_id (str): The worker the job was sent to, or None if it's
+                waiting to be sent again
+        """
+        recipient = self.reply_recipients.get(msgid)
+        if recipient is not None:
+            recipient[1] = worker_id
+
+    def remove_worker_replies(self, worker_id):
+        """
+        Forget the clients waiting for the results of the jobs of a worker
+        that is gone. Guaranteed jobs were already put back in their queue,
+        so they're kept.
+        """
+        for msgid, (_, job_worker_id) in list(self.reply_recipients.items()):
+            if job_worker_id == worker_id:
+                logger.warning('Job %s was lost with worker %s. Its result '
+                               'will not be sent.', msgid, worker_id)
+                del self.reply_recipients[msgid]
+
+    def job_finished(self, msgid):
+        """
+        Stop tracking the latency (and delivery) of a job that finished and
+        record it in the metrics. The REPLY and the READY of a job both report
+        it finished, only the first one counts. A job that finished without a
+        REPLY won't get one, so its client stops waiting for it.
+
+        Args:
+            msgid (str): The msgid of the REQUEST
+
+        Returns:
+            float: Seconds since the REQUEST was accepted, or None if the job
+                isn't tracked
+        """
+        self.deliveries.remove(msgid)
+        self.reply_recipients.pop(msgid, None)
+
+        try:
+            started, queue_name = self.job_latencies.pop(msgid)
+        except KeyError:
+            return None
+
+        elapsed_secs = monotonic() - started
+        trace('router.finish', msgid, queue=queue_name)
+        self.completed_metric.inc((queue_name, ))
+        self.job_duration_metric.observe(elapsed_secs, (queue_name, ))
+
+        return elapsed_secs
+
+    def on_result(self, sender, msgid, msg):
+        """
+        Handles a RESULT message from a client. Every frame of the message is
+        the msgid of a ``reply-requested`` REQUEST. A REPLY is sent back for
+        each result found in :attr:`result_store`. Results that aren't ready
+        yet are sent when the REPLY from the worker arrives. Jobs that aren't
+        waiting for a result (unknown, expired or lost) get a REPLY with an
+        ``error`` instead of a ``value``.
+
+        Args:
+            sender (str): The id of the client
+            msgid (str): Unique identifier for this message
+            msg: msgids of the REQUESTs to fetch the results of
+        """
+        for request_msgid in msg:
+            reply = None
+            if self.result_store is not None:
+                reply = self.result_store.get(request_msgid)
+
+            if reply is None:
+                if request_msgid in self.reply_recipients:
+                    # Not finished yet. Make sure the client gets it.
+                    self.reply_recipients[request_msgid][0] = sender
+                    continue
+
+                reply = json.dumps({'error': 'No result for {}'.format(
+                    request_msgid)})
+
+            try:
+                sendmsg(self.incoming, sender, 'REPLY',
+                        (request_msgid, reply))
+            except exceptions.PeerGoneAwayError:
+                logger.debug('Client {} went away before receiving the result '
+                             'of {}'.format(sender, request_msgid))
+                return
 
     def on_disconnect(self, msgid, msg):
         """
@@ -367,6 +668,10 @@ class Router(HeartbeatMixin):
         self.schedulers.clear()
         self.incoming.unbind(conf.FRONTEND_ADDR)
 
+        if self.delayed_messages:
+            logger.warning('Discarding {} delayed REQUESTs that are not due '
+                           'yet'.format(len(self.delayed_messages)))
+
         if len(self.waiting_messages) > 0:
             logger.info("Router processing messages in queue.")
             for queue in self.waiting_messages.keys():
@@ -390,13 +695,68 @@ class Router(HeartbeatMixin):
         Args:
             sender (str): The id of the sender
             msgid (str): Unique identifier for this message
-            msg: The actual message that was sent
+            msg: The msgids of the jobs that finished, if any
+        """
+        self.jobs_finished(sender, msg)
+
+        if conf.QUEUE_FAIR_SHARE:
+            sent = self.dispatch_fair_share(sender)
+        else:
+            sent = self.dispatch_by_priority(sender)
+
+        # if a message has been forwarded short circuit that way the manager
+        # isn't reslotted
+        if not sent:
+            self.requeue_worker(sender)
+
+    def on_retire(self, sender, msgid, msg):
+        """
+        A worker that shrank its pool reports jobs that finished without
+        giving their slot back
+
+        Args:
+            sender (str): The id of the sender
+            msgid (str): Unique identifier for this message
+            msg: The msgids of the jobs that finished
+        """
+        self.jobs_finished(sender, msg)
+
+    def jobs_finished(self, sender, msgids):
+        """
+        Record the jobs a worker reported finished with READY or RETIRE. A
+        guaranteed job that was sent again to another worker is still running
+        there, so a late report from the worker it was sent to first is
+        ignored.
+
+        Args:
+            sender (str): The id of the worker
+            msgids: The msgids of the jobs that finished
+        """
+        for finished_msgid in msgids:
+            owner = self.deliveries.worker_of(finished_msgid)
+            if owner is not None and owner != sender:
+                logger.debug('Ignoring {} finished by {}, it was sent again '
+                             'to {}'.format(finished_msgid, sender, owner))
+                continue
+
+            self.remove_in_flight(finished_msgid)
+            self.job_finished(finished_msgid)
+
+    def dispatch_by_priority(self, worker_id):
+        """
+        Send the oldest waiting message of the highest priority queue the
+        worker is a member of.
+
+        Args:
+            worker_id (str): The id of the worker with a free slot
+
+        Returns:
+            bool: True if a waiting message was found for the worker
         """
-        queue_names = self.workers[sender]['queues']
+        queue_names = self.workers[worker_id]['queues']
 
         # if there are waiting messages for the queues this worker is a member
-        # of, then reply back with the oldest waiting message, otherwise just
-        # add the worker to the list of available workers.
+        # of, then reply back with the oldest waiting message
         # Note: This is only taking into account the queue the worker is
         # returning from, and not other queue_names that might have had
         # messages waiting even longer.
@@ -404,34 +764,209 @@ class Router(HeartbeatMixin):
         for queue in queue_names:
             queue_name = queue[1]
             if queue_name in self.waiting_messages.keys():
+                if not self.queue_has_capacity(queue_name):
+                    self.limited_queues.add(queue_name)
+                    continue
+
                 logger.debug('Found waiting message in the %s waiting_messages'
-                             ' queue' % queue_name)
-                msg = self.waiting_messages[queue_name].peekleft()
+                             ' queue', queue_name)
+                self.send_waiting_message(queue_name, worker_id)
+                return True
+
+        return False
+
+    def dispatch_fair_share(self, worker_id):
+        """
+        Send a waiting message to the worker picking the queue with deficit
+        round robin, so each of the worker's queues gets a share of its slots
+        proportional to the queue's weight. A busy queue can't starve the
+        others. Picking a queue doesn't depend on the number of waiting
+        messages, at worst every queue of the worker is visited once.
+
+        Args:
+            worker_id (str): The id of the worker with a free slot
+
+        Returns:
+            bool: True if a waiting message was found for the worker
+        """
+        queues = self.workers[worker_id]['queues']
+        if not queues:
+            return False
+
+        if worker_id not in self.fair_share:
+            lightest = max(min(queue[0] for queue in queues), 1)
+            self.fair_share[worker_id] = [
+                0, {}, [max(queue[0], 1) / float(lightest)
+                        for queue in queues]]
+
+        state = self.fair_share[worker_id]
+        position, deficits, quantums = state
+
+        for _ in range(len(queues)):
+            queue_name = queues[position][1]
+
+            if queue_name in self.waiting_messages:
+                if self.queue_has_capacity(queue_name):
+                    # Starting a new turn for this queue
+                    if deficits.get(queue_name, 0) < 1:
+                        deficits[queue_name] = \
+                            deficits.get(queue_name, 0) + quantums[position]
+
+                    deficits[queue_name] -= 1
+                    if deficits[queue_name] < 1:
+                        # The queue used up its turn
+                        position = (position + 1) % len(queues)
+                    state[0] = position
+
+                    self.send_waiting_message(queue_name, worker_id)
+                    return True
+
+                self.limited_queues.add(queue_name)
+            else:
+                # Empty queues don't save up credit
+                deficits[queue_name] = 0
+
+            position = (position + 1) % len(queues)
+
+        state[0] = position
+        return False
+
+    def send_waiting_message(self, queue_name, worker_addr):
+        """
+        Send the oldest waiting message of `queue_name` to `worker_addr`
+
+        Args:
+            queue_name (str): The queue with waiting messages
+            worker_addr (str): The id of the worker with a free slot
+
+        Returns:
+            bool: True if the message was sent
+        """
+        msg = self.waiting_messages[queue_name].peekleft()
+        sent = False
+
+        try:
+            fwdmsg(self.outgoing, worker_addr, msg)
+            self.worker_liveness.sent(worker_addr)
+            self.waiting_messages[queue_name].popleft()
+            self.release_dedupe_key(queue_name, msg[4:])
+            self.add_in_flight(msg[3], queue_name, worker_addr)
+            self.track_delivery(msg[3], queue_name, worker_addr, msg[4:])
+            self.track_reply(msg[3], worker_addr)
+            self.dispatched_metric.inc((queue_name, ))
+            trace('router.forward', msg[3], queue=queue_name, buffered=True)
+            sent = True
+        except exceptions.PeerGoneAwayError:
+            # Cleanup a workerg that cannot be contacted, leaving the
+            # message in queue
+            self.remove_dead_worker(worker_addr)
+
+        # It is easier to check if a key exists rather than the len of
+        # a key's value if it exists elsewhere, so if that was the last
+        # message remove the queue
+        if len(self.waiting_messages[queue_name]) == 0:
+            logger.debug('No more messages in waiting_messages queue '
+                         '%s. Removing from list...', queue_name)
+            del self.waiting_messages[queue_name]
+
+        return sent
+
+    def setup_queue_limits(self):
+        """
+        Build the rate limiters for ``conf.QUEUE_RATE_LIMITS``
+        """
+        self.queue_rate_limiters = {
+            queue_name: TokenBucket(rate)
+            for queue_name, rate in conf.QUEUE_RATE_LIMITS.items()
+            if rate > 0
+        }
+
+    def queue_has_capacity(self, queue_name):
+        """
+        Check the limits of `queue_name` before sending one of its jobs to a
+        worker. This is O(1). A rate limit token is used up if the job may be
+        sent.
+
+        Args:
+            queue_name (str): Name of the queue
+
+        Returns:
+            bool: True if a job may be sent now
+        """
+        max_in_flight = conf.QUEUE_MAX_IN_FLIGHT.get(queue_name)
+        if max_in_flight and \
+           self.queue_in_flight.get(queue_name, 0) >= max_in_flight:
+            return False
+
+        rate_limiter = self.queue_rate_limiters.get(queue_name)
+        if rate_limiter is not None and not rate_limiter.consume():
+            return False
+
+        return True
+
+    def add_in_flight(self, msgid, queue_name, worker_id):
+        """
+        Count a job that was sent to a worker against its queue's max in
+        flight. Only jobs of queues in ``conf.QUEUE_MAX_IN_FLIGHT`` are
+        tracked.
+        """
+        if queue_name not in conf.QUEUE_MAX_IN_FLIGHT:
+            return
+
+        self.in_flight_jobs[msgid] = (queue_name, worker_id)
+        self.queue_in_flight[queue_name] = \
+            self.queue_in_flight.get(queue_name, 0) + 1
+
+    def remove_in_flight(self, msgid):
+        """
+        A job finished, so it no longer counts against its queue's max in
+        flight.
+        """
+        try:
+            queue_name, _ = self.in_flight_jobs.pop(msgid)
+        except KeyError:
+            return
+
+        self.queue_in_flight[queue_name] -= 1
+        if queue_name in self.waiting_messages:
+            self.limited_queues.add(queue_name)
+
+    def remove_worker_in_flight(self, worker_id):
+        """
+        Stop counting the jobs of a worker that is gone against their queue's
+        max in flight.
+        """
+        for msgid, (_, job_worker_id) in list(self.in_flight_jobs.items()):
+            if job_worker_id == worker_id:
+                self.remove_in_flight(msgid)
+
+    def dispatch_limited_queues(self):
+        """
+        Send the waiting messages of queues that were held back by their
+        limits to available workers, as far as the limits allow.
+        """
+        for queue_name in list(self.limited_queues):
+            while queue_name in self.waiting_messages:
+                if not self.queue_has_capacity(queue_name):
+                    break
 
                 try:
-                    fwdmsg(self.outgoing, sender, msg)
-                    self.waiting_messages[queue_name].popleft()
-                except exceptions.PeerGoneAwayError:
-                    # Cleanup a workerg that cannot be contacted, leaving the
-                    # message in queue
-                    self.workers[sender]['hb'] = 0
-                    self.clean_up_dead_workers()
-
-                # It is easier to check if a key exists rather than the len of
-                # a key's value if it exists elsewhere, so if that was the last
-                # message remove the queue
-                if len(self.waiting_messages[queue_name]) == 0:
-                    logger.debug('No more messages in waiting_messages queue '
-                                 '%s. Removing from list...' % queue_name)
-                    del self.waiting_messages[queue_name]
-
-                # the message has been forwarded so short circuit that way the
-                # manager isn't reslotted
-                return
+                    worker_addr = self.get_available_worker(
+                        queue_name=queue_name)
+                except (exceptions.NoAvailableWorkerSlotsError,
+                        exceptions.UnknownQueueError):
+                    # The next READY from a worker picks it up
+                    if queue_name in self.queue_rate_limiters:
+                        self.queue_rate_limiters[queue_name].refund()
+                    self.limited_queues.discard(queue_name)
+                    break
 
-        self.requeue_worker(sender)
+                if self.send_waiting_message(queue_name, worker_addr):
+                    self.workers[worker_addr]['available_slots'] -= 1
+            else:
+                self.limited_queues.discard(queue_name)
 
-    def on_request(self, sender, msgid, msg, depth=1):
+    def on_request(self, sender, msgid, msg, depth=1, ack=True):
         """
         Process a client REQUEST frame
 
@@ -441,55 +976,57 @@ class Router(HeartbeatMixin):
             msgid
             depth (int): The recusion depth in retrying when PeerGoneAwayError
                 is raised.
-        """
-        import psutil
+            ack (bool): Send a REPLY to the client when the job is sent to a
+                worker. REQUEST_BATCH acks all of its jobs at once instead.
 
+        Returns:
+            bool: False if the REQUEST was dropped
+        """
         try:
             queue_name = msg[0]
         except IndexError:
             logger.exception("Queue name undefined. Sender {}; MsgID: {}; "
                              "Msg: {}".format(sender, msgid, msg))
-            return
+            return False
 
         # If we have no workers for the queue assign it to the default queue
         if queue_name not in self.queues:
             logger.warning("Received REQUEST with a queue I don't recognize: "
-                           "%s. Sending to default queue." % (queue_name,))
+                           "%s. Sending to default queue.", queue_name)
             queue_name = conf.DEFAULT_QUEUE_NAME
 
+        trace('router.receive', msgid, queue=queue_name)
+
+        if self.is_duplicate_request(queue_name, msgid, msg):
+            logger.info('Dropping duplicate REQUEST %s for queue %s', msgid,
+                        queue_name)
+            return False
+
+        if len(msg) > 1 and parse_headers(msg[1]).reply_requested:
+            self.reply_recipients[msgid] = [sender, None]
+
+        if len(msg) > 1 and self.delay_request(sender, msgid, msg):
+            return True
+
         self.job_latencies[msgid] = (monotonic(), queue_name)
+        self.requests_metric.inc((queue_name, ))
 
         try:
             worker_addr = self.get_available_worker(queue_name=queue_name)
         except (exceptions.NoAvailableWorkerSlotsError,
                 exceptions.UnknownQueueError):
             logger.warning('No available workers for queue "%s". '
-                           'Buffering message to send later.' % queue_name)
-            if queue_name not in self.waiting_messages:
-                # Since the default queue will pick up messages with invalid
-                # queues, it will need to be larger than other queues
-                if queue_name == conf.DEFAULT_QUEUE_NAME:
-                    total_mem = psutil.virtual_memory().total
-                    # Set queue limit to be 75% of total memory with ~100 byte
-                    # messages
-                    limit = int((total_mem / 100) * 0.75)
-                    self.waiting_messages[queue_name] = EMQdeque(
-                        full=limit, on_full=router_on_full)
-                else:
-                    self.waiting_messages[queue_name] = \
-                        EMQdeque(full=conf.HWM,
-                                 on_full=router_on_full)
-
-            if self.waiting_messages[queue_name].append(
-                    ['', constants.PROTOCOL_VERSION, 'REQUEST',
-                     msgid, ] + msg):
-                logger.debug('%d waiting messages in queue "%s"' %
-                             (len(self.waiting_messages[queue_name]),
-                              queue_name))
-            else:
-                logger.warning('High Watermark {} met for {}, notifying'.
-                               format(conf.HWM, queue_name))
-            return
+                           'Buffering message to send later.', queue_name)
+            self.buffer_message(queue_name, msgid, msg)
+            return True
+
+        if not self.queue_has_capacity(queue_name):
+            if conf.SUPER_DEBUG:
+                logger.debug('Queue "{}" is at its limits. Buffering message '
+                             'to send later.'.format(queue_name))
+            self.buffer_message(queue_name, msgid, msg)
+            self.limited_queues.add(queue_name)
+            return True
 
         try:
             # Check if msg type is for executing function
@@ -509,60 +1046,310 @@ class Router(HeartbeatMixin):
 
             fwdmsg(self.outgoing, worker_addr, ['', constants.PROTOCOL_VERSION,
                                                 'REQUEST', msgid, ] + msg)
+            self.worker_liveness.sent(worker_addr)
 
             self.workers[worker_addr]['available_slots'] -= 1
+            self.release_dedupe_key(queue_name, msg)
+            self.add_in_flight(msgid, queue_name, worker_addr)
+            self.track_delivery(msgid, queue_name, worker_addr, msg)
+            self.track_reply(msgid, worker_addr)
+            self.dispatched_metric.inc((queue_name, ))
+            trace('router.forward', msgid, queue=queue_name, buffered=False)
             # Acknowledgment of the request being submitted to the client
-            sendmsg(self.incoming, sender, 'REPLY',
-                    (msgid,))
+            if ack:
+                sendmsg(self.incoming, sender, 'REPLY',
+                        (msgid,))
         except exceptions.PeerGoneAwayError:
             logger.debug(
                 "Worker {} has unexpectedly gone away. Removing this worker "
                 "before trying another worker".format(worker_addr))
 
             # Remove this worker to prevent infinite loop
-            self.workers[worker_addr]['hb'] = 0
-            self.clean_up_dead_workers()
+            self.remove_dead_worker(worker_addr)
 
             # Recursively try again. TODO: are there better options?
-            self.process_client_message(
-                [sender, '', PROTOCOL_VERSION, 'REQUEST', msgid] + msg,
-                depth=depth+1)
+            if ack:
+                self.process_client_message(
+                    [sender, '', PROTOCOL_VERSION, 'REQUEST', msgid] + msg,
+                    depth=depth+1)
+            elif depth < 100:
+                return self.on_request(sender, msgid, msg, depth=depth+1,
+                                       ack=False)
+            else:
+                logger.error('Unable to send REQUEST {} to a worker after {} '
+                             'attempts. Discarding.'.format(msgid, depth))
+                return False
+
+        return True
+
+    def on_request_batch(self, sender, msgid, msg):
+        """
+        Process a client REQUEST_BATCH frame. Each job in the batch is handled
+        like a REQUEST and the accepted jobs are acknowledged with a single
+        ACK.
+
+        Args:
+            sender (str): The id of the client that sent the batch
+            msgid (str): The msgid of the REQUEST_BATCH
+            msg: The queue name and headers shared by the jobs followed by the
+                msgid and body of each job
+        """
+        if len(msg) < 2 or len(msg) % 2:
+            logger.error('Invalid REQUEST_BATCH {} from {}. Expected a queue '
+                         'name, headers and (msgid, body) pairs'.format(
+                             msgid, sender))
+            return
+
+        queue_name = msg[0]
+        headers = msg[1]
+        accepted = []
+
+        for i in range(2, len(msg), 2):
+            job_msgid = msg[i]
+            if self.on_request(sender, job_msgid,
+                               [queue_name, headers, msg[i+1]], ack=False):
+                accepted.append(job_msgid)
+
+        if conf.SUPER_DEBUG:
+            logger.debug('Accepted {} of {} jobs from REQUEST_BATCH {}'.format(
+                len(accepted), (len(msg) - 2) // 2, msgid))
+
+        sendmsg(self.incoming, sender, 'ACK', [msgid, ] + accepted)
+
+    def buffer_message(self, queue_name, msgid, msg, head=False):
+        """
+        Add a REQUEST to :attr:`waiting_messages` to send when a worker is
+        available (and the queue's limits allow it)
+
+        Args:
+            queue_name (str): Name of the queue
+            msgid (str): The msgid of the REQUEST
+            msg: The REQUEST message (queue name, headers, body)
+            head (bool): Put the REQUEST ahead of the other waiting messages,
+                e.g. for a job a worker returned
+        """
+        import psutil
+
+        trace('router.buffer', msgid, queue=queue_name)
+
+        if queue_name not in self.waiting_messages:
+            # Since the default queue will pick up messages with invalid
+            # queues, it will need to be larger than other queues
+            if queue_name == conf.DEFAULT_QUEUE_NAME:
+                total_mem = psutil.virtual_memory().total
+                # Set queue limit to be 75% of total memory with ~100 byte
+                # messages
+                limit = int((total_mem / 100) * 0.75)
+                self.waiting_messages[queue_name] = EMQdeque(
+                    full=limit, on_full=router_on_full)
+            else:
+                self.waiting_messages[queue_name] = \
+                    EMQdeque(full=conf.HWM,
+                             on_full=router_on_full)
+
+        waiting_messages = self.waiting_messages[queue_name]
+        add = waiting_messages.appendleft if head else waiting_messages.append
+        if add(['', constants.PROTOCOL_VERSION, 'REQUEST', msgid, ] + msg):
+            logger.debug('%d waiting messages in queue "%s"',
+                         len(self.waiting_messages[queue_name]), queue_name)
+        else:
+            logger.warning('High Watermark %s met for %s, notifying',
+                           conf.HWM, queue_name)
+
+    def delay_request(self, sender, msgid, msg):
+        """
+        Hold on to a REQUEST with the ``eta:<ts>`` or ``delay:<secs>`` header
+        in :attr:`delayed_messages` until it's due.
+
+        Args:
+            sender (str): The id of the client that sent the REQUEST
+            msgid (str): The msgid of the REQUEST
+            msg: The REQUEST message (queue name, headers, body)
+
+        Returns:
+            bool: True if the REQUEST was delayed, False if it should be
+                handled now
+        """
+        headers = parse_headers(msg[1])
+        if headers.eta is None and headers.delay is None:
+            return False
+
+        eta = headers.eta_at(timestamp())
 
-    def clean_up_dead_workers(self):
+        wait = eta - timestamp()
+        if wait <= 0:
+            return False
+
+        heapq.heappush(self.delayed_messages,
+                       (monotonic() + wait, next(self._delayed_seq), sender,
+                        msgid, msg))
+        if conf.SUPER_DEBUG:
+            logger.debug('Delaying REQUEST %s for %.2fs', msgid, wait)
+
+        return True
+
+    def release_delayed_messages(self, now=None):
         """
-        Loops through the worker queues and removes any workers who haven't
-        responded in HEARTBEAT_TIMEOUT
+        Handle the REQUESTs in :attr:`delayed_messages` that are due
+
+        Args:
+            now (float): monotonic time to release the REQUESTs up to
+        """
+        now = now or monotonic()
+
+        while self.delayed_messages and self.delayed_messages[0][0] <= now:
+            _, _, sender, msgid, msg = heapq.heappop(self.delayed_messages)
+            # Dropping the delay headers makes sure the REQUEST isn't delayed
+            # again, e.g. if the clocks disagree
+            headers = parse_headers(msg[1]).replace(eta=None, delay=None)
+            self.on_request(sender, msgid,
+                            [msg[0], headers.encode()] + list(msg[2:]))
+
+    def is_duplicate_request(self, queue_name, msgid, msg):
         """
+        Check if a REQUEST is a duplicate of one that was recently accepted.
+        Only REQUESTs with the ``debounce:N`` or ``dedupe-key:K`` headers are
+        checked. If it isn't a duplicate, the REQUEST is added to
+        :attr:`dedupe_index`.
+
+        Args:
+            queue_name (str): The queue the REQUEST is for
+            msgid (str): The id of the REQUEST
+            msg (list): The REQUEST frames. ``[queue, headers, body]``
+
+        Returns:
+            bool: True if the REQUEST should be dropped, otherwise False
+        """
+        try:
+            headers = parse_headers(msg[1])
+        except IndexError:
+            return False
+
+        # Most REQUESTs don't ask to be deduplicated
+        if headers.debounce is None and headers.dedupe_key is None:
+            return False
+
         now = monotonic()
+        self.expire_dedupe_index(now)
+
+        window = headers.debounce
+        key = headers.dedupe_key
+
+        if key is None:
+            # Debounced jobs without an explicit key are identified by the
+            # callable and it's arguments
+            try:
+                params = json.loads(msg[2])[1]
+                key = arguments_hash(
+                    path=params.get('path'),
+                    callable=params.get('callable'),
+                    args=params.get('args'),
+                    kwargs=params.get('kwargs'),
+                    class_args=params.get('class_args'),
+                    class_kwargs=params.get('class_kwargs'))
+            except (IndexError, ValueError, TypeError, AttributeError):
+                logger.warning('Unable to build a dedupe key for REQUEST '
+                               '{}'.format(msgid))
+                return False
+
+        key = '{}:{}'.format(queue_name, key)
+
+        entry = self.dedupe_index.get(key)
+        # The same msgid is seen again when a REQUEST is retried after a
+        # PeerGoneAwayError
+        if entry and entry[0] != msgid:
+            return True
+
+        expires_at = now + window if window else None
+        self.dedupe_index[key] = (msgid, expires_at)
+        if expires_at:
+            heapq.heappush(self._dedupe_expiry, (expires_at, key))
+
+        return False
+
+    def release_dedupe_key(self, queue_name, msg):
+        """
+        Remove the ``dedupe-key:K`` entry of a REQUEST that was sent to a
+        worker from :attr:`dedupe_index` unless it's still inside of a
+        ``debounce:N`` window.
+
+        Args:
+            queue_name (str): The queue the REQUEST was for
+            msg (list): The REQUEST frames. ``[queue, headers, body]``
+        """
+        if len(msg) < 2:
+            return
+
+        dedupe_key = parse_headers(msg[1]).dedupe_key
+        if dedupe_key is None:
+            return
+
+        key = '{}:{}'.format(queue_name, dedupe_key)
+        entry = self.dedupe_index.get(key)
+        if entry and entry[1] is None:
+            del self.dedupe_index[key]
+
+    def expire_dedupe_index(self, now=None):
+        """
+        Remove the :attr:`dedupe_index` entries whose debounce window has
+        passed. Only the expired entries are touched.
+        """
+        if not now:
+            now = monotonic()
+
+        while self._dedupe_expiry and self._dedupe_expiry[0][0] <= now:
+            expires_at, key = heapq.heappop(self._dedupe_expiry)
+            entry = self.dedupe_index.get(key)
+            # The entry may have been replaced by a newer REQUEST
+            if entry and entry[1] == expires_at:
+                del self.dedupe_index[key]
+
+    def clean_up_dead_workers(self, now=None):
+        """
+        Removes the workers who haven't sent a message in HEARTBEAT_TIMEOUT.
+        Only the workers whose deadline has passed are looked at.
+
+        Args:
+            now (float): monotonic time to check the workers at
+        """
+        now = now or monotonic()
         self._meta['last_worker_cleanup'] = now
 
-        # Because workers and queues are removed from inside a loop, a copy is
-        # needed to prevent the dict we are iterating over from changing.
-        workers = copy(self.workers)
-        queues = copy(self.queues)
+        for worker_id in self.worker_liveness.expired(now):
+            logger.info('No messages from worker %s in %s seconds. Removing '
+                        'from the queue', worker_id, conf.HEARTBEAT_TIMEOUT)
+            self.remove_dead_worker(worker_id)
 
-        for worker_id in workers:
-            last_hb_seconds = now - self.workers[worker_id]['hb']
-            if last_hb_seconds >= conf.HEARTBEAT_TIMEOUT:
-                logger.info("No messages from worker {} in {}. Removing from "
-                            "the queue. TIMEOUT: {}".format(
-                                worker_id, last_hb_seconds,
-                                conf.HEARTBEAT_TIMEOUT))
-
-                # Remove the worker from the actual queues
-                for queue in self.workers[worker_id]['queues']:
-                    try:
-                        self.queues[queue[1]].remove((queue[0], worker_id))
-                    except KeyError:
-                        # This queue disappeared for some reason
-                        continue
-
-                del self.workers[worker_id]
-
-        # Remove the empty queue
-        for queue_name in queues:
-            if len(self.queues[queue_name]) == 0:
-                del self.queues[queue_name]
+    def remove_dead_worker(self, worker_id):
+        """
+        Remove a worker that timed out or can't be contacted from the worker
+        queues
+
+        Args:
+            worker_id (str): unique id of the worker to remove
+        """
+        self.worker_liveness.remove(worker_id)
+
+        worker = self.workers.pop(worker_id, None)
+        if worker is None:
+            return
+
+        for queue in worker['queues']:
+            try:
+                self.queues[queue[1]].remove((queue[0], worker_id))
+            except (KeyError, ValueError):
+                # This queue disappeared for some reason
+                continue
+
+            # Remove the empty queue
+            if not self.queues[queue[1]]:
+                del self.queues[queue[1]]
+
+        self.fair_share.pop(worker_id, None)
+        self.remove_worker_in_flight(worker_id)
+        self.redeliver(self.deliveries.remove_worker(worker_id))
+        self.remove_worker_replies(worker_id)
+        self.heartbeat_misses_metric.inc(('worker', ))
 
     def add_worker(self, worker_id, queues=None):
         """
@@ -583,8 +1370,9 @@ class Router(HeartbeatMixin):
         # Add the worker to our worker dict
         self.workers[worker_id] = {}
         self.workers[worker_id]['queues'] = tuple(queues)
-        self.workers[worker_id]['hb'] = monotonic()
+        self.worker_liveness.add(worker_id)
         self.workers[worker_id]['available_slots'] = 0
+        self.fair_share.pop(worker_id, None)
 
         # Define priorities. First element is the highest priority
         for q in queues:
@@ -688,6 +1476,7 @@ class Router(HeartbeatMixin):
                                                          last_hb_seconds))
                 del self.schedulers[scheduler_id]
                 self.scheduler_queue.remove(scheduler_id)
+                self.heartbeat_misses_metric.inc(('scheduler', ))
 
     def add_scheduler(self, scheduler_id):
         """
@@ -719,7 +1508,8 @@ class Router(HeartbeatMixin):
         command = message[1]
 
         if conf.WAL_ENABLED and \
-           command in ("REQUEST", "SCHEDULE", "UNSCHEDULE"):
+           command in ("REQUEST", "REQUEST_BATCH", "SCHEDULE",
+                       "UNSCHEDULE"):
             wal_logger.info(original_msg)
 
     def process_client_message(self, original_msg, depth=0):
@@ -768,6 +1558,9 @@ class Router(HeartbeatMixin):
         if command == "REQUEST":
             self.on_request(sender, msgid, msg, depth=depth)
 
+        elif command == "REQUEST_BATCH":
+            self.on_request_batch(sender, msgid, msg)
+
         elif command == "INFORM":
             # This is a scheduler trying join
             self.on_inform(sender, msgid, msg)
@@ -813,6 +1606,9 @@ class Router(HeartbeatMixin):
                                  format(scheduler_addr))
                     self.process_client_message(original_msg[1:], depth+1)
 
+        elif command == "RESULT":
+            self.on_result(sender, msgid, msg)
+
         elif command == DISCONNECT:
             self.on_disconnect(msgid, msg)
 
@@ -841,7 +1637,7 @@ class Router(HeartbeatMixin):
                 self._remove_worker(sender)
             # Treat any other message like a HEARTBEAT.
             else:
-                self.workers[sender]['hb'] = monotonic()
+                self.worker_liveness.received(sender)
         elif command.lower() != 'inform':
             logger.critical('Unknown worker %s attempting to run %s command: '
                             '%s' % (sender, command, str(msg)))
@@ -859,6 +1655,11 @@ class Router(HeartbeatMixin):
             worker_id: (str) ID of worker to remove
         """
         worker = self.workers.pop(worker_id)
+        self.worker_liveness.remove(worker_id)
+        self.fair_share.pop(worker_id, None)
+        self.remove_worker_in_flight(worker_id)
+        self.redeliver(self.deliveries.remove_worker(worker_id))
+        self.remove_worker_replies(worker_id)
         for queue in worker['queues']:
             name = queue[1]
             workers = self.queues[name]
@@ -905,6 +1706,7 @@ class Router(HeartbeatMixin):
         """
         return json.dumps({
             'job_latencies_count': len(self.job_latencies),
+            'delayed_message_count': len(self.delayed_messages),
             'processed_messages': self.processed_message_counts,
             'processed_messages_by_worker':
                 self.processed_message_counts_by_worker,
@@ -915,9 +1717,106 @@ class Router(HeartbeatMixin):
                 for q in self.waiting_messages]
         })
 
+    def setup_metrics(self):
+        """
+        Define the metrics of the router. The event loop only updates the
+        counters and histograms. The gauges are computed from the state of
+        the router by the metrics server thread when they are scraped.
+        """
+        metrics = self.metrics
+
+        self.requests_metric = metrics.counter(
+            'eventmq_router_requests', 'REQUESTs queued for a worker',
+            ('queue', ))
+        self.dispatched_metric = metrics.counter(
+            'eventmq_router_dispatched', 'Jobs sent to workers', ('queue', ))
+        self.returned_metric = metrics.counter(
+            'eventmq_router_returned',
+            'Jobs returned by workers that were shutting down or '
+            'reconnecting', ('queue', ))
+        self.redelivered_metric = metrics.counter(
+            'eventmq_router_redelivered',
+            'Guaranteed jobs sent again because their worker went away or '
+            'they ran past their visibility timeout', ('queue', ))
+        self.completed_metric = metrics.counter(
+            'eventmq_router_completed', 'Jobs reported finished by workers',
+            ('queue', ))
+        self.job_duration_metric = metrics.histogram(
+            'eventmq_router_job_duration_seconds',
+            'Time from queueing a REQUEST to the job finishing', ('queue', ))
+        self.heartbeat_misses_metric = metrics.counter(
+            'eventmq_router_heartbeat_misses',
+            'Peers removed because they stopped sending heartbeats',
+            ('peer', ))
+
+        metrics.gauge(
+            'eventmq_router_waiting_messages', 'Jobs waiting for a worker',
+            ('queue', ),
+            func=lambda: {(queue_name, ): len(messages) for
+                          queue_name, messages in
+                          list(self.waiting_messages.items())})
+        metrics.gauge(
+            'eventmq_router_waiting_messages_bytes',
+            'Estimated size of the jobs waiting for a worker',
+            func=self.waiting_messages_size)
+        metrics.gauge(
+            'eventmq_router_delayed_messages',
+            'Jobs waiting for their eta or delay',
+            func=lambda: len(self.delayed_messages))
+        metrics.gauge(
+            'eventmq_router_guaranteed_jobs',
+            'Guaranteed jobs sent to workers that haven\'t finished',
+            func=lambda: len(self.deliveries))
+        metrics.gauge(
+            'eventmq_router_pending_jobs',
+            'Jobs that were queued and haven\'t finished',
+            func=lambda: len(self.job_latencies))
+        metrics.gauge(
+            'eventmq_router_workers', 'Connected workers',
+            func=lambda: len(self.workers))
+        metrics.gauge(
+            'eventmq_router_worker_slots_available',
+            'Slots of the connected workers that are waiting for a job',
+            func=lambda: sum(worker['available_slots'] for worker in
+                             list(self.workers.values())))
+        metrics.gauge(
+            'eventmq_router_schedulers', 'Connected schedulers',
+            func=lambda: len(self.schedulers))
+
+    def waiting_messages_size(self, sample_size=100):
+        """
+        Estimate the memory used by :attr:`waiting_messages` from the size of
+        the oldest messages of each queue, so scraping doesn't walk every
+        message.
+
+        Returns:
+            int: Estimated number of bytes in the waiting messages
+        """
+        total = 0
+        for messages in list(self.waiting_messages.values()):
+            count = len(messages)
+            try:
+                sample = [sum(len(frame) for frame in msg) for msg in
+                          itertools.islice(messages, sample_size)]
+            except RuntimeError:
+                # The event loop changed the queue while it was sampled
+                continue
+
+            if sample:
+                total += sum(sample) * count // len(sample)
+
+        return total
+
     def get_workers_status(self):
+        workers = {}
+        for worker_id, worker in self.workers.items():
+            workers[worker_id] = dict(worker)
+            if worker_id in self.worker_liveness:
+                workers[worker_id]['hb'] = \
+                    self.worker_liveness.last_received[worker_id]
+
         return json.dumps({
-            'connected_workers': self.workers,
+            'connected_workers': workers,
             'connected_queues': self.queues
         })
 
@@ -943,8 +1842,8 @@ class Router(HeartbeatMixin):
         """
         Kick off router with logging and settings import
         """
-        setup_logger('eventmq')
         import_settings()
+        setup_logger('eventmq')
         setup_wal_logger('eventmq-wal', conf.WAL)
         self.start(frontend_addr=conf.FRONTEND_ADDR,
                    backend_addr=conf.BACKEND_ADDR,
@@ -31,10 +31,12 @@ from eventmq.log import setup_logger
 
 from . import conf, constants
 from .client.messages import send_request
-from .constants import KBYE
+from .constants import KBYE, MISFIRE_POLICY
+from .metrics import MetricsRegistry
 from .poller import Poller, POLLIN
 from .sender import Sender
-from .utils.classes import EMQPService, HeartbeatMixin
+from .utils.classes import EMQPService, HeartbeatMixin, TokenBucket
+from .utils.headers import parse_headers
 from .utils.messages import send_emqp_message as sendmsg
 from .utils.settings import import_settings
 from .utils.timeutils import IntervalIter, monotonic, seconds_until, timestamp
@@ -42,6 +44,9 @@ from .utils.timeutils import IntervalIter, monotonic, seconds_until, timestamp
 
 logger = logging.getLogger(__name__)
 INFINITE_RUN_COUNT = -1
+#: Redis hash storing the wall clock timestamp of each schedule's next
+#: execution so the cadence survives a restart.
+NEXT_RUN_KEY = 'schedule_next_run'
 
 
 class Scheduler(HeartbeatMixin, EMQPService):
@@ -59,7 +64,7 @@ class Scheduler(HeartbeatMixin, EMQPService):
         self.outgoing = Sender()
         self._redis_server = None
 
-        # contains dict of 4-item lists representing cron jobs key of this
+        # contains dict of 7-item lists representing cron jobs key of this
         # dictionary is a hash of arguments, path, and callable from the
         # message of the SCHEDULE command received
         # IDX     Description
@@ -67,9 +72,12 @@ class Scheduler(HeartbeatMixin, EMQPService):
         # 1 = the function to be executed
         # 2 = the croniter iterator for this job
         # 3 = the queue to execute the job in
+        # 4 = the misfire policy for this job
+        # 5 = the cron expression for this job
+        # 6 = the jitter offset (in seconds) added to every execution
         self.cron_jobs = {}
 
-        # contains dict of 5-item lists representing jobs based on an interval
+        # contains dict of 7-item lists representing jobs based on an interval
         # key of this dictionary is a hash of arguments, path, and callable
         # from the message of the SCHEDULE command received
         # values of this list follow this format:
@@ -79,8 +87,19 @@ class Scheduler(HeartbeatMixin, EMQPService):
         # 2 = the interval iter for this job
         # 3 = the queue to execute the job in
         # 4 = run_count: # of times to execute this job
+        # 5 = the misfire policy for this job
+        # 6 = the jitter offset (in seconds) added to every execution
         self.interval_jobs = {}
 
+        #: Limits how fast late executions are sent after the scheduler has
+        #: been stalled or down so the router isn't flooded.
+        self.catchup_bucket = TokenBucket(conf.MISFIRE_CATCHUP_RATE)
+
+        #: Counters, gauges and histograms served on ``conf.METRICS_PORT``
+        self.metrics = MetricsRegistry()
+        self.setup_metrics()
+        self.metrics_server = None
+
         self.poller = Poller()
 
         self.load_jobs()
@@ -128,79 +147,219 @@ class Scheduler(HeartbeatMixin, EMQPService):
             for hash_, cron in self.cron_jobs.items():
                 # If the time is now, or passed
                 if cron[0] <= ts_now:
-                    msg = cron[1]
-                    queue = cron[3]
-
-                    # Run the msg
-                    logger.debug("Time is: %s; Schedule is: %s - Running %s"
-                                 % (ts_now, cron[0], msg))
-
-                    self.send_request(msg, queue=queue)
-
-                    # Update the next time to run
-                    cron[0] = next(cron[2])
-                    logger.debug("Next execution will be in %ss" %
-                                 seconds_until(cron[0]))
+                    self.run_cron_job(hash_, cron, ts_now)
 
             cancel_jobs = []
-            for k, v in self.interval_jobs.iteritems():
-                # TODO: Refactor this entire loop to be readable by humankind
+            for k, v in self.interval_jobs.items():
                 # The schedule time has elapsed
                 if v[0] <= m_now:
-                    msg = v[1]
-                    queue = v[3]
-
-                    logger.debug("Time is: %s; Schedule is: %s - Running %s"
-                                 % (ts_now, v[0], msg))
-
-                    # v[4] is the current remaining run_count
-                    if v[4] != INFINITE_RUN_COUNT:
-                        # If run_count was 0, we cancel the job
-                        if v[4] <= 0:
-                            cancel_jobs.append(k)
-                        else:
-                            # Decrement run_count
-                            v[4] -= 1
-                            # Persist the change to redis
-                            try:
-                                message = deserialize(self.redis_server.get(k))
-                                new_headers = []
-                                for header in message[1].split(','):
-                                    if 'run_count:' in header:
-                                        new_headers.append(
-                                            'run_count:{}'.format(v[4]))
-                                    else:
-                                        new_headers.append(header)
-                                message[1] = ",".join(new_headers)
-                                self.redis_server.set(k, serialize(message))
-                            except Exception as e:
-                                logger.warning(
-                                    'Unable to update key in redis '
-                                    'server: {}'.format(e))
-                            # Perform the request since run_count still > 0
-                            self.send_request(msg, queue=queue)
-                            v[0] = next(v[2])
-                    else:
-                        # Scheduled job is in running infinitely
-                        # Send job and update next schedule time
-                        self.send_request(msg, queue=queue)
-                        v[0] = next(v[2])
+                    if not self.run_interval_job(k, v, m_now, ts_now):
+                        cancel_jobs.append(k)
 
             for job in cancel_jobs:
                 try:
                     logger.debug('Cancelling job due to run_count: {}'
-                                 .format(k))
-                    self.redis_server.delete(k)
-                    self.redis_server.lrem('interval_jobs', 0, k)
+                                 .format(job))
+                    self.redis_server.delete(job)
+                    self.redis_server.lrem('interval_jobs', 0, job)
+                    self.redis_server.hdel(NEXT_RUN_KEY, job)
                 except Exception as e:
                     logger.warning(
                         'Unable to update key in redis '
                         'server: {}'.format(e))
-                del self.interval_jobs[k]
+                del self.interval_jobs[job]
 
             if not self.maybe_send_heartbeat(events):
                 break
 
+    def misfire_action(self, lateness, policy):
+        """
+        Decide what to do with an execution that is due.
+
+        Args:
+            lateness (float): Number of seconds the execution is late
+            policy (str): The misfire policy of the schedule. See
+                :class:`constants.MISFIRE_POLICY`
+
+        Returns:
+            str: ``run`` if the request should be sent now, ``skip`` if this
+                execution should be dropped, or ``wait`` if the catch-up rate
+                has been exceeded and it should be retried on the next loop.
+        """
+        if lateness <= conf.MISFIRE_GRACE_TIME:
+            return 'run'
+
+        if policy == MISFIRE_POLICY.skip:
+            return 'skip'
+
+        if self.catchup_bucket.consume():
+            return 'run'
+
+        return 'wait'
+
+    def setup_metrics(self):
+        """
+        Define the metrics of the scheduler
+        """
+        metrics = self.metrics
+
+        self.executions_metric = metrics.counter(
+            'eventmq_scheduler_executions',
+            'Due executions by action (run or skip)', ('action', ))
+        self.due_lag_metric = metrics.histogram(
+            'eventmq_scheduler_due_lag_seconds',
+            'How late executions were sent to the router',
+            buckets=(.01, .1, .5, 1, 2, 5, 10, 30, 60, 300, 3600))
+
+        metrics.gauge(
+            'eventmq_scheduler_schedules', 'Schedules by type', ('type', ),
+            func=lambda: {('cron', ): len(self.cron_jobs),
+                          ('interval', ): len(self.interval_jobs)})
+
+    def record_execution(self, action, lateness):
+        """
+        Args:
+            action (str): ``run`` or ``skip``. See :meth:`misfire_action`
+            lateness (float): Number of seconds the execution is late
+        """
+        self.executions_metric.inc((action, ))
+        if action == 'run':
+            self.due_lag_metric.observe(max(lateness, 0))
+
+    def run_cron_job(self, hash_, cron, ts_now):
+        """
+        Send the request for a cron job that is due and compute the next
+        execution time according to it's misfire policy.
+
+        Args:
+            hash_ (str): The schedule hash of the job
+            cron (list): The job's entry in :attr:`cron_jobs`
+            ts_now (int): The current unix timestamp
+        """
+        lateness = ts_now - cron[0]
+        action = self.misfire_action(lateness, cron[4])
+        if action == 'wait':
+            return
+
+        self.record_execution(action, lateness)
+
+        if action == 'run':
+            logger.debug("Time is: %s; Schedule is: %s - Running %s"
+                         % (ts_now, cron[0], cron[1]))
+            self.send_request(cron[1], queue=cron[3])
+        else:
+            logger.info('Skipping execution of {} scheduled for {}'.format(
+                hash_, cron[0]))
+
+        # Update the next time to run
+        if cron[4] != MISFIRE_POLICY.all:
+            # Restart the iterator from now so the missed executions are
+            # dropped
+            cron[2] = croniter(cron[5], ts_now - cron[6])
+        cron[0] = next(cron[2]) + cron[6]
+
+        self.save_next_run(hash_, cron[0])
+        logger.debug("Next execution will be in %ss" %
+                     seconds_until(cron[0]))
+
+    def run_interval_job(self, hash_, job, m_now, ts_now):
+        """
+        Send the request for an interval job that is due, decrement it's
+        run_count and compute the next execution time according to it's
+        misfire policy.
+
+        Args:
+            hash_ (str): The schedule hash of the job
+            job (list): The job's entry in :attr:`interval_jobs`
+            m_now (float): The current monotonic time
+            ts_now (int): The current unix timestamp
+
+        Returns:
+            bool: False if the job has no runs left and should be cancelled,
+                otherwise True
+        """
+        # job[4] is the current remaining run_count. If it's 0 the job is
+        # cancelled
+        if job[4] != INFINITE_RUN_COUNT and job[4] <= 0:
+            return False
+
+        lateness = m_now - job[0]
+        action = self.misfire_action(lateness, job[5])
+        if action == 'wait':
+            return True
+
+        self.record_execution(action, lateness)
+
+        if action == 'run':
+            logger.debug("Time is: %s; Schedule is: %s - Running %s"
+                         % (m_now, job[0], job[1]))
+
+            if job[4] != INFINITE_RUN_COUNT:
+                # Decrement run_count
+                job[4] -= 1
+                self.save_run_count(hash_, job[4])
+
+            self.send_request(job[1], queue=job[3])
+        else:
+            logger.info('Skipping execution of {} scheduled for {}'.format(
+                hash_, job[0]))
+
+        # Update the next time to run
+        if job[5] == MISFIRE_POLICY.all:
+            job[0] = next(job[2])
+        else:
+            job[0] = job[2].next_after(m_now)
+
+        self.save_next_run(hash_, ts_now + (job[0] - m_now))
+
+        return True
+
+    def save_run_count(self, schedule_hash, run_count):
+        """
+        Persist the remaining run_count of a job in the message headers stored
+        in redis
+        """
+        try:
+            message = deserialize(self.redis_server.get(schedule_hash))
+            headers = parse_headers(message[1])
+            if headers.run_count is not None:
+                message[1] = headers.replace(run_count=run_count).encode()
+            self.redis_server.set(schedule_hash, serialize(message))
+        except Exception as e:
+            logger.warning(
+                'Unable to update key in redis '
+                'server: {}'.format(e))
+
+    def save_next_run(self, schedule_hash, next_run_ts):
+        """
+        Persist the wall clock time of the next execution of a job so a
+        restarted scheduler can continue the cadence.
+
+        Args:
+            schedule_hash (str): The schedule hash of the job
+            next_run_ts (float): unix timestamp of the next execution
+        """
+        try:
+            self.redis_server.hset(NEXT_RUN_KEY, schedule_hash, next_run_ts)
+        except Exception as e:
+            logger.warning(
+                'Unable to update key in redis '
+                'server: {}'.format(e))
+
+    def load_next_run(self, schedule_hash):
+        """
+        Returns:
+            float: The persisted unix timestamp of the next execution of the
+                job, or None if it's unknown
+        """
+        try:
+            next_run = self.redis_server.hget(NEXT_RUN_KEY, schedule_hash)
+        except Exception as e:
+            logger.warning('Unable to read next run from redis: {}'.format(e))
+            return None
+
+        return float(next_run) if next_run else None
+
     @property
     def redis_server(self):
         # Open connection to redis server for persistance
@@ -278,6 +437,7 @@ class Scheduler(HeartbeatMixin, EMQPService):
             if (self.redis_server.get(schedule_hash)):
                 self.redis_server.delete(schedule_hash)
                 self.redis_server.lrem('interval_jobs', 0, schedule_hash)
+                self.redis_server.hdel(NEXT_RUN_KEY, schedule_hash)
                 self.redis_server.save()
         except redis.ConnectionError:
             logger.warning('Could not contact redis server')
@@ -292,34 +452,55 @@ class Scheduler(HeartbeatMixin, EMQPService):
         queue = message[0].encode('utf-8')
         headers = message[1]
         interval = int(message[2])
-        inter_iter = IntervalIter(monotonic(), interval)
         schedule_hash = self.schedule_hash(message)
         cron = message[4] if interval == -1 else ""
+        misfire_policy = self.get_misfire_policy_from_headers(headers)
+        jitter = self.jitter_offset(
+            schedule_hash, self.get_jitter_from_headers(headers), interval)
         ts = int(timestamp())
 
+        # When the scheduler was restarted, continue the cadence from the
+        # persisted (wall clock) time of the next execution. The misfire
+        # policy decides what happens if that time has already passed.
+        next_run = self.load_next_run(schedule_hash)
+
         # Positive intervals are valid
         if interval >= 0:
+            if next_run is not None:
+                # Translate the wall clock time to the monotonic clock
+                m_next = monotonic() + (next_run - timestamp())
+                inter_iter = IntervalIter(m_next - interval, interval)
+            else:
+                inter_iter = IntervalIter(monotonic() + jitter, interval)
+
             self.interval_jobs[schedule_hash] = [
                 next(inter_iter),
                 message[3],
                 inter_iter,
                 queue,
-                self.get_run_count_from_headers(headers)
+                self.get_run_count_from_headers(headers),
+                misfire_policy,
+                jitter
             ]
         # Non empty strings are valid
         # Expecting '* * * * *' etc.
         elif cron and cron != "":
-            # Create the croniter iterator
-            c = croniter(cron)
-
-            # Get the next time this job should be run
-            c_next = next(c)
-            if ts >= c_next:
-                # If the next execution time has passed move the iterator to
-                # the following time
-                c_next = next(c)
+            if next_run is not None:
+                c = croniter(cron, next_run - jitter - 1)
+                c_next = next(c) + jitter
+            else:
+                # Create the croniter iterator
+                c = croniter(cron)
+
+                # Get the next time this job should be run
+                c_next = next(c) + jitter
+                if ts >= c_next:
+                    # If the next execution time has passed move the iterator
+                    # to the following time
+                    c_next = next(c) + jitter
 
-            self.cron_jobs[schedule_hash] = [c_next, message[3], c, queue]
+            self.cron_jobs[schedule_hash] = [
+                c_next, message[3], c, queue, misfire_policy, cron, jitter]
 
     def on_schedule(self, msgid, message):
         """
@@ -331,8 +512,11 @@ class Scheduler(HeartbeatMixin, EMQPService):
         interval = int(message[2])
         cron = str(message[4])
         run_count = self.get_run_count_from_headers(headers)
+        misfire_policy = self.get_misfire_policy_from_headers(headers)
 
         schedule_hash = self.schedule_hash(message)
+        jitter = self.jitter_offset(
+            schedule_hash, self.get_jitter_from_headers(headers), interval)
 
         # Notify if this is updating existing, or new
         if (schedule_hash in self.cron_jobs or
@@ -345,29 +529,33 @@ class Scheduler(HeartbeatMixin, EMQPService):
 
         # If interval is negative, cron MUST be populated
         if interval >= 0:
-            inter_iter = IntervalIter(monotonic(), interval)
+            inter_iter = IntervalIter(monotonic() + jitter, interval)
 
             self.interval_jobs[schedule_hash] = [
                 next(inter_iter),
                 message[3],
                 inter_iter,
                 queue,
-                run_count
+                run_count,
+                misfire_policy,
+                jitter
             ]
+            next_run = timestamp() + jitter + interval
 
             if schedule_hash in self.cron_jobs:
                 self.cron_jobs.pop(schedule_hash)
         else:
             ts = int(timestamp())
             c = croniter(cron)
-            c_next = next(c)
+            c_next = next(c) + jitter
             if ts >= c_next:
                 # If the next execution time has passed move the iterator to
                 # the following time
-                c_next = next(c)
+                c_next = next(c) + jitter
 
             self.cron_jobs[schedule_hash] = [
-                c_next, message[3], c, None]
+                c_next, message[3], c, None, misfire_policy, cron, jitter]
+            next_run = c_next
 
             if schedule_hash in self.interval_jobs:
                 self.interval_jobs.pop(schedule_hash)
@@ -378,6 +566,7 @@ class Scheduler(HeartbeatMixin, EMQPService):
                     'interval_jobs', 0, -1):
                 self.redis_server.lpush('interval_jobs', schedule_hash)
             self.redis_server.set(schedule_hash, serialize(message))
+            self.redis_server.hset(NEXT_RUN_KEY, schedule_hash, next_run)
             self.redis_server.save()
             logger.debug('Saved job {} with hash {} to redis'.format(
                 message, schedule_hash))
@@ -388,7 +577,7 @@ class Scheduler(HeartbeatMixin, EMQPService):
             logger.warning(str(e))
 
         # Send a request in haste mode, decrement run_count if needed
-        if 'nohaste' not in headers:
+        if not parse_headers(headers).nohaste:
             if run_count > 0 or run_count == INFINITE_RUN_COUNT:
                 # Don't allow run_count to decrement below 0
                 if run_count > 0:
@@ -396,17 +585,74 @@ class Scheduler(HeartbeatMixin, EMQPService):
                 self.send_request(message[3], queue=queue)
 
     def get_run_count_from_headers(self, headers):
-        run_count = INFINITE_RUN_COUNT
-        for header in headers.split(','):
-            if 'run_count:' in header:
-                run_count = int(header.split(':')[1])
-        return run_count
+        run_count = parse_headers(headers).run_count
+        return INFINITE_RUN_COUNT if run_count is None else run_count
+
+    def get_misfire_policy_from_headers(self, headers):
+        """
+        Returns:
+            str: The misfire policy from the ``misfire:<policy>`` header, or
+                ``conf.MISFIRE_POLICY`` if it isn't set or is invalid
+        """
+        valid_policies = (MISFIRE_POLICY.once, MISFIRE_POLICY.all,
+                          MISFIRE_POLICY.skip)
+
+        policy = parse_headers(headers).misfire
+        if policy is None or policy in valid_policies:
+            return policy or conf.MISFIRE_POLICY
+
+        logger.warning('Invalid misfire policy {}. Using {}'.format(
+            policy, conf.MISFIRE_POLICY))
+        return conf.MISFIRE_POLICY
+
+    def get_jitter_from_headers(self, headers):
+        """
+        Returns:
+            float: The jitter window in seconds from the ``jitter:<secs>``
+                header, or ``conf.SCHEDULE_JITTER`` if it isn't set
+        """
+        jitter = parse_headers(headers).jitter
+        return conf.SCHEDULE_JITTER if jitter is None else jitter
+
+    @classmethod
+    def jitter_offset(cls, schedule_hash, window, interval=-1):
+        """
+        Deterministically pick an offset inside of the jitter window for a
+        schedule. The offset is seeded from the schedule hash so it stays the
+        same across restarts, keeping the job's cadence stable while
+        schedules that share a cadence are spread over the window.
+
+        Args:
+            schedule_hash (str): The hex schedule hash of the job
+            window (float): Size of the jitter window in seconds
+            interval (int): The interval of the job, if it's an interval job.
+                The window is capped to the interval.
+
+        Returns:
+            float: The offset in seconds to add to each execution
+        """
+        if interval > 0:
+            window = min(window, interval)
+
+        # Millisecond resolution
+        window_ms = int(window * 1000)
+        if window_ms <= 0:
+            return 0
+
+        return (int(schedule_hash, 16) % window_ms) / 1000.0
 
     def on_heartbeat(self, msgid, message):
         """
         Noop command. The logic for heartbeating is in the event loop.
         """
 
+    def on_reply(self, msgid, message):
+        """
+        Noop command. The router acknowledges the REQUESTs sent for scheduled
+        jobs, and sends the results of ``reply-requested`` ones, with REPLY.
+        Nobody is waiting for them here.
+        """
+
     @classmethod
     def schedule_hash(cls, message):
         """
@@ -443,8 +689,8 @@ class Scheduler(HeartbeatMixin, EMQPService):
         """
         Kick off scheduler with logging and settings import
         """
-        setup_logger("eventmq")
         import_settings()
+        setup_logger("eventmq")
         self.__init__()
         self.start(addr=conf.SCHEDULER_ADDR)
 
@@ -86,6 +86,10 @@ class TestCase(unittest.TestCase):
                                        guarantee=False,
                                        retry_count=3,
                                        timeout=0,
+                                       debounce_secs=False,
+                                       dedupe_key=None,
+                                       delay_secs=0,
+                                       eta=None,
                                        queue='test_queue')
 
         with LogCapture() as log_checker:
@@ -284,6 +288,87 @@ class TestCase(unittest.TestCase):
              'reply-requested,guarantee,retry-count:2,timeout:3',
              messages.serialize(msg)))
 
+    @mock.patch('eventmq.client.messages.send_emqp_message')
+    def test_send_request_dedupe_headers(self, snd_empq_msg_mock):
+        socket = mock.Mock()
+        msg = {'alksjfd': [1, 2]}
+
+        messages.send_request(socket, msg, debounce_secs=30,
+                              dedupe_key='user-42')
+        snd_empq_msg_mock.assert_called_with(
+            socket, 'REQUEST',
+            ('default',
+             'debounce:30,dedupe-key:user-42',
+             messages.serialize(msg)))
+
+        # Commas in the key don't split it into other headers
+        messages.send_request(socket, msg, guarantee=True,
+                              dedupe_key='user,42')
+        snd_empq_msg_mock.assert_called_with(
+            socket, 'REQUEST',
+            ('default',
+             'guarantee,dedupe-key:user%2C42',
+             messages.serialize(msg)))
+
+    @mock.patch('eventmq.client.messages.send_emqp_message')
+    def test_send_request_delay_headers(self, snd_empq_msg_mock):
+        socket = mock.Mock()
+        msg = {'alksjfd': [1, 2]}
+
+        messages.send_request(socket, msg, delay_secs=30)
+        snd_empq_msg_mock.assert_called_with(
+            socket, 'REQUEST',
+            ('default', 'delay:30', messages.serialize(msg)))
+
+        # eta takes precedence
+        messages.send_request(socket, msg, delay_secs=30, eta=1500000000.5)
+        snd_empq_msg_mock.assert_called_with(
+            socket, 'REQUEST',
+            ('default', 'eta:1500000000.500', messages.serialize(msg)))
+
+    @mock.patch('eventmq.client.messages.generate_msgid')
+    @mock.patch('eventmq.client.messages.send_emqp_message')
+    def test_send_request_batch(self, snd_empq_msg_mock, gen_msgid_mock):
+        socket = mock.Mock()
+        gen_msgid_mock.side_effect = ['m1', 'm2']
+        msgs = [{'a': 1}, {'b': 2}]
+
+        msgids = messages.send_request_batch(socket, msgs, retry_count=2,
+                                             queue='batchy')
+
+        self.assertEqual(['m1', 'm2'], msgids)
+        snd_empq_msg_mock.assert_called_with(
+            socket, 'REQUEST_BATCH',
+            ['batchy', 'retry-count:2',
+             'm1', messages.serialize(msgs[0]),
+             'm2', messages.serialize(msgs[1])])
+
+    @mock.patch('eventmq.client.messages.send_request_batch')
+    def test_defer_jobs(self, sndbatch_mock):
+        from future.moves.urllib.parse import urlsplit
+
+        socket = mock.Mock()
+        sndbatch_mock.side_effect = lambda s, batch, **kw: \
+            ['id{}'.format(i) for i in range(len(batch))]
+
+        msgids = messages.defer_jobs(
+            socket,
+            [urlsplit,
+             'non-callable',
+             (urlsplit, ('http://x', )),
+             (urlsplit, (), {'scheme': 'https'})],
+            batch_size=2, queue='q')
+
+        # The invalid job gets no msgid and the valid jobs are split into
+        # batches of batch_size
+        self.assertEqual(['id0', None, 'id1', 'id0'], msgids)
+        self.assertEqual(2, sndbatch_mock.call_count)
+
+        first_batch = sndbatch_mock.call_args_list[0][0][1]
+        self.assertEqual(2, len(first_batch))
+        self.assertEqual(('http://x', ), first_batch[1][1]['args'])
+        self.assertEqual('q', sndbatch_mock.call_args[1]['queue'])
+
     @mock.patch('eventmq.client.messages.send_emqp_message')
     def test_send_schedule_request(self, snd_empq_msg_mock):
         _msgid = 'va08n45-lanf548afn984-m7489vs'
@@ -0,0 +1,90 @@
+# This file is part of eventmq.
+#
+# eventmq is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 2.1 of the License, or (at your option)
+# any later version.
+#
+# eventmq is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with eventmq.  If not, see <http://www.gnu.org/licenses/>.
+import unittest
+
+import mock
+
+from .. import exceptions
+from ..client import results
+
+
+class TestCase(unittest.TestCase):
+    def setUp(self):
+        self.socket = mock.Mock()
+        self.socket.zsocket.poll.return_value = 0
+        self.inbox = []
+
+        def recv_multipart():
+            return self.inbox.pop(0)
+
+        def poll(timeout=None):
+            return len(self.inbox)
+
+        self.socket.recv_multipart.side_effect = recv_multipart
+        self.socket.zsocket.poll.side_effect = poll
+
+    def reply(self, msgid, value):
+        self.inbox.append(['', 'eMQP/1.0', 'REPLY', 'r-' + msgid, msgid,
+                           '{"value": %s}' % value])
+
+    @mock.patch('eventmq.client.results.send_emqp_message')
+    def test_get(self, send_mock):
+        # The ACK for the REQUEST is ignored
+        self.inbox.append(['', 'eMQP/1.0', 'REPLY', 'ack1', 'msg1'])
+        self.reply('msg1', 42)
+
+        result = results.AsyncResult(self.socket, 'msg1')
+        self.assertTrue(result.ready())
+        self.assertEqual(42, result.get(timeout=1))
+        self.assertFalse(send_mock.called)
+
+    @mock.patch('eventmq.client.results.send_emqp_message')
+    def test_get_timeout(self, send_mock):
+        result = results.AsyncResult(self.socket, 'msg1')
+
+        with self.assertRaises(exceptions.ResultTimeoutError):
+            result.get(timeout=0)
+
+        # Asked the router for the result once
+        send_mock.assert_called_once_with(self.socket, 'RESULT', ('msg1', ))
+
+    @mock.patch('eventmq.client.results.send_emqp_message')
+    def test_gather(self, send_mock):
+        self.reply('msg2', '"two"')
+
+        def send_emqp_message(socket, command, msgids):
+            # The router answers the RESULT command
+            self.reply('msg1', 1)
+            self.reply('msg3', 3)
+
+        send_mock.side_effect = send_emqp_message
+
+        handles = [results.AsyncResult(self.socket, m)
+                   for m in ('msg1', 'msg2', 'msg3')]
+        self.assertEqual([1, 'two', 3], results.gather(handles, timeout=1))
+        send_mock.assert_called_once_with(self.socket, 'RESULT',
+                                          ('msg1', 'msg3'))
+
+    @mock.patch('eventmq.client.results.send_emqp_message')
+    def test_get_not_found(self, send_mock):
+        def send_emqp_message(socket, command, msgids):
+            self.inbox.append(['', 'eMQP/1.0', 'REPLY', 'r-msg1', 'msg1',
+                               '{"error": "No result for msg1"}'])
+
+        send_mock.side_effect = send_emqp_message
+
+        result = results.AsyncResult(self.socket, 'msg1')
+        with self.assertRaises(exceptions.ResultNotFoundError):
+            result.get(timeout=1)
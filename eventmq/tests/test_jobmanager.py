@@ -12,12 +12,14 @@
 #
 # You should have received a copy of the GNU Lesser General Public License
 # along with eventmq.  If not, see <http://www.gnu.org/licenses/>.
+import os
 import time
 import unittest
 
 import mock
 
-from .. import conf, constants, jobmanager
+from .. import conf, constants, jobmanager, worker
+from ..utils.timeutils import monotonic
 
 ADDR = 'inproc://pour_the_rice_in_the_thing'
 
@@ -44,6 +46,23 @@ class TestCase(unittest.TestCase):
 
         sndmsg_mock.assert_called_with(jm.outgoing, 'READY')
 
+    @mock.patch('eventmq.jobmanager.sendmsg')
+    def test_ready_reports_finished_jobs(self, sndmsg_mock):
+        jm = jobmanager.JobManager()
+
+        jm.worker_done({'value': None}, 'msg1', False, 1)
+        sndmsg_mock.assert_called_with(jm.outgoing, 'READY', ('msg1', ))
+
+        # A worker that died can't send READY, so the job is reported when
+        # its replacement is ready
+        sndmsg_mock.reset_mock()
+        jm.worker_done({'value': 'TimeoutError'}, 'msg2', True, 1)
+        self.assertFalse(sndmsg_mock.called)
+
+        jm.worker_ready(None, None, False, 2)
+        sndmsg_mock.assert_called_with(jm.outgoing, 'READY', ('msg2', ))
+        self.assertEqual([], jm.unreported_msgids)
+
     @mock.patch('multiprocessing.pool.Pool.close')
     @mock.patch('eventmq.jobmanager.JobManager.process_message')
     @mock.patch('eventmq.jobmanager.Sender.recv_multipart')
@@ -94,6 +113,490 @@ class TestCase(unittest.TestCase):
 
         jm.on_request(_msgid, _msg)
 
+    @mock.patch('eventmq.jobmanager.sendmsg')
+    def test_retry_failed_job(self, sendmsg_mock):
+        _msgid = 'aaa0j8-ac40jf0-04tjv'
+        _msg = ['a', 'retry-count:1,reply-requested', '["run", {"a": 1}]']
+
+        jm = jobmanager.JobManager()
+        jm.request_queue = mock.Mock()
+        jm.on_request(_msgid, _msg)
+
+        failure = {'msgid': _msgid, 'return': {'value': 'boom'},
+                   'death': False, 'failed': True, 'pid': 1,
+                   'callback': 'worker_done_with_reply'}
+
+        # First failure is retried. The job keeps its slot while it waits,
+        # so nothing is sent
+        jm.handle_response(failure)
+        self.assertFalse(sendmsg_mock.called)
+        self.assertEqual(1, len(jm.retry_queue))
+        self.assertNotIn(_msgid, jm.jobs_in_flight)
+
+        # Not due yet
+        jm.release_due_retries(now=jm.retry_queue[0][0] - 0.1)
+        self.assertEqual(1, jm.request_queue.put.call_count)
+
+        jm.release_due_retries(now=jm.retry_queue[0][0])
+        self.assertEqual(2, jm.request_queue.put.call_count)
+        self.assertEqual([], jm.retry_queue)
+        self.assertIn(_msgid, jm.jobs_in_flight)
+
+        # Out of retries, the failure is replied and dead lettered, and the
+        # slot is given back
+        jm.handle_response(failure)
+        sendmsg_mock.assert_any_call(jm.outgoing, 'REPLY',
+                                     ['{"value": "boom"}', _msgid])
+        sendmsg_mock.assert_called_with(jm.outgoing, 'READY', (_msgid, ))
+        self.assertEqual(0, jm.busy_slots)
+        self.assertEqual(1, len(jm.dead_letters))
+        self.assertEqual(2, jm.dead_letters[0]['attempts'])
+        self.assertEqual('boom', jm.dead_letters[0]['error'])
+
+    @mock.patch('eventmq.jobmanager.sendmsg')
+    def test_batch_jobs(self, sendmsg_mock):
+        body = '["run", {"path": "os", "callable": "getcwd", "args": [%d]}]'
+
+        jm = jobmanager.JobManager()
+        jm.request_queue = mock.Mock()
+
+        with mock.patch.dict(conf.BATCH_QUEUES, {'small': 3}):
+            # The first job keeps its slot, the others give theirs back
+            jm.on_request('m1', ['small', 'reply-requested', body % 1])
+            self.assertFalse(sendmsg_mock.called)
+            jm.on_request('m2', ['small', '', body % 2])
+            sendmsg_mock.assert_called_once_with(jm.outgoing, 'READY')
+            self.assertFalse(jm.request_queue.put.called)
+
+            # Jobs for other queues aren't batched
+            jm.on_request('m4', ['default', '', body % 4])
+            self.assertEqual(1, jm.request_queue.put.call_count)
+
+            # The batch is sent once it's full
+            jm.on_request('m3', ['small', '', body % 3])
+            self.assertEqual({}, jm.pending_batches)
+
+        batch = jm.request_queue.put.call_args[0][0]
+        self.assertEqual(['m1', 'm2', 'm3'], batch['batch'])
+        self.assertEqual([[1], [2], [3]],
+                         [p['args'] for p in batch['params']['batch']])
+
+        # The results are reported at once
+        sendmsg_mock.reset_mock()
+        jm.handle_response({
+            'msgid': None, 'return': None, 'death': False, 'failed': False,
+            'pid': 1, 'batch': [
+                {'msgid': m, 'return': {'value': m}, 'failed': False}
+                for m in ('m1', 'm2', 'm3')]})
+
+        sendmsg_mock.assert_any_call(jm.outgoing, 'REPLY',
+                                     ['{"value": "m1"}', 'm1'])
+        sendmsg_mock.assert_called_with(jm.outgoing, 'READY',
+                                        ('m1', 'm2', 'm3'))
+        self.assertEqual(3, jm.pid_distribution[1])
+        self.assertEqual(['m4'], list(jm.jobs_in_flight))
+
+    @mock.patch('eventmq.jobmanager.sendmsg')
+    def test_batch_retries(self, sendmsg_mock):
+        body = '["run", {"path": "os", "callable": "getcwd"}]'
+
+        jm = jobmanager.JobManager()
+        jm.request_queue = mock.Mock()
+
+        with mock.patch.dict(conf.BATCH_QUEUES, {'small': 3}):
+            for msgid in ('m1', 'm2', 'm3'):
+                jm.on_request(msgid, ['small', 'retry-count:1', body])
+
+        sendmsg_mock.reset_mock()
+        jm.handle_response({
+            'msgid': None, 'return': None, 'death': False, 'failed': True,
+            'pid': 1, 'batch': [
+                {'msgid': 'm1', 'return': {'value': 1}, 'failed': False},
+                {'msgid': 'm2', 'return': {'value': 'boom'}, 'failed': True},
+                {'msgid': 'm3', 'return': {'value': 'boom'}, 'failed': True}]})
+
+        # The batch's slot is kept for the first retry, so m1 is reported
+        # without giving it back
+        sendmsg_mock.assert_called_once_with(jm.outgoing, 'RETIRE', ('m1', ))
+        self.assertEqual(0, jm.busy_slots)
+
+        jm.release_due_retries(now=monotonic() + 3600)
+        self.assertEqual(2, jm.busy_slots)
+
+        # Only the retry that kept the slot gives it back
+        sendmsg_mock.reset_mock()
+        for msgid in ('m2', 'm3'):
+            jm.handle_response({'msgid': msgid, 'return': {'value': 1},
+                                'death': False, 'failed': False, 'pid': 1,
+                                'callback': 'worker_done'})
+        self.assertEqual([
+            mock.call(jm.outgoing, 'READY', ('m2', )),
+            mock.call(jm.outgoing, 'RETIRE', ('m3', )),
+        ], sendmsg_mock.call_args_list)
+        self.assertEqual(0, jm.busy_slots)
+
+    def test_batch_linger(self):
+        body = '["run", {"path": "os", "callable": "getcwd"}]'
+
+        jm = jobmanager.JobManager()
+        jm.request_queue = mock.Mock()
+
+        with mock.patch.dict(conf.BATCH_QUEUES, {'small': 10}):
+            jm.on_request('m1', ['small', '', body])
+
+        send_at = list(jm.pending_batches.values())[0][0]
+        jm.release_due_batches(now=send_at - 0.01)
+        self.assertFalse(jm.request_queue.put.called)
+
+        # A batch of 1 is sent as a normal job
+        jm.release_due_batches(now=send_at)
+        self.assertEqual('m1', jm.request_queue.put.call_args[0][0]['msgid'])
+        self.assertEqual({}, jm.pending_batches)
+
+    @mock.patch('eventmq.jobmanager.sendmsg')
+    def test_return_queued_jobs(self, sendmsg_mock):
+        body = '["run", {"path": "os", "callable": "getcwd"}]'
+
+        jm = jobmanager.JobManager()
+        jm.on_request('m1', ['default', '', body])
+        jm.on_request('m2', ['default', 'reply-requested', body])
+        with mock.patch.dict(conf.BATCH_QUEUES, {'small': 10}):
+            jm.on_request('m3', ['small', '', body])
+        self.assertEqual(2, jm.busy_slots)
+
+        # A worker started m1, so only m2 and m3 are returned
+        self.assertEqual('m1', jm.request_queue.get()['msgid'])
+        jm.request_queue.put('DONE')
+
+        jm.return_jobs(jm.take_queued_jobs())
+
+        # The router puts them at the head of the queue, so the last one is
+        # returned first
+        self.assertEqual([
+            mock.call(jm.outgoing, 'RETURN', ['m3', 'small', '', body]),
+            mock.call(jm.outgoing, 'RETURN',
+                      ['m2', 'default', 'reply-requested', body]),
+        ], sendmsg_mock.call_args_list)
+        self.assertEqual(['m1'], list(jm.jobs_in_flight))
+        self.assertEqual(['m1'], list(jm.job_requests))
+        self.assertEqual({}, jm.pending_batches)
+        self.assertEqual(1, jm.busy_slots)
+
+        # Requests for the workers to stop stay on the queue
+        self.assertEqual('DONE', jm.request_queue.get(timeout=1))
+
+    @mock.patch('eventmq.jobmanager.sendmsg')
+    def test_return_retried_job(self, sendmsg_mock):
+        body = '["run", {"path": "os", "callable": "getcwd"}]'
+
+        jm = jobmanager.JobManager()
+        jm.on_request('m1', ['default', 'retry-count:2,timeout:5', body])
+        jm.request_queue.get()
+        jm.handle_response({'msgid': 'm1', 'return': {'value': 'boom'},
+                            'death': False, 'failed': True, 'pid': 1,
+                            'callback': 'worker_done'})
+        self.assertEqual(0, jm.busy_slots)
+
+        sendmsg_mock.reset_mock()
+        jm.return_jobs(jm.take_queued_jobs())
+
+        # It's returned with the retries it has left
+        sendmsg_mock.assert_called_once_with(
+            jm.outgoing, 'RETURN', ['m1', 'default', 'retry-count:1,timeout:5',
+                                    body])
+        self.assertEqual([], jm.retry_queue)
+
+    @mock.patch('eventmq.jobmanager.sendmsg')
+    def test_resume_after_reset(self, sendmsg_mock):
+        body = '["run", {"path": "os", "callable": "getcwd"}]'
+
+        jm = jobmanager.JobManager()
+        jm._workers = {1: mock.Mock(), 2: mock.Mock(), 3: mock.Mock()}
+        jm.on_request('m1', ['default', '', body])
+        jm.on_request('m2', ['default', '', body])
+        # m1 is running
+        jm.request_queue.get()
+
+        jm.reset()
+        self.assertTrue(jm.resuming)
+        self.assertEqual(['m2'], [p['msgid'] for p in jm.held_jobs])
+        self.assertFalse(sendmsg_mock.called)
+
+        # Once the new connection is ACKed m2 is returned, and the 2 slots
+        # that aren't running m1 are READY
+        jm.on_ack('ack1', ['inform1'])
+        self.assertEqual([
+            mock.call(jm.outgoing, 'RETURN', ['m2', 'default', '', body]),
+            mock.call(jm.outgoing, 'READY'),
+            mock.call(jm.outgoing, 'READY'),
+        ], sendmsg_mock.call_args_list)
+        self.assertFalse(jm.resuming)
+        self.assertEqual([], jm.held_jobs)
+
+        sendmsg_mock.reset_mock()
+        jm.on_ack('ack2', ['inform2'])
+        self.assertFalse(sendmsg_mock.called)
+
+    @mock.patch('eventmq.jobmanager.sendmsg')
+    def test_shared_bodies(self, sendmsg_mock):
+        body = '["run", {"path": "os", "callable": "getcwd", ' \
+            '"args": ["%s"]}]' % ('x' * 100)
+
+        jm = jobmanager.JobManager()
+        with mock.patch.object(conf, 'SHARED_MEMORY_THRESHOLD', 100):
+            jm.on_request('m1', ['default', '', body])
+            jm.on_request('m2', ['default', 'retry-count:1', body])
+            jm.on_request('small', ['default', '', '["run", {"a": 1}]'])
+
+        # Only the path of a large body goes to the worker
+        path = jm.request_queue.get()['params']['shared_body']
+        with open(path) as f:
+            self.assertEqual(body, f.read())
+        self.assertEqual(['m1', 'm2'], sorted(jm.shared_bodies))
+        self.assertEqual({'a': 1}, jm.jobs_in_flight['small'][1]['params'])
+
+        # The body is removed once the job is done
+        jm.handle_response({'msgid': 'm1', 'return': {'value': 1},
+                            'death': False, 'failed': False, 'pid': 1,
+                            'callback': 'worker_done'})
+        self.assertFalse(os.path.exists(path))
+
+        # A job that's retried keeps its body, and the dead letter gets the
+        # decoded params
+        path = jm.shared_bodies['m2']
+        resp = {'msgid': 'm2', 'return': {'value': 'boom'}, 'death': False,
+                'failed': True, 'pid': 1, 'callback': 'worker_done'}
+        jm.handle_response(resp)
+        self.assertTrue(os.path.exists(path))
+        jm.release_due_retries(now=monotonic() + 3600)
+        jm.handle_response(resp)
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual(['x' * 100], jm.dead_letters[-1]['params']['args'])
+        self.assertEqual({}, jm.shared_bodies)
+
+    @mock.patch('eventmq.jobmanager.sendmsg')
+    def test_shared_text_body(self, sendmsg_mock):
+        body = u'["run", {"path": "os", "callable": "getcwd", ' \
+            u'"args": ["%s"]}]' % (u'\xe9' * 100)
+
+        jm = jobmanager.JobManager()
+        with mock.patch.object(conf, 'SHARED_MEMORY_THRESHOLD', 100):
+            jm.on_request('m1', ['default', '', body])
+
+        # Text is written encoded, and the worker decodes it the same way
+        params = jm.request_queue.get()['params']
+        with open(params['shared_body'], 'rb') as f:
+            self.assertEqual(body.encode('utf-8'), f.read())
+        with mock.patch('eventmq.worker._run_job',
+                        return_value=(1, False)) as run_job_mock:
+            worker._execute(params, jobmanager.logger)
+        self.assertEqual([u'\xe9' * 100],
+                         run_job_mock.call_args[0][0]['args'])
+
+        jm.release_shared_body('m1')
+
+        # A body that can't be written is sent inline
+        with mock.patch.object(conf, 'SHARED_MEMORY_THRESHOLD', 100), \
+                mock.patch('eventmq.jobmanager.write_shared',
+                           side_effect=TypeError('boom')):
+            jm.on_request('m2', ['default', '', body])
+
+        self.assertEqual([u'\xe9' * 100],
+                         jm.request_queue.get()['params']['args'])
+        self.assertEqual({}, jm.shared_bodies)
+
+    @mock.patch('eventmq.worker.AsyncioExecutor.start')
+    @mock.patch('eventmq.worker.ThreadExecutor.start')
+    def test_start_executors(self, thread_start_mock, asyncio_start_mock):
+        jm = jobmanager.JobManager()
+        with mock.patch.dict(conf.QUEUE_EXECUTORS,
+                             {'a': 'thread', 'b': 'asyncio', 'c': 'process',
+                              'd': 'fibers'}):
+            jm.start_executors()
+
+        self.assertEqual(['asyncio', 'thread'], sorted(jm.executors))
+        for name, executor in jm.executors.items():
+            self.assertEqual(name, executor.name)
+            self.assertIs(jm.executor_results, executor.output_queue)
+
+    @mock.patch('eventmq.jobmanager.sendmsg')
+    def test_queue_executors(self, sendmsg_mock):
+        body = '["run", {"path": "os", "callable": "getcwd"}]'
+
+        jm = jobmanager.JobManager()
+        jm._workers = {1: mock.Mock(), 2: mock.Mock()}
+        jm.pool_size = 2
+        executor = worker.ThreadExecutor(jm.executor_results, size=3)
+        jm.executors['thread'] = executor
+
+        with mock.patch.dict(conf.QUEUE_EXECUTORS, {'io': 'thread'}):
+            jm.on_request('m1', ['io', '', body])
+            jm.on_request('m2', ['default', '', body])
+            jm.on_request('m3', ['io', '', body])
+
+            # The jobs of the io queue go to the thread executor, and its
+            # slots are counted apart from the worker processes'
+            self.assertEqual(['m1', 'm3'],
+                             [executor.input_queue.get()['msgid'],
+                              executor.input_queue.get()['msgid']])
+            self.assertEqual(2, executor.busy)
+            self.assertEqual(1, jm.busy_slots)
+
+            jm.handle_response({'msgid': 'm1', 'return': {'value': 1},
+                                'death': False, 'failed': False, 'pid': 1,
+                                'callback': 'worker_done',
+                                'executor': 'thread'})
+            self.assertEqual(1, executor.busy)
+            self.assertEqual(1, jm.busy_slots)
+            sendmsg_mock.assert_called_once_with(jm.outgoing, 'READY',
+                                                 ('m1', ))
+
+            jm.on_request('m4', ['io', '', body])
+            jm.reset()
+            self.assertEqual(['m2', 'm4'],
+                             [p['msgid'] for p in jm.held_jobs])
+            self.assertEqual(1, executor.busy)
+
+            # m3 is still running, so 2 of the executor's 3 slots and both
+            # worker processes are READY
+            sendmsg_mock.reset_mock()
+            jm.on_ack('ack1', ['inform1'])
+            self.assertEqual(2, sendmsg_mock.call_args_list.count(
+                mock.call(jm.outgoing, 'RETURN', mock.ANY)))
+            self.assertEqual(4, sendmsg_mock.call_args_list.count(
+                mock.call(jm.outgoing, 'READY')))
+
+    @mock.patch('eventmq.jobmanager.JobManager.start_worker')
+    def test_check_due_worker_health(self, start_worker_mock):
+        jm = jobmanager.JobManager()
+        jm.status = constants.STATUS.running
+        jm.pool_size = 2
+        jm.busy_slots = 2
+        workers = [mock.Mock(pid=pid) for pid in (1, 2)]
+        jm._workers = {w.pid: w for w in workers}
+
+        def start_worker():
+            w = mock.Mock(pid=len(workers) + 1)
+            workers.append(w)
+            jm._workers[w.pid] = w
+        start_worker_mock.side_effect = start_worker
+
+        # A busy jobmanager isn't sent HEARTBEATs, so it replaces the worker
+        # that died on its own
+        jm.worker_death({}, 'm1', True, 2)
+        with mock.patch.object(conf, 'HEARTBEAT_INTERVAL', 5):
+            jm.check_due_worker_health(now=100)
+            start_worker_mock.assert_called_once_with()
+            self.assertEqual([1, 3], sorted(jm._workers))
+
+            # The next check is an interval later
+            start_worker_mock.reset_mock()
+            workers[0].is_alive.return_value = False
+            jm.check_due_worker_health(now=104)
+            self.assertFalse(start_worker_mock.called)
+            jm.check_due_worker_health(now=105)
+            start_worker_mock.assert_called_once_with()
+            self.assertEqual([3, 4], sorted(jm._workers))
+
+    @mock.patch('eventmq.jobmanager.JobManager.check_worker_health')
+    @mock.patch('eventmq.jobmanager.JobManager.start_worker')
+    def test_autoscale(self, start_worker_mock, check_health_mock):
+        jm = jobmanager.JobManager()
+        jm.request_queue = mock.Mock()
+        jm._workers = {}
+        jm.status = constants.STATUS.running
+        jm.pool_size = 2
+
+        with mock.patch.multiple(conf, MIN_CONCURRENT_JOBS=1,
+                                 MAX_CONCURRENT_JOBS=8, SCALE_UP_WINDOW=5,
+                                 SCALE_DOWN_COOLDOWN=60):
+            # Busy for less than the window without a backlog
+            jm.busy_slots = 2
+            jm.autoscale(now=100)
+            jm.autoscale(now=104)
+            self.assertFalse(start_worker_mock.called)
+
+            jm.autoscale(now=105)
+            self.assertEqual(3, jm.pool_size)
+
+            # The backlog reported with a HEARTBEAT grows the pool at once,
+            # up to the max
+            jm.busy_slots = 3
+            jm.on_heartbeat('hb1', ['1234.5', '10'])
+            jm.autoscale(now=106)
+            self.assertEqual(8, jm.pool_size)
+            self.assertEqual(6, start_worker_mock.call_count)
+
+            # Idle workers are retired one at a time after the cooldown
+            jm.busy_slots = 0
+            jm.autoscale(now=107)
+            jm.autoscale(now=166)
+            self.assertEqual(8, jm.pool_size)
+            jm.autoscale(now=167)
+            self.assertEqual(7, jm.pool_size)
+            jm.request_queue.put.assert_called_once_with('DONE')
+            jm.autoscale(now=200)
+            self.assertEqual(7, jm.pool_size)
+
+        # Disabled
+        jm.autoscale(now=1000)
+        self.assertEqual(7, jm.pool_size)
+
+    @mock.patch('eventmq.jobmanager.sendmsg')
+    def test_retired_slots_are_not_ready(self, sendmsg_mock):
+        jm = jobmanager.JobManager()
+        jm.request_queue = mock.Mock()
+        jm.scale_down()
+
+        # The slot of the next job to finish is kept
+        jm.send_ready('m1')
+        sendmsg_mock.assert_called_once_with(jm.outgoing, 'RETIRE', ('m1', ))
+        self.assertEqual(0, jm.surplus_slots)
+
+        jm.send_ready('m2')
+        sendmsg_mock.assert_called_with(jm.outgoing, 'READY', ('m2', ))
+
+    @mock.patch('eventmq.jobmanager.sendmsg')
+    def test_record_worker_stats(self, sendmsg_mock):
+        jm = jobmanager.JobManager()
+        jm._workers = {1: mock.Mock()}
+
+        jm.handle_response({'msgid': 'm1', 'return': {'value': 1},
+                            'death': False, 'failed': False, 'pid': 1,
+                            'callback': 'worker_done', 'rss': 1024,
+                            'recycle': None})
+        self.assertEqual({1: 1024}, jm.pid_rss)
+        self.assertEqual({}, jm.recycled_workers)
+
+        jm.handle_response({'msgid': 'm2', 'return': {'value': 1},
+                            'death': True, 'failed': False, 'pid': 1,
+                            'callback': 'worker_done', 'rss': 4096,
+                            'recycle': 'rss_growth'})
+        self.assertEqual({'rss_growth': 1}, jm.recycled_workers)
+        self.assertEqual({1: 4096}, jm.pid_rss)
+
+        jm.handle_response({'msgid': None, 'return': 'DEATH', 'death': True,
+                            'pid': 1, 'callback': 'worker_death'})
+        self.assertEqual({}, jm.pid_rss)
+
+        jm.handle_response({'msgid': 'm3', 'return': {'value': 'TimeoutError'},
+                            'death': False, 'failed': True, 'pid': 2,
+                            'callback': 'worker_done', 'rss': 1024,
+                            'recycle': None,
+                            'timeout': {'seconds': 30, 'hard': False}})
+        self.assertEqual({('soft', ): 1}, jm.timeouts_metric.values)
+
+    @mock.patch('eventmq.jobmanager.random.uniform')
+    def test_retry_delay(self, uniform_mock):
+        uniform_mock.side_effect = lambda a, b: b
+
+        self.assertEqual(conf.RETRY_BACKOFF_BASE,
+                         jobmanager.JobManager.retry_delay(1))
+        self.assertEqual(conf.RETRY_BACKOFF_BASE * 4,
+                         jobmanager.JobManager.retry_delay(3))
+        self.assertEqual(conf.RETRY_BACKOFF_MAX,
+                         jobmanager.JobManager.retry_delay(100))
+
     @mock.patch('eventmq.jobmanager.sendmsg')
     @mock.patch('zmq.Socket.unbind')
     def test_on_disconnect(self, socket_mock, sendmsg_mock):
@@ -123,11 +626,34 @@ class TestCase(unittest.TestCase):
     @mock.patch('eventmq.jobmanager.sendmsg')
     def test_sigterm_handler(self, sendmsg_mock):
         jm = jobmanager.JobManager()
+        jm.awaiting_startup_ack = True
 
         jm.sigterm_handler(13231, "FRAMEY the evil frame")
 
-        sendmsg_mock.assert_called_with(jm.outgoing, constants.KBYE)
+        # The event loop does the work
+        self.assertFalse(sendmsg_mock.called)
+        self.assertTrue(jm.shutdown_requested)
         self.assertFalse(jm.awaiting_startup_ack)
+        self.assertFalse(jm.received_disconnect)
+
+    @mock.patch('eventmq.jobmanager.sys.exit', side_effect=SystemExit)
+    @mock.patch('eventmq.jobmanager.sendmsg')
+    def test_shutdown_returns_jobs(self, sendmsg_mock, exit_mock):
+        body = '["run", {"path": "os", "callable": "getcwd"}]'
+
+        jm = jobmanager.JobManager()
+        jm._workers = {}
+        jm.on_request('m1', ['default', '', body])
+
+        jm.sigterm_handler(13231, "FRAMEY the evil frame")
+        with self.assertRaises(SystemExit):
+            jm._start_event_loop()
+
+        # RETURN is sent before KBYE, the router ignores the worker after it
+        self.assertEqual([
+            mock.call(jm.outgoing, 'RETURN', ['m1', 'default', '', body]),
+            mock.call(jm.outgoing, constants.KBYE),
+        ], sendmsg_mock.call_args_list)
         self.assertTrue(jm.received_disconnect)
 
     @mock.patch('eventmq.jobmanager.JobManager.start')
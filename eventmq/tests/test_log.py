@@ -0,0 +1,125 @@
+# This file is part of eventmq.
+#
+# eventmq is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 2.1 of the License, or (at your option)
+# any later version.
+#
+# eventmq is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with eventmq.  If not, see <http://www.gnu.org/licenses/>.
+import logging
+import time
+import unittest
+
+import mock
+
+from .. import conf, log
+
+
+class RecordingHandler(logging.Handler):
+    def __init__(self):
+        super(RecordingHandler, self).__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+class TestCase(unittest.TestCase):
+    def test_queue_handler(self):
+        target = RecordingHandler()
+        handler = log.QueueHandler(target)
+
+        logger = logging.getLogger('eventmq.tests.queued')
+        logger.addHandler(handler)
+        self.addCleanup(logger.removeHandler, handler)
+        logger.setLevel(logging.INFO)
+
+        logger.info('Job %s done', 'msg1')
+
+        # Wait for the listener thread to handle it
+        for _ in range(100):
+            if target.records:
+                break
+            time.sleep(0.01)
+
+        self.assertEqual('Job msg1 done', target.records[0].getMessage())
+
+    def test_queue_handler_formats_message(self):
+        target = RecordingHandler()
+        handler = log.QueueHandler(target)
+        handler.listener = mock.Mock()
+        handler.listener.queue = log.Queue.Queue()
+
+        # The arguments are formatted when the record is logged, not when the
+        # listener thread handles it
+        workers = {'w1': 1}
+        record = logging.LogRecord('x', logging.INFO, __file__, 1,
+                                   'Workers: %s', (workers, ), None)
+        handler.emit(record)
+        workers['w2'] = 2
+
+        queued = handler.listener.queue.get_nowait()[1]
+        self.assertEqual("Workers: {'w1': 1}", queued.getMessage())
+        self.assertIsNone(queued.args)
+        # The record other handlers get is unchanged
+        self.assertIs(workers, record.args)
+
+    def test_queue_handler_full(self):
+        target = RecordingHandler()
+        handler = log.QueueHandler(target)
+        handler.listener = mock.Mock()
+        handler.listener.queue = log.Queue.Queue(1)
+
+        record = logging.LogRecord('x', logging.INFO, __file__, 1, 'msg',
+                                   (), None)
+        handler.emit(record)
+        handler.emit(record)
+
+        # Logging never blocks, records are dropped instead
+        self.assertEqual(1, handler.dropped)
+
+    def test_queue_handler_forked(self):
+        target = RecordingHandler()
+        handler = log.QueueHandler(target)
+        handler.pid = -1
+
+        record = logging.LogRecord('x', logging.INFO, __file__, 1, 'msg',
+                                   (), None)
+        handler.emit(record)
+
+        # Forked processes don't have the listener thread
+        self.assertEqual([record], target.records)
+
+    def test_queue_handler_forked_lock(self):
+        target = RecordingHandler()
+        handler = log.QueueHandler(target)
+        handler.pid = -1
+
+        # The listener thread held the lock when the process was forked
+        target.acquire()
+        held_lock = target.lock
+
+        record = logging.LogRecord('x', logging.INFO, __file__, 1, 'msg',
+                                   (), None)
+        handler.emit(record)
+        handler.emit(record)
+
+        self.assertIsNot(held_lock, target.lock)
+        self.assertEqual([record, record], target.records)
+
+    def test_setup_logger_level(self):
+        with mock.patch.multiple(conf, LOG_LEVEL='WARNING', SUPER_DEBUG=False):
+            logger = log.setup_logger('eventmq.tests.level', queued=False)
+        self.assertFalse(logger.isEnabledFor(logging.INFO))
+        self.assertIsInstance(logger.handlers[-1], logging.StreamHandler)
+
+        with mock.patch.multiple(conf, LOG_LEVEL='WARNING', SUPER_DEBUG=True):
+            logger = log.setup_logger('eventmq.tests.level', queued=True)
+        self.assertTrue(logger.isEnabledFor(logging.DEBUG))
+        self.assertIsInstance(logger.handlers[-1], log.QueueHandler)
@@ -0,0 +1,89 @@
+# This file is part of eventmq.
+#
+# eventmq is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 2.1 of the License, or (at your option)
+# any later version.
+#
+# eventmq is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with eventmq.  If not, see <http://www.gnu.org/licenses/>.
+import sys
+import unittest
+
+from .. import metrics
+
+if sys.version[0] == '2':
+    from urllib2 import urlopen
+else:
+    from urllib.request import urlopen
+
+
+class TestCase(unittest.TestCase):
+    def test_counter(self):
+        registry = metrics.MetricsRegistry()
+        counter = registry.counter('emq_requests', 'Requests', ('queue', ))
+
+        counter.inc(('default', ))
+        counter.inc(('default', ), amount=2)
+        counter.inc(('a"b', ))
+
+        self.assertEqual(
+            '# HELP emq_requests Requests\n'
+            '# TYPE emq_requests counter\n'
+            'emq_requests_total{queue="a\\"b"} 1\n'
+            'emq_requests_total{queue="default"} 3\n'
+            '# EOF\n',
+            registry.render())
+
+    def test_gauge_func(self):
+        registry = metrics.MetricsRegistry()
+        state = {'q1': 4}
+        registry.gauge('emq_waiting', 'Waiting', ('queue', ),
+                       func=lambda: {(q, ): len_ for q, len_ in state.items()})
+        registry.gauge('emq_broken', 'Broken', func=lambda: 1 // 0)
+
+        self.assertIn('emq_waiting{queue="q1"} 4\n', registry.render())
+
+        # The gauge is computed when it's scraped
+        state['q1'] = 0
+        self.assertIn('emq_waiting{queue="q1"} 0\n', registry.render())
+
+        # A broken gauge doesn't break the others
+        self.assertNotIn('\nemq_broken ', registry.render())
+
+    def test_histogram(self):
+        histogram = metrics.Histogram('emq_duration_seconds', 'Duration',
+                                      buckets=(1, 5))
+
+        histogram.observe(0.5)
+        histogram.observe(1)
+        histogram.observe(7)
+
+        self.assertEqual([
+            '# HELP emq_duration_seconds Duration',
+            '# TYPE emq_duration_seconds histogram',
+            'emq_duration_seconds_bucket{le="1.0"} 2',
+            'emq_duration_seconds_bucket{le="5.0"} 2',
+            'emq_duration_seconds_bucket{le="+Inf"} 3',
+            'emq_duration_seconds_count 3',
+            'emq_duration_seconds_sum 8.5',
+        ], histogram.render())
+
+    def test_metrics_server(self):
+        registry = metrics.MetricsRegistry()
+        registry.counter('emq_requests', 'Requests').inc()
+
+        server = metrics.start_metrics_server(registry, 0)
+        try:
+            response = urlopen('http://127.0.0.1:{}/metrics'.format(
+                server.httpd.server_port))
+            self.assertEqual(metrics.CONTENT_TYPE,
+                             response.info()['Content-Type'])
+            self.assertIn('emq_requests_total 1', response.read().decode())
+        finally:
+            server.stop()
@@ -0,0 +1,98 @@
+# This file is part of eventmq.
+#
+# eventmq is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 2.1 of the License, or (at your option)
+# any later version.
+#
+# eventmq is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with eventmq.  If not, see <http://www.gnu.org/licenses/>.
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+from .. import resultstore
+
+
+class TestCase(unittest.TestCase):
+    def test_memory_result_store_lru(self):
+        store = resultstore.MemoryResultStore(ttl=60, max_entries=2)
+
+        store.set('msg1', 'one')
+        store.set('msg2', 'two')
+        # Reading msg1 makes msg2 the least recently used
+        self.assertEqual('one', store.get('msg1'))
+        store.set('msg3', 'three')
+
+        self.assertEqual(2, len(store))
+        self.assertIsNone(store.get('msg2'))
+        self.assertEqual('one', store.get('msg1'))
+        self.assertEqual('three', store.get('msg3'))
+
+    @mock.patch('eventmq.resultstore.monotonic')
+    def test_memory_result_store_ttl(self, monotonic_mock):
+        monotonic_mock.return_value = 100
+        store = resultstore.MemoryResultStore(ttl=10)
+        store.set('msg1', 'one')
+
+        monotonic_mock.return_value = 109
+        self.assertEqual('one', store.get('msg1'))
+
+        monotonic_mock.return_value = 110
+        self.assertIsNone(store.get('msg1'))
+        self.assertEqual(0, len(store))
+
+    def test_file_result_store(self):
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+
+        store = resultstore.FileResultStore(ttl=10, path=path)
+        store.set('msg1', '{"value": 1}')
+        self.assertEqual('{"value": 1}', store.get('msg1'))
+        self.assertIsNone(store.get('msg2'))
+
+        store.ttl = -1
+        self.assertIsNone(store.get('msg1'))
+
+    @mock.patch('eventmq.resultstore.timestamp')
+    def test_file_result_store_sweep(self, timestamp_mock):
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+
+        timestamp_mock.return_value = 100
+        store = resultstore.FileResultStore(ttl=10, path=path, max_entries=2)
+        store.set('msg1', 'one')
+        timestamp_mock.return_value = 105
+        store.set('msg2', 'two')
+
+        # Results nobody read are removed once they expire
+        timestamp_mock.return_value = 110
+        store.set('msg3', 'three')
+        self.assertEqual(['msg2', 'msg3'], sorted(os.listdir(path)))
+
+        # and the oldest are removed when there are too many
+        store.set('msg4', 'four')
+        self.assertEqual(['msg3', 'msg4'], sorted(os.listdir(path)))
+        self.assertEqual(2, len(store))
+
+        # Results left by an earlier run are removed too
+        timestamp_mock.return_value = 1000
+        with open(os.path.join(path, 'msg3'), 'w') as f:
+            f.write('three')
+        store = resultstore.FileResultStore(ttl=3600, path=path,
+                                            max_entries=1)
+        self.assertEqual(1, len(store))
+
+    def test_get_result_store(self):
+        self.assertIsNone(resultstore.get_result_store(''))
+        self.assertIsNone(resultstore.get_result_store('nope'))
+        self.assertIsInstance(resultstore.get_result_store('memory'),
+                              resultstore.MemoryResultStore)
@@ -20,7 +20,9 @@ import mock
 from testfixtures import LogCapture
 import zmq
 
-from eventmq import conf, constants, exceptions, receiver, router
+from eventmq import (
+    conf, constants, exceptions, receiver, resultstore, router
+)
 from eventmq.utils.classes import EMQdeque
 from eventmq.utils.timeutils import monotonic
 
@@ -110,7 +112,7 @@ class TestCase(unittest.TestCase):
         # added to the list of workers
         self.assertIn(worker1_id, self.router.workers)
         self.assertIn(worker2_id, self.router.workers)
-        self.assertGreater(self.router.workers[worker1_id]['hb'], 0)
+        self.assertIn(worker1_id, self.router.worker_liveness)
         # no slots yet
         self.assertEqual(self.router.workers[worker1_id]['available_slots'], 0)
 
@@ -150,7 +152,7 @@ class TestCase(unittest.TestCase):
 
         # Verify that an ACK was sent for the INFORM
         self.router.outgoing.send_multipart.assert_called_with(
-            ('ACK', ack_msgid, orig_msgid),
+            ['ACK', ack_msgid, orig_msgid],
             constants.PROTOCOL_VERSION, _recipient_id=sender_id)
 
     def test_reset_heartbeat_counters(self):
@@ -171,34 +173,55 @@ class TestCase(unittest.TestCase):
         self.router.send_heartbeat(self.router.incoming, recipient_id)
 
         self.router.incoming.send_multipart.assert_called_with(
-            ('HEARTBEAT', msgid, str(ts)), constants.PROTOCOL_VERSION,
+            ['HEARTBEAT', msgid, str(ts)], constants.PROTOCOL_VERSION,
             _recipient_id=recipient_id)
 
     @mock.patch('eventmq.router.Router.send_heartbeat')
     def test_send_worker_heartbeats(self, send_heartbeat_mock):
         # last heartbeat should start at 0
         self.assertEqual(self.router._meta['last_sent_heartbeat'], 0)
-        self.router.workers = {
-            'w1': {
-                'queues': [(10, 'default'), ],
-                'hb': 123.2,
-                'available_slots': 3,
-            },
-            'w2': {
-                'queues': [(10, 'not-default'), ],
-                'hb': 123.2,
-                'available_slots': 2,
-            }
-        }
-        self.router.send_workers_heartbeats()
+        self.router.add_worker('w1', [(10, 'default')])
+        self.router.add_worker('w2', [(10, 'not-default')])
 
-        # After sending the heartbeat, it should be greater than 0 (note: this
-        # is very hard to mock)
-        self.assertGreater(self.router._meta['last_sent_heartbeat'], 0)
+        now = monotonic() + conf.HEARTBEAT_INTERVAL
+        self.router.send_workers_heartbeats(now)
 
+        self.assertEqual(self.router._meta['last_sent_heartbeat'], now)
         send_heartbeat_mock.assert_has_calls(
-            [mock.call(self.router.outgoing, 'w1'),
-             mock.call(self.router.outgoing, 'w2')], any_order=True)
+            [mock.call(self.router.outgoing, 'w1', backlog=0),
+             mock.call(self.router.outgoing, 'w2', backlog=0)],
+            any_order=True)
+
+        # Only workers that haven't been sent anything are due a heartbeat
+        send_heartbeat_mock.reset_mock()
+        self.router.worker_liveness.sent('w1', now + conf.HEARTBEAT_INTERVAL)
+        self.router.send_workers_heartbeats(now + conf.HEARTBEAT_INTERVAL)
+
+        send_heartbeat_mock.assert_called_once_with(self.router.outgoing, 'w2',
+                                                    backlog=0)
+
+    def test_worker_backlog(self):
+        self.router.add_worker('w1', [(10, 'default'), (5, 'other')])
+        self.router.waiting_messages = {
+            'default': EMQdeque(initial=[['m1'], ['m2']]),
+            'other': EMQdeque(initial=[['m3']]),
+            'unrelated': EMQdeque(initial=[['m4']]),
+        }
+
+        self.assertEqual(3, self.router.worker_backlog('w1'))
+        self.assertEqual(0, self.router.worker_backlog('unknown'))
+
+    @mock.patch('eventmq.router.Router.requeue_worker')
+    def test_on_retire(self, requeue_worker_mock):
+        self.router.add_worker('w1', [(10, 'default')])
+        self.router.job_latencies['m1'] = (monotonic(), 'default')
+
+        self.router.on_retire('w1', 'retire1', ['m1'])
+
+        # The job finished but its slot isn't given back
+        self.assertNotIn('m1', self.router.job_latencies)
+        self.assertFalse(requeue_worker_mock.called)
+        self.assertEqual(0, self.router.workers['w1']['available_slots'])
 
     @mock.patch('eventmq.router.Router.send_heartbeat')
     def test_send_schedulers_heartbeats(self, send_hb_mock):
@@ -321,6 +344,157 @@ class TestCase(unittest.TestCase):
         self.router.on_ready(worker2_id, ready_msgid2, ['READY', ready_msgid2])
         requeue_worker_mock.assert_called_with(worker2_id)
 
+    @mock.patch('eventmq.router.fwdmsg')
+    def test_on_ready_fair_share(self, fwdmsg_mock):
+        worker_id = 'w1'
+
+        self.router.workers = {
+            worker_id: {
+                'queues': [(20, 'heavy'), (10, 'light')],
+                'hb': monotonic(),
+                'available_slots': 0,
+            },
+        }
+        self.router.waiting_messages = {
+            'heavy': EMQdeque(initial=[
+                ['', constants.PROTOCOL_VERSION, 'REQUEST', 'h%d' % i,
+                 'heavy', '', 'job'] for i in range(10)]),
+            'light': EMQdeque(initial=[
+                ['', constants.PROTOCOL_VERSION, 'REQUEST', 'l%d' % i,
+                 'light', '', 'job'] for i in range(10)]),
+        }
+
+        for i in range(6):
+            self.router.on_ready(worker_id, 'ready%d' % i, [])
+
+        # heavy gets 2 jobs for every job from light
+        sent = [c[0][2][3] for c in fwdmsg_mock.call_args_list]
+        self.assertEqual(['h0', 'h1', 'l0', 'h2', 'h3', 'l1'], sent)
+
+        # Strict priority drains heavy first
+        with mock.patch.object(conf, 'QUEUE_FAIR_SHARE', False):
+            self.router.on_ready(worker_id, 'ready7', [])
+        self.assertEqual('h4', fwdmsg_mock.call_args[0][2][3])
+
+    @mock.patch('eventmq.router.fwdmsg')
+    def test_guaranteed_delivery(self, fwdmsg_mock):
+        self.router.workers = {
+            'w1': {'queues': [(10, 'default')], 'hb': monotonic(),
+                   'available_slots': 3},
+            'w2': {'queues': [(10, 'default')], 'hb': monotonic(),
+                   'available_slots': 0},
+        }
+        self.router.queues = {'default': [(10, 'w1'), (10, 'w2')]}
+
+        self.router.on_request('c1', 'm1', ['default', 'guarantee', 'job1'],
+                               ack=False)
+        self.router.on_request('c1', 'm2', ['default', '', 'job2'],
+                               ack=False)
+        self.router.on_request('c1', 'm3', ['default', 'guarantee,timeout:10',
+                                            'job3'], ack=False)
+
+        # Only the guaranteed jobs are tracked
+        self.assertIn('m1', self.router.deliveries)
+        self.assertNotIn('m2', self.router.deliveries)
+        # m3 may run for its timeout on top of the visibility timeout. m1
+        # has none, so it may run for the global timeout.
+        self.assertAlmostEqual(conf.GLOBAL_TIMEOUT - 10,
+                               self.router.deliveries.jobs['m1'][0] -
+                               self.router.deliveries.jobs['m3'][0], places=1)
+
+        # Finished jobs are acknowledged by READY
+        self.router.on_ready('w1', 'ready1', ['m1'])
+        self.assertNotIn('m1', self.router.deliveries)
+
+        # The jobs of a worker that goes away are sent again
+        self.router.on_request('c1', 'm4', ['default', 'guarantee', 'job4'],
+                               ack=False)
+        self.router._remove_worker('w1')
+        self.assertEqual(
+            ['m3', 'm4'],
+            [msg[3] for msg in self.router.waiting_messages['default']])
+        self.assertIn('default', self.router.limited_queues)
+        self.assertEqual(0, len(self.router.deliveries))
+
+        # And so are jobs that run past their visibility timeout
+        self.router.on_ready('w2', 'ready2', [])
+        self.assertEqual('m3', fwdmsg_mock.call_args[0][2][3])
+        self.assertIn('m3', self.router.deliveries.worker_jobs['w2'])
+
+        self.router.redeliver(self.router.deliveries.expired(
+            monotonic() + conf.VISIBILITY_TIMEOUT + 20))
+        self.assertEqual(
+            ['m3', 'm4'],
+            [msg[3] for msg in self.router.waiting_messages['default']])
+
+    @mock.patch('eventmq.router.fwdmsg')
+    def test_guaranteed_delivery_retries(self, fwdmsg_mock):
+        self.router.workers = {
+            'w1': {'queues': [(10, 'default')], 'hb': monotonic(),
+                   'available_slots': 1},
+            'w2': {'queues': [(10, 'default')], 'hb': monotonic(),
+                   'available_slots': 0},
+        }
+        self.router.queues = {'default': [(10, 'w1'), (10, 'w2')]}
+
+        # Each attempt may run for its timeout, and wait for the longest
+        # backoff before it's retried
+        with mock.patch.multiple(conf, VISIBILITY_TIMEOUT=600,
+                                 RETRY_BACKOFF_BASE=1, RETRY_BACKOFF_MAX=4):
+            now = monotonic()
+            self.router.on_request(
+                'c1', 'm1', ['default', 'guarantee,timeout:10,retry-count:4',
+                             'job1'], ack=False)
+        self.assertAlmostEqual(600 + 10 * 5 + 1 + 2 + 4 + 4,
+                               self.router.deliveries.jobs['m1'][0] - now,
+                               places=1)
+
+        # The job runs past its deadline and is sent again, to w2
+        self.router.redeliver(self.router.deliveries.expired(now + 3600))
+        self.router.on_ready('w2', 'ready1', [])
+        self.assertEqual('w2', self.router.deliveries.worker_of('m1'))
+
+        # The late READY of w1 doesn't finish the copy running on w2
+        self.router.on_ready('w1', 'ready2', ['m1'])
+        self.assertEqual('w2', self.router.deliveries.worker_of('m1'))
+        self.assertIn('m1', self.router.job_latencies)
+
+        self.router.on_ready('w2', 'ready3', ['m1'])
+        self.assertNotIn('m1', self.router.deliveries)
+        self.assertNotIn('m1', self.router.job_latencies)
+
+    @mock.patch('eventmq.router.fwdmsg')
+    def test_on_return(self, fwdmsg_mock):
+        worker_id = 'w1'
+
+        self.router.workers = {
+            worker_id: {
+                'queues': [(10, 'default')],
+                'hb': monotonic(),
+                'available_slots': 0,
+            },
+        }
+        self.router.waiting_messages['default'] = EMQdeque(initial=[
+            ['', constants.PROTOCOL_VERSION, 'REQUEST', 'new', 'default', '',
+             'job']])
+
+        with mock.patch.dict(conf.QUEUE_MAX_IN_FLIGHT, {'default': 5}):
+            self.router.add_in_flight('returned', 'default', worker_id)
+            self.router.on_return(worker_id, 'ret1',
+                                  ['returned', 'default', 'retry-count:1',
+                                   'job'])
+            self.assertEqual(0, self.router.queue_in_flight['default'])
+
+        # The returned job is sent before the ones that were waiting
+        self.assertIn('default', self.router.limited_queues)
+        self.assertEqual(
+            ['', constants.PROTOCOL_VERSION, 'REQUEST', 'returned',
+             'default', 'retry-count:1', 'job'],
+            self.router.waiting_messages['default'].peekleft())
+
+        self.router.on_ready(worker_id, 'ready1', [])
+        self.assertEqual('returned', fwdmsg_mock.call_args[0][2][3])
+
     @mock.patch('eventmq.router.Router.clean_up_dead_workers')
     @mock.patch('eventmq.router.Router.process_client_message')
     @mock.patch('eventmq.router.Router.get_available_worker')
@@ -378,6 +552,334 @@ class TestCase(unittest.TestCase):
             [client_id, '', constants.PROTOCOL_VERSION, 'REQUEST', msgid]+msg,
             depth=2)
 
+    @mock.patch('eventmq.router.sendmsg')
+    @mock.patch('eventmq.router.fwdmsg')
+    def test_on_request_batch(self, fwdmsg_mock, sendmsg_mock):
+        client_id = 'c1'
+        worker_id = 'w1'
+        queue = 'default'
+
+        self.router.workers = {
+            worker_id: {
+                'queues': [(10, queue), ],
+                'hb': 2903.34,
+                'available_slots': 1,
+            }
+        }
+        self.router.queues = {
+            queue: [(10, worker_id), ]
+        }
+
+        self.router.process_client_message(
+            [client_id, '', constants.PROTOCOL_VERSION, 'REQUEST_BATCH',
+             'batch1', queue, 'retry-count:1',
+             'j1', 'body1', 'j2', 'body2'])
+
+        # The first job takes the only slot, the second one waits
+        fwdmsg_mock.assert_called_once_with(
+            self.router.outgoing, worker_id,
+            ['', constants.PROTOCOL_VERSION, 'REQUEST', 'j1', queue,
+             'retry-count:1', 'body1'])
+        self.assertEqual(
+            ['', constants.PROTOCOL_VERSION, 'REQUEST', 'j2', queue,
+             'retry-count:1', 'body2'],
+            list(self.router.waiting_messages[queue])[0])
+
+        # The whole batch is acked at once
+        sendmsg_mock.assert_called_once_with(
+            self.router.incoming, client_id, 'ACK', ['batch1', 'j1', 'j2'])
+
+    @mock.patch('eventmq.router.sendmsg')
+    @mock.patch('eventmq.router.fwdmsg')
+    def test_metrics(self, fwdmsg_mock, sendmsg_mock):
+        worker_id = 'w1'
+        queue = 'default'
+
+        self.router.workers = {
+            worker_id: {
+                'queues': [(10, queue), ],
+                'hb': monotonic(),
+                'available_slots': 1,
+            }
+        }
+        self.router.queues = {queue: [(10, worker_id), ]}
+
+        self.router.on_request('c1', 'j1', [queue, '', 'body'])
+        self.router.on_request('c1', 'j2', [queue, '', 'body'])
+        self.router.on_ready(worker_id, 'r1', ['j1'])
+
+        self.assertEqual({(queue, ): 2},
+                         self.router.requests_metric.values)
+        self.assertEqual({(queue, ): 2},
+                         self.router.dispatched_metric.values)
+        self.assertEqual({(queue, ): 1},
+                         self.router.completed_metric.values)
+        self.assertNotIn('j1', self.router.job_latencies)
+
+        output = self.router.metrics.render()
+        self.assertIn('eventmq_router_workers 1\n', output)
+        self.assertIn('eventmq_router_pending_jobs 1\n', output)
+        self.assertIn(
+            'eventmq_router_job_duration_seconds_count{queue="default"} 1\n',
+            output)
+
+    @mock.patch('eventmq.router.fwdmsg')
+    def test_on_request_debounce(self, fwdmsg_mock):
+        client_id = 'c1'
+        queue = 'default'
+        body = json.dumps(['run', {'path': 'os', 'callable': 'getcwd',
+                                   'args': [1], 'kwargs': {}}])
+        msg = [queue, 'debounce:30', body]
+
+        self.router.queues = {queue: []}
+
+        self.router.on_request(client_id, 'msg1', msg)
+        self.assertEqual(1, len(self.router.waiting_messages[queue]))
+
+        # Identical job inside of the window is dropped
+        self.router.on_request(client_id, 'msg2', msg)
+        self.assertEqual(1, len(self.router.waiting_messages[queue]))
+
+        # Different arguments aren't duplicates
+        other_body = json.dumps(['run', {'path': 'os', 'callable': 'getcwd',
+                                         'args': [2], 'kwargs': {}}])
+        self.router.on_request(client_id, 'msg3',
+                               [queue, 'debounce:30', other_body])
+        self.assertEqual(2, len(self.router.waiting_messages[queue]))
+
+        # Retrying the same msgid isn't a duplicate
+        self.assertFalse(
+            self.router.is_duplicate_request(queue, 'msg1', msg))
+
+        # Once the window has passed, the job is accepted again
+        self.router.expire_dedupe_index(monotonic() + 31)
+        self.router.on_request(client_id, 'msg4', msg)
+        self.assertEqual(3, len(self.router.waiting_messages[queue]))
+
+    @mock.patch('eventmq.router.fwdmsg')
+    def test_on_request_dedupe_key(self, fwdmsg_mock):
+        client_id = 'c1'
+        worker_id = 'w1'
+        queue = 'default'
+        msg = [queue, 'dedupe-key:user-42', '["run", {}]']
+
+        self.router.workers = {
+            worker_id: {
+                'queues': [(10, queue)],
+                'hb': monotonic(),
+                'available_slots': 0,
+            }
+        }
+        self.router.queues = {queue: [(10, worker_id)]}
+
+        self.router.on_request(client_id, 'msg1', msg)
+        self.router.on_request(client_id, 'msg2', msg)
+        self.assertEqual(1, len(self.router.waiting_messages[queue]))
+
+        # Once it's been sent to a worker the key is released
+        self.router.on_ready(worker_id, 'ready1', [])
+        self.assertEqual({}, self.router.dedupe_index)
+
+        self.router.on_request(client_id, 'msg3', msg)
+        self.assertEqual(1, len(self.router.waiting_messages[queue]))
+
+    @mock.patch('eventmq.router.fwdmsg')
+    def test_on_request_delay(self, fwdmsg_mock):
+        client_id = 'c1'
+        worker_id = 'w1'
+        queue = 'default'
+
+        self.router.workers = {
+            worker_id: {
+                'queues': [(10, queue)],
+                'hb': monotonic(),
+                'available_slots': 1,
+            }
+        }
+        self.router.queues = {queue: [(10, worker_id)]}
+
+        self.router.on_request(client_id, 'msg1',
+                               [queue, 'delay:60,guarantee', '["run", {}]'])
+        self.router.on_request(client_id, 'msg2',
+                               [queue, 'delay:30', '["run", {}]'])
+        # An eta in the past runs right away
+        self.router.on_request(client_id, 'msg3',
+                               [queue, 'eta:1000', '["run", {}]'])
+        self.assertEqual(1, fwdmsg_mock.call_count)
+        self.assertEqual(2, len(self.router.delayed_messages))
+
+        # Nothing is due yet
+        self.router.release_delayed_messages(monotonic())
+        self.assertEqual(2, len(self.router.delayed_messages))
+
+        # The first one due is released. No workers are left so it's buffered
+        self.router.release_delayed_messages(monotonic() + 31)
+        self.assertEqual(1, len(self.router.delayed_messages))
+        self.assertEqual(
+            ['', constants.PROTOCOL_VERSION, 'REQUEST', 'msg2', queue, '',
+             '["run", {}]'],
+            self.router.waiting_messages[queue].peekleft())
+
+        self.router.release_delayed_messages(monotonic() + 61)
+        self.assertEqual([], self.router.delayed_messages)
+        self.router.waiting_messages[queue].popleft()
+        self.assertEqual('guarantee',
+                         self.router.waiting_messages[queue].peekleft()[5])
+
+    @mock.patch('eventmq.router.sendmsg')
+    @mock.patch('eventmq.router.fwdmsg')
+    def test_queue_max_in_flight(self, fwdmsg_mock, sendmsg_mock):
+        worker_id = 'w1'
+        queue = 'pushes'
+        msg = [queue, '', '["run", {}]']
+
+        self.router.workers = {
+            worker_id: {
+                'queues': [(10, queue)],
+                'hb': monotonic(),
+                'available_slots': 3,
+            }
+        }
+        self.router.queues = {queue: [(10, worker_id)]}
+
+        with mock.patch.object(conf, 'QUEUE_MAX_IN_FLIGHT', {queue: 1}):
+            self.router.on_request('c1', 'msg1', msg)
+            self.router.on_request('c1', 'msg2', msg)
+
+            # The worker has free slots but the queue is at its cap
+            self.assertEqual(1, fwdmsg_mock.call_count)
+            self.assertEqual(1, len(self.router.waiting_messages[queue]))
+            self.assertEqual({queue: 1}, self.router.queue_in_flight)
+            self.assertIn(queue, self.router.limited_queues)
+
+            self.router.dispatch_limited_queues()
+            self.assertEqual(1, fwdmsg_mock.call_count)
+
+            # msg1 finished so msg2 is sent
+            self.router.on_ready(worker_id, 'ready1', ['msg1'])
+            self.assertEqual(2, fwdmsg_mock.call_count)
+            self.assertNotIn(queue, self.router.waiting_messages)
+            self.assertEqual({'msg2': (queue, worker_id)},
+                             self.router.in_flight_jobs)
+
+    @mock.patch('eventmq.router.sendmsg')
+    @mock.patch('eventmq.router.fwdmsg')
+    def test_queue_rate_limit(self, fwdmsg_mock, sendmsg_mock):
+        worker_id = 'w1'
+        queue = 'pushes'
+        msg = [queue, '', '["run", {}]']
+
+        self.router.workers = {
+            worker_id: {
+                'queues': [(10, queue)],
+                'hb': monotonic(),
+                'available_slots': 3,
+            }
+        }
+        self.router.queues = {queue: [(10, worker_id)]}
+
+        with mock.patch.object(conf, 'QUEUE_RATE_LIMITS', {queue: 1}):
+            self.router.setup_queue_limits()
+
+            self.router.on_request('c1', 'msg1', msg)
+            self.router.on_request('c1', 'msg2', msg)
+            self.assertEqual(1, fwdmsg_mock.call_count)
+            self.assertEqual(1, len(self.router.waiting_messages[queue]))
+
+            # Once a token is available the buffered job is sent
+            bucket = self.router.queue_rate_limiters[queue]
+            bucket.last_refill -= 1
+            self.router.dispatch_limited_queues()
+            self.assertEqual(2, fwdmsg_mock.call_count)
+            self.assertEqual(1, self.router.workers[worker_id][
+                'available_slots'])
+            self.assertEqual(set(), self.router.limited_queues)
+
+    @mock.patch('eventmq.router.sendmsg')
+    @mock.patch('eventmq.router.fwdmsg')
+    def test_on_reply_routes_result(self, fwdmsg_mock, sendmsg_mock):
+        client_id = 'c1'
+        worker_id = 'w1'
+        queue = 'default'
+        reply = '{"value": 42}'
+
+        self.router.result_store = resultstore.MemoryResultStore()
+        self.router.workers = {
+            worker_id: {
+                'queues': [(10, queue)],
+                'hb': monotonic(),
+                'available_slots': 1,
+            }
+        }
+        self.router.queues = {queue: [(10, worker_id)]}
+
+        self.router.on_request(client_id, 'msg1',
+                               [queue, 'reply-requested', '["run", {}]'])
+        self.assertEqual({'msg1': [client_id, worker_id]},
+                         self.router.reply_recipients)
+
+        self.router.on_reply(worker_id, 'reply1', [reply, 'msg1'])
+        sendmsg_mock.assert_called_with(self.router.incoming, client_id,
+                                        'REPLY', ('msg1', reply))
+        self.assertEqual({}, self.router.reply_recipients)
+        self.assertEqual(reply, self.router.result_store.get('msg1'))
+
+        # The result can be fetched again with RESULT. There is nothing to
+        # wait for for an unknown job.
+        sendmsg_mock.reset_mock()
+        self.router.on_result('c2', 'result1', ['msg1', 'unknown'])
+        self.assertEqual([
+            mock.call(self.router.incoming, 'c2', 'REPLY', ('msg1', reply)),
+            mock.call(self.router.incoming, 'c2', 'REPLY',
+                      ('unknown', '{"error": "No result for unknown"}')),
+        ], sendmsg_mock.call_args_list)
+
+    @mock.patch('eventmq.router.sendmsg')
+    def test_on_result_pending_job(self, sendmsg_mock):
+        self.router.result_store = resultstore.MemoryResultStore()
+        self.router.reply_recipients['msg1'] = ['c0', 'w1']
+
+        # Nothing to send yet, but the client gets it once the job is done
+        self.router.on_result('c1', 'result1', ['msg1'])
+        self.assertFalse(sendmsg_mock.called)
+        self.assertEqual({'msg1': ['c1', 'w1']}, self.router.reply_recipients)
+
+    @mock.patch('eventmq.router.sendmsg')
+    @mock.patch('eventmq.router.fwdmsg')
+    def test_reply_recipients_of_jobs_without_reply(self, fwdmsg_mock,
+                                                    sendmsg_mock):
+        queue = 'default'
+        self.router.result_store = resultstore.MemoryResultStore()
+        self.router.workers = {
+            'w1': {'queues': [(10, queue)], 'hb': monotonic(),
+                   'available_slots': 2},
+            'w2': {'queues': [(10, queue)], 'hb': monotonic(),
+                   'available_slots': 1},
+        }
+        self.router.queues = {queue: [(10, 'w1'), (10, 'w2')]}
+
+        for msgid in ('msg1', 'msg2', 'msg3'):
+            self.router.on_request('c1', msgid,
+                                   [queue, 'reply-requested', '["run", {}]'])
+        self.assertEqual(['w1', 'w2', 'w1'],
+                         [self.router.reply_recipients[m][1]
+                          for m in ('msg1', 'msg2', 'msg3')])
+
+        # A job that finished without a REPLY won't get one
+        self.router.on_ready('w1', 'ready1', ['msg1'])
+        self.assertNotIn('msg1', self.router.reply_recipients)
+
+        # The jobs of a worker that's gone are lost
+        self.router.remove_dead_worker('w1')
+        self.assertEqual(['msg2'], list(self.router.reply_recipients))
+
+        # Fetching their results doesn't wait forever
+        sendmsg_mock.reset_mock()
+        self.router.on_result('c1', 'result1', ['msg3'])
+        sendmsg_mock.assert_called_once_with(
+            self.router.incoming, 'c1', 'REPLY',
+            ('msg3', '{"error": "No result for msg3"}'))
+
     def test_get_available_worker(self):
         worker2_id = 'w2'
         worker3_id = 'w3'
@@ -464,43 +966,40 @@ class TestCase(unittest.TestCase):
 
         conf.HEARTBEAT_TIMEOUT = 1
 
-        self.router.queues = {
-            queue1_id: [(10, worker1_id), (0, worker2_id)],
-            queue2_id: [(10, worker3_id), (10, worker2_id)],
-        }
+        self.router.add_worker(worker1_id, [(10, queue1_id)])
+        self.router.add_worker(worker2_id, [(10, queue2_id), (0, queue1_id)])
+        # A queue missing from self.router.queues
+        self.router.add_worker(worker3_id,
+                               [(10, queue2_id), (3, nonexistent_queue1)])
+        del self.router.queues[nonexistent_queue1]
 
-        self.router.workers = {
-            # 3 in the future
-            worker1_id: {
-                'queues': [(10, queue1_id), ],
-                'hb': monotonic() + 3,
-                'available_slots': 0,
-            },
-            # below the timeout
+        now = monotonic()
+        liveness = self.router.worker_liveness
+        # 3 in the future
+        liveness.received(worker1_id, now + 3)
 
-            worker2_id: {
-                'queues': [(10, queue2_id), (0, queue1_id)],
-                'hb': 0,
-                'available_slots': 2,
-            },
-            # below the timeout and a queue missing from self.router.queues
-            worker3_id: {
-                'queues': [(10, queue2_id), (3, nonexistent_queue1)],
-                'hb': 0,
-                'available_slots': 0,
-            },
-        }
+        # Nobody is past the deadline yet
+        self.router.clean_up_dead_workers(now)
+        self.assertEqual(3, len(self.router.workers))
 
-        self.router.clean_up_dead_workers()
+        self.router.clean_up_dead_workers(now + 2)
 
         self.assertIn(worker1_id, self.router.workers)
         self.assertNotIn(worker2_id, self.router.workers)
         self.assertNotIn(worker3_id, self.router.workers)
+        self.assertEqual([worker1_id], list(liveness.last_received))
 
         self.assertIn(queue1_id, self.router.queues)
         self.assertNotIn(queue2_id, self.router.queues)
         self.assertNotIn(nonexistent_queue1, self.router.queues)
 
+        self.assertGreater(self.router._meta['last_worker_cleanup'], 0)
+
+        # Traffic from a worker keeps it alive
+        liveness.received(worker1_id, now + 5)
+        self.router.clean_up_dead_workers(now + 5.5)
+        self.assertIn(worker1_id, self.router.workers)
+
     @mock.patch('eventmq.router.Router.on_inform')
     @mock.patch('eventmq.router.Router.on_request')
     @mock.patch('eventmq.router.parse_router_message')
@@ -777,6 +1276,7 @@ class TestCase(unittest.TestCase):
         self.assertEqual(
             json.loads(json.dumps({
                 'job_latencies_count': len(self.router.job_latencies),
+                'delayed_message_count': 0,
                 'processed_messages': {},
                 'processed_messages_by_worker': {},
                 'waiting_message_counts': [
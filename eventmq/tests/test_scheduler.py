@@ -16,7 +16,10 @@
 import json
 import unittest
 
-from .. import constants, scheduler
+import mock
+
+from .. import conf, constants, scheduler
+from ..utils.timeutils import IntervalIter
 
 ADDR = 'inproc://pour_the_rice_in_the_thing'
 
@@ -71,3 +74,133 @@ class TestCase(unittest.TestCase):
 
         self.assertFalse(sched.awaiting_startup_ack)
         self.assertEqual(sched.status, constants.STATUS.ready)
+
+    def test_get_misfire_policy_from_headers(self):
+        sched = scheduler.Scheduler()
+
+        self.assertEqual(
+            sched.get_misfire_policy_from_headers('guarantee,misfire:skip'),
+            constants.MISFIRE_POLICY.skip)
+        self.assertEqual(sched.get_misfire_policy_from_headers('guarantee'),
+                         conf.MISFIRE_POLICY)
+        self.assertEqual(
+            sched.get_misfire_policy_from_headers('misfire:sometimes'),
+            conf.MISFIRE_POLICY)
+
+    def test_misfire_action(self):
+        sched = scheduler.Scheduler()
+        sched.catchup_bucket = mock.Mock()
+        late = conf.MISFIRE_GRACE_TIME + 1
+
+        # On time executions always run
+        self.assertEqual(
+            sched.misfire_action(0, constants.MISFIRE_POLICY.skip), 'run')
+
+        self.assertEqual(
+            sched.misfire_action(late, constants.MISFIRE_POLICY.skip), 'skip')
+
+        sched.catchup_bucket.consume.return_value = True
+        self.assertEqual(
+            sched.misfire_action(late, constants.MISFIRE_POLICY.all), 'run')
+
+        # The catch-up rate has been exceeded
+        sched.catchup_bucket.consume.return_value = False
+        self.assertEqual(
+            sched.misfire_action(late, constants.MISFIRE_POLICY.once), 'wait')
+
+    @mock.patch('eventmq.scheduler.Scheduler.save_next_run')
+    @mock.patch('eventmq.scheduler.Scheduler.send_request')
+    def test_run_interval_job_misfire_policies(self, send_request_mock,
+                                               save_next_run_mock):
+        sched = scheduler.Scheduler()
+        sched.catchup_bucket = mock.Mock()
+        sched.catchup_bucket.consume.return_value = True
+
+        # The job was due 5 intervals ago
+        m_now = 1000
+        interval = conf.MISFIRE_GRACE_TIME + 1
+
+        def make_job(policy):
+            inter_iter = IntervalIter(m_now - (5 * interval), interval)
+            return [next(inter_iter), '{}', inter_iter, 'default',
+                    scheduler.INFINITE_RUN_COUNT, policy, 0]
+
+        # once: run a single time and resume the cadence after now
+        job = make_job(constants.MISFIRE_POLICY.once)
+        sched.run_interval_job('h1', job, m_now, 5000)
+        self.assertEqual(send_request_mock.call_count, 1)
+        self.assertEqual(job[0], m_now + interval)
+
+        # all: run and move to the next missed execution
+        send_request_mock.reset_mock()
+        job = make_job(constants.MISFIRE_POLICY.all)
+        sched.run_interval_job('h1', job, m_now, 5000)
+        self.assertEqual(send_request_mock.call_count, 1)
+        self.assertEqual(job[0], m_now - (3 * interval))
+
+        # skip: don't run, resume the cadence after now
+        send_request_mock.reset_mock()
+        job = make_job(constants.MISFIRE_POLICY.skip)
+        sched.run_interval_job('h1', job, m_now, 5000)
+        self.assertEqual(send_request_mock.call_count, 0)
+        self.assertEqual(job[0], m_now + interval)
+
+        # The next run is persisted in wall clock time
+        save_next_run_mock.assert_called_with('h1', 5000 + interval)
+
+    def test_run_interval_job_run_count_exhausted(self):
+        sched = scheduler.Scheduler()
+        inter_iter = IntervalIter(0, 10)
+        job = [next(inter_iter), '{}', inter_iter, 'default', 0,
+               constants.MISFIRE_POLICY.once, 0]
+
+        self.assertFalse(sched.run_interval_job('h1', job, 20, 5000))
+
+    def test_get_jitter_from_headers(self):
+        sched = scheduler.Scheduler()
+
+        self.assertEqual(sched.get_jitter_from_headers('guarantee,jitter:30'),
+                         30)
+        self.assertEqual(sched.get_jitter_from_headers('guarantee'),
+                         conf.SCHEDULE_JITTER)
+
+    def test_jitter_offset(self):
+        h1 = '4658982cab9d32bf1ef9113a9d8bdec01775e2bc'
+        h2 = '3658982cab9d32bf1ef9113a9d8bdec01775e2bd'
+
+        # Deterministic
+        self.assertEqual(scheduler.Scheduler.jitter_offset(h1, 60),
+                         scheduler.Scheduler.jitter_offset(h1, 60))
+        # Spread
+        self.assertNotEqual(scheduler.Scheduler.jitter_offset(h1, 60),
+                            scheduler.Scheduler.jitter_offset(h2, 60))
+
+        for h in (h1, h2):
+            self.assertGreaterEqual(
+                scheduler.Scheduler.jitter_offset(h, 60), 0)
+            self.assertLess(scheduler.Scheduler.jitter_offset(h, 60), 60)
+            # Capped to the interval
+            self.assertLess(
+                scheduler.Scheduler.jitter_offset(h, 60, interval=5), 5)
+
+        # No window
+        self.assertEqual(scheduler.Scheduler.jitter_offset(h1, 0), 0)
+
+    @mock.patch('eventmq.scheduler.Scheduler.save_next_run')
+    @mock.patch('eventmq.scheduler.Scheduler.send_request')
+    def test_run_cron_job_keeps_jitter(self, send_request_mock,
+                                       save_next_run_mock):
+        from croniter import croniter
+
+        sched = scheduler.Scheduler()
+        jitter = 17.5
+        ts_now = 1500000000  # 02:40:00 UTC
+
+        c = croniter('* * * * *', ts_now - 1)
+        cron = [next(c) + jitter, '{}', c, 'default',
+                constants.MISFIRE_POLICY.once, '* * * * *', jitter]
+
+        sched.run_cron_job('h1', cron, ts_now + jitter)
+
+        self.assertEqual(send_request_mock.call_count, 1)
+        self.assertEqual(cron[0], ts_now + 60 + jitter)
@@ -0,0 +1,86 @@
+# This file is part of eventmq.
+#
+# eventmq is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 2.1 of the License, or (at your option)
+# any later version.
+#
+# eventmq is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with eventmq.  If not, see <http://www.gnu.org/licenses/>.
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+from .. import conf, tracing
+
+
+class TestCase(unittest.TestCase):
+    def tearDown(self):
+        tracing.configure()
+
+    def test_disabled(self):
+        tracer = tracing.configure()
+        self.assertEqual(0, tracer.threshold)
+
+        with mock.patch.object(tracing.Tracer, 'record') as record_mock:
+            tracing.trace('router.receive', 'msg1')
+            self.assertFalse(record_mock.called)
+
+    def test_sampling(self):
+        msgids = ['msg{}'.format(i) for i in range(2000)]
+
+        tracer = tracing.Tracer(sample_rate=0.1,
+                                exporter=tracing.RingBufferExporter(10))
+        sampled = [m for m in msgids if tracer.is_sampled(m)]
+
+        # Roughly 10% are sampled, and always the same ones so every device
+        # traces the same jobs
+        self.assertTrue(100 < len(sampled) < 300)
+        self.assertEqual(sampled, [m for m in msgids if tracer.is_sampled(m)])
+        self.assertFalse(tracer.is_sampled(None))
+
+        tracer = tracing.Tracer(sample_rate=1,
+                                exporter=tracing.RingBufferExporter(10))
+        self.assertTrue(all(tracer.is_sampled(m) for m in msgids))
+
+    def test_ring_buffer_exporter(self):
+        exporter = tracing.RingBufferExporter(2)
+        tracing.configure(sample_rate=1, exporter=exporter, device='r1')
+
+        tracing.trace('router.receive', 'msg1', queue='default')
+        tracing.trace('router.forward', 'msg1')
+        tracing.trace('router.finish', 'msg1')
+
+        self.assertEqual(['router.forward', 'router.finish'],
+                         [span['stage'] for span in exporter.spans])
+        self.assertEqual('r1', exporter.spans[0]['device'])
+        self.assertEqual('msg1', exporter.spans[0]['msgid'])
+
+    def test_setup_tracing_jsonl(self):
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        trace_file = os.path.join(path, 'trace.jsonl')
+
+        with mock.patch.multiple(conf, TRACE_SAMPLE_RATE=1.0,
+                                 TRACE_EXPORTER='jsonl',
+                                 TRACE_FILE=trace_file):
+            tracer = tracing.setup_tracing(device='jm')
+
+        tracing.trace('jobmanager.receive', 'msg1', attempt=1)
+        tracer.exporter.close()
+
+        with open(trace_file) as f:
+            span = json.loads(f.readline())
+
+        self.assertEqual('jobmanager.receive', span['stage'])
+        self.assertEqual(1, span['attempt'])
+        self.assertEqual('jm', span['device'])
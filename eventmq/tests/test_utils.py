@@ -21,8 +21,8 @@ import unittest
 import mock
 
 from .. import constants
-from .. import exceptions
-from ..utils import classes, messages, settings
+from .. import exceptions, utils
+from ..utils import classes, messages, settings, timeutils
 
 
 class SettingsTestCase(unittest.TestCase):
@@ -30,12 +30,16 @@ class SettingsTestCase(unittest.TestCase):
         ("[global]",
          "super_debug=TRuE",
          "frontend_addr=tcp://0.0.0.0:47291",
+         'queue_rate_limits={"pushes": 50}',
          "",
          "[jobmanager]",
          "super_debug=FalSe",
          'queues=[[50,"google"], [40,"pushes"], [10,"default"]]',
          "worker_addr=tcp://160.254.23.88:47290",
-         "concurrent_jobs=9283",))
+         "concurrent_jobs=9283",
+         'preload_modules=["os.path"]',
+         "retry_backoff_base=0.5",
+         "schedule_jitter=2",))
 
     @mock.patch('eventmq.utils.settings.os.path.exists')
     def test_import_settings_default(self, pathexists_mock):
@@ -72,6 +76,9 @@ class SettingsTestCase(unittest.TestCase):
         # Changed. Default is 127.0.0.1:47291
         self.assertEqual(conf.FRONTEND_ADDR, 'tcp://0.0.0.0:47291')
 
+        # Changed. Default is {}
+        self.assertEqual(conf.QUEUE_RATE_LIMITS, {'pushes': 50})
+
         # Default is (10, 'default')
         self.assertEqual(conf.QUEUES, [(10, conf.DEFAULT_QUEUE_NAME), ])
 
@@ -102,6 +109,15 @@ class SettingsTestCase(unittest.TestCase):
 
         self.assertEqual(conf.WORKER_ADDR, 'tcp://160.254.23.88:47290')
 
+        # Changed. Default is []
+        self.assertEqual(conf.PRELOAD_MODULES, ['os.path'])
+
+        # Changed. Fractional settings are floats. Default is 1.0
+        self.assertEqual(conf.RETRY_BACKOFF_BASE, 0.5)
+        # Changed. Default is 0.0
+        self.assertEqual(conf.SCHEDULE_JITTER, 2.0)
+        self.assertIsInstance(conf.SCHEDULE_JITTER, float)
+
         # Invalid section
         # ---------------
         # This shouldn't fail, and nothing should change
@@ -152,6 +168,17 @@ class EMQPServiceTestCase(unittest.TestCase):
 
         return obj
 
+    @mock.patch('eventmq.utils.classes.logger')
+    def test_process_message_without_handler(self, logger_mock):
+        obj = self.get_worker()
+        obj._meta = {}
+
+        obj.process_message(['', constants.PROTOCOL_VERSION, 'BOGUS', 'm1'])
+
+        args = logger_mock.warning.call_args[0]
+        self.assertEqual('No handler for BOGUS found (tried: on_bogus)',
+                         args[0] % args[1:])
+
     @mock.patch('eventmq.utils.classes.sendmsg')
     def test_send_inform_return_msgid(self, sendmsg_mock):
         obj = self.get_worker()
@@ -209,6 +236,23 @@ class TestCase(unittest.TestCase):
 
         self.assertEqual(type(msgid), str)
 
+    def test_generate_id(self):
+        ids = [utils.generate_id() for _ in range(1000)]
+
+        self.assertEqual(1000, len(set(ids)))
+        self.assertEqual(25, len(ids[0]))
+        # ids sort in the order they were generated
+        self.assertEqual(ids, sorted(ids))
+
+        # Time going backwards doesn't break the order
+        with mock.patch('eventmq.utils.time.time', return_value=0):
+            self.assertGreater(utils.generate_id(), ids[-1])
+
+        # A forked process gets a new random part
+        with mock.patch('eventmq.utils.os.getpid', return_value=-1):
+            forked_id = utils.generate_id()
+        self.assertNotEqual(ids[-1][11:19], forked_id[11:19])
+
     def test_parse_message(self):
         emq_headers = ('myid', '', 'protoversion', 'command', 'msgid')
         emq_frame_singlemsg = emq_headers + ('my message',)
@@ -289,3 +333,90 @@ class TestCase(unittest.TestCase):
             q.remove(i)
 
         self.assertEqual(len(q), 0)
+
+    def test_token_bucket(self):
+        bucket = classes.TokenBucket(2, capacity=2)
+        now = bucket.last_refill
+
+        self.assertTrue(bucket.consume(now=now))
+        self.assertTrue(bucket.consume(now=now))
+        # Empty
+        self.assertFalse(bucket.consume(now=now))
+
+        # Refills at `rate` tokens per second
+        self.assertTrue(bucket.consume(now=now + 0.5))
+        self.assertFalse(bucket.consume(now=now + 0.5))
+
+        # A rate of 0 disables the limit
+        bucket = classes.TokenBucket(0)
+        for i in range(0, 100):
+            self.assertTrue(bucket.consume())
+
+    def test_liveness_tracker(self):
+        tracker = classes.LivenessTracker(timeout=10, interval=3)
+        tracker.add('a', now=100)
+        tracker.add('b', now=100)
+
+        # The first heartbeats are spread over the interval
+        self.assertEqual([], tracker.due_heartbeats(now=100 - 0.001))
+        self.assertEqual(['a', 'b'], sorted(tracker.due_heartbeats(now=103)))
+        self.assertEqual([], tracker.due_heartbeats(now=105))
+
+        # Sending anything to a peer delays its heartbeat
+        tracker.sent('a', now=105)
+        self.assertEqual(['b'], tracker.due_heartbeats(now=106))
+        self.assertEqual(['a'], tracker.due_heartbeats(now=108))
+
+        # Receiving anything from a peer keeps it alive
+        tracker.received('a', now=109)
+        self.assertEqual([], tracker.expired(now=109))
+        self.assertEqual(['b'], tracker.expired(now=110))
+        self.assertNotIn('b', tracker)
+        self.assertEqual(['a'], tracker.expired(now=119))
+        self.assertEqual(0, len(tracker))
+
+        # Removed peers can be added again without stale deadlines
+        tracker.add('a', now=200)
+        tracker.remove('a')
+        tracker.add('a', now=205)
+        self.assertEqual([], tracker.expired(now=214))
+        self.assertEqual(['a'], tracker.expired(now=215))
+
+    def test_delivery_tracker(self):
+        tracker = classes.DeliveryTracker(timeout=30)
+        tracker.add('m1', 'w1', 'default', ['default', 'guarantee', '1'],
+                    now=100)
+        tracker.add('m2', 'w1', 'default', ['default', 'guarantee', '2'],
+                    now=101)
+        tracker.add('m3', 'w2', 'other', ['other', 'guarantee', '3'],
+                    timeout=5, now=102)
+
+        self.assertEqual([('other', 'm3', ['other', 'guarantee', '3'])],
+                         tracker.expired(now=107))
+        self.assertNotIn('m3', tracker)
+
+        # A finished job isn't sent again
+        self.assertEqual(('default', 'm1', ['default', 'guarantee', '1']),
+                         tracker.remove('m1'))
+        self.assertIsNone(tracker.remove('m1'))
+        self.assertEqual([], tracker.expired(now=130))
+
+        # A job sent to another worker gets a new deadline
+        tracker.add('m2', 'w2', 'default', ['default', 'guarantee', '2'],
+                    now=120)
+        self.assertEqual([], tracker.expired(now=131))
+        self.assertEqual([], tracker.remove_worker('w1'))
+        self.assertEqual(['m2'], [job[1] for job in
+                                  tracker.remove_worker('w2')])
+        self.assertEqual(0, len(tracker))
+        self.assertEqual({}, tracker.worker_jobs)
+
+    def test_interval_iter_next_after(self):
+        interval = timeutils.IntervalIter(0, 10)
+
+        self.assertEqual(next(interval), 10)
+        # Skips 20, 30, and 40 keeping the cadence
+        self.assertEqual(interval.next_after(45), 50)
+        self.assertEqual(next(interval), 60)
+        # Nothing to skip
+        self.assertEqual(interval.next_after(0), 70)
@@ -14,6 +14,7 @@
 # along with eventmq.  If not, see <http://www.gnu.org/licenses/>.
 import unittest
 
+from .. import exceptions
 from ..utils import encoding
 
 
@@ -60,3 +61,24 @@ class TestCase(unittest.TestCase):
 
     def test_encodify_float(self):
         self.assertEqual(encoding.encodify(1.0), 1.0)
+
+    def test_encode_frames(self):
+        frames = ['one', u'tw\xf6', b'three', memoryview(b'four')]
+        encoded = encoding.encode_frames(frames, strict=True)
+
+        self.assertEqual([b'one', b'tw\xc3\xb6', b'three'], encoded[:3])
+        # Frames that are already bytes aren't copied
+        self.assertIs(frames[2], encoded[2])
+        self.assertIs(frames[3], encoded[3])
+
+    def test_encode_frames_strict(self):
+        self.assertEqual([b'a', 1], encoding.encode_frames(['a', 1],
+                                                           strict=False))
+
+        with self.assertRaises(exceptions.MessageError):
+            encoding.encode_frames(['a', ['b']], strict=True)
+
+    def test_command_frame(self):
+        self.assertEqual(b'REQUEST', encoding.command_frame('request'))
+        self.assertIs(encoding.command_frame('request'),
+                      encoding.command_frame('request'))
@@ -0,0 +1,95 @@
+# This file is part of eventmq.
+#
+# eventmq is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 2.1 of the License, or (at your option)
+# any later version.
+#
+# eventmq is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with eventmq.  If not, see <http://www.gnu.org/licenses/>.
+import unittest
+
+from ..utils import functions, headers
+
+
+class TestCase(unittest.TestCase):
+    def test_parse(self):
+        parsed = headers.Headers.parse(
+            'reply-requested,guarantee,timeout:30,run_count:5,'
+            'dedupe-key:user:42,custom,x:1')
+
+        self.assertTrue(parsed.reply_requested)
+        self.assertTrue(parsed.guarantee)
+        self.assertFalse(parsed.nohaste)
+        self.assertEqual(30, parsed.timeout)
+        self.assertEqual(5, parsed.run_count)
+        self.assertEqual('user:42', parsed.dedupe_key)
+        self.assertIsNone(parsed.retry_count)
+        self.assertEqual(('custom', 'x:1'), parsed.other)
+
+        empty = headers.Headers.parse('')
+        self.assertFalse(empty.reply_requested)
+        self.assertIsNone(empty.timeout)
+
+    def test_dedupe_key_escaped(self):
+        for key in ('a,b', 'user:42', '100%', '%2C', 'a,%2C:b%'):
+            encoded = headers.Headers(dedupe_key=key, timeout=5).encode()
+            # The key stays one header
+            self.assertEqual(2, len(encoded.split(',')))
+
+            parsed = headers.Headers.parse(encoded)
+            self.assertEqual(key, parsed.dedupe_key)
+            self.assertEqual(5, parsed.timeout)
+            self.assertEqual((), parsed.other)
+
+    def test_keys_match_exactly(self):
+        # Used to match the timeout: substring
+        parsed = headers.Headers.parse('soft-timeout:5,no-reply-requested')
+
+        self.assertIsNone(parsed.timeout)
+        self.assertFalse(parsed.reply_requested)
+        self.assertIsNone(functions.get_timeout_from_headers(
+            'soft-timeout:5'))
+
+    def test_invalid_values_are_ignored(self):
+        parsed = headers.Headers.parse('timeout:soon,jitter:x,guarantee')
+
+        self.assertIsNone(parsed.timeout)
+        self.assertIsNone(parsed.jitter)
+        self.assertTrue(parsed.guarantee)
+
+    def test_encode(self):
+        raw = 'reply-requested,retry-count:2,eta:1500000000.500,custom'
+        parsed = headers.Headers.parse(raw)
+
+        self.assertEqual(raw, parsed.encode())
+        self.assertEqual(parsed, headers.Headers.parse(parsed.encode()))
+        self.assertEqual('delay:1.5,jitter:30',
+                         headers.Headers(delay=1.5, jitter=30.0).encode())
+
+    def test_replace(self):
+        parsed = headers.Headers.parse('guarantee,delay:30')
+        replaced = parsed.replace(delay=None, run_count=2)
+
+        self.assertEqual('guarantee,run_count:2', replaced.encode())
+        # The original is unchanged
+        self.assertEqual(30, parsed.delay)
+
+    def test_eta_at(self):
+        self.assertEqual(130, headers.Headers(delay=30).eta_at(100))
+        self.assertEqual(50, headers.Headers(eta=50, delay=30).eta_at(100))
+        self.assertIsNone(headers.Headers().eta_at(100))
+
+    def test_parse_headers_cache(self):
+        first = headers.parse_headers('guarantee,timeout:3')
+
+        self.assertIs(first, headers.parse_headers('guarantee,timeout:3'))
+        self.assertIs(first, headers.parse_headers(first))
+
+        with self.assertRaises(ValueError):
+            headers.parse_headers(['guarantee'])
@@ -0,0 +1,52 @@
+# This file is part of eventmq.
+#
+# eventmq is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 2.1 of the License, or (at your option)
+# any later version.
+#
+# eventmq is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with eventmq.  If not, see <http://www.gnu.org/licenses/>.
+import os
+import tempfile
+import unittest
+
+import mock
+
+from .. import conf
+from ..utils import sharedmem
+
+
+class TestCase(unittest.TestCase):
+    def test_write_and_read(self):
+        path = sharedmem.write_shared(b'["run", {"args": [1, 2]}]')
+        try:
+            self.assertTrue(os.path.basename(path).startswith(
+                'eventmq-{}-'.format(os.getpid())))
+            self.assertEqual(b'["run", {"args": [1, 2]}]',
+                             sharedmem.read_shared(path))
+        finally:
+            sharedmem.unlink_shared(path)
+
+        self.assertFalse(os.path.exists(path))
+        # Removing it twice is fine
+        sharedmem.unlink_shared(path)
+
+    def test_shared_memory_dir(self):
+        with mock.patch.object(conf, 'SHARED_MEMORY_DIR', '/does/not/exist'):
+            self.assertEqual(tempfile.gettempdir(),
+                             sharedmem.shared_memory_dir())
+
+        directory = tempfile.mkdtemp()
+        try:
+            with mock.patch.object(conf, 'SHARED_MEMORY_DIR', directory):
+                path = sharedmem.write_shared(b'x')
+                self.assertEqual(directory, os.path.dirname(path))
+                sharedmem.unlink_shared(path)
+        finally:
+            os.rmdir(directory)
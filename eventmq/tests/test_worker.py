@@ -15,11 +15,22 @@
 
 import logging
 from multiprocessing import Pool
+import os
+import sys
+from threading import current_thread, Thread
 import time
 
-from nose import with_setup
+import mock
+from nose import SkipTest, with_setup
 
-from .. import worker
+from .. import conf, worker
+from ..exceptions import JobTimeoutError
+from ..utils import sharedmem
+
+if sys.version[0] == '2':
+    import Queue
+else:
+    import queue as Queue
 
 ADDR = 'inproc://pour_the_rice_in_the_thing'
 
@@ -39,9 +50,62 @@ def test_run_with_timeout():
         'args': [2]
     }
 
-    msgid = worker._run_job(payload, logging.getLogger())
+    return_val, failed = worker._run_job(payload, logging.getLogger())
+
+    assert return_val
+    assert not failed
+
+
+@with_setup(setup_func)
+def test_run_job_failure():
+    payload = {
+        'path': 'eventmq.tests.test_worker',
+        'callable': 'failing_job',
+    }
+
+    return_val, failed = worker._run_job(payload, logging.getLogger())
+
+    assert failed
+    assert return_val == 'boom'
+
+
+def test_execute_shared_body():
+    path = sharedmem.write_shared(
+        b'["run", {"path": "eventmq.tests.test_worker", "callable": '
+        b'"batch_job", "args": [7]}]')
+    try:
+        assert worker._execute({'shared_body': path},
+                               logging.getLogger()) == (7, False)
+    finally:
+        sharedmem.unlink_shared(path)
+
+    # A body that's gone fails the job
+    return_val, failed = worker._execute({'shared_body': path},
+                                         logging.getLogger())
+    assert failed
+    assert path in return_val
+
+
+def test_run_batch():
+    payloads = [{
+        'path': 'eventmq.tests.test_worker',
+        'callable': 'batch_job',
+        'args': [i]
+    } for i in range(3)]
+
+    # The batch entry point is used when there are no kwargs
+    assert worker._run_batch(payloads, logging.getLogger()) == \
+        [(10, False), (11, False), (12, False)]
 
-    assert msgid
+    payloads[0]['kwargs'] = {'x': 5}
+    del payloads[0]['args']
+    assert worker._run_batch(payloads, logging.getLogger()) == \
+        [(5, False), (1, False), (2, False)]
+
+    payloads[0]['callable'] = 'failing_job'
+    del payloads[0]['kwargs']
+    assert worker._run_batch(payloads, logging.getLogger()) == \
+        [('boom', True), (1, False), (2, False)]
 
 
 @with_setup(setup_func)
@@ -52,12 +116,214 @@ def test_run_setup():
     worker.run_setup(setup_path, setup_callable)
 
 
+@mock.patch('eventmq.worker.run_setup')
+def test_preload(run_setup_mock):
+    with mock.patch.multiple(conf, SETUP_PATH='eventmq.tests.test_worker',
+                             SETUP_CALLABLE='pre_hook',
+                             PRELOAD_MODULES=['json', 'eventmq.nope:Cls'],
+                             PRELOAD_SETUP=False):
+        assert worker.preload() == ['eventmq.nope:Cls']
+        assert not run_setup_mock.called
+
+        conf.PRELOAD_SETUP = True
+        worker.preload()
+        run_setup_mock.assert_called_once_with('eventmq.tests.test_worker',
+                                               'pre_hook')
+
+
+@mock.patch('eventmq.worker.current_rss')
+def test_recycle_reason(current_rss_mock):
+    w = worker.MultiprocessWorker(None, None, 1)
+    w.started_at = 100
+
+    with mock.patch.multiple(conf, MAX_JOB_COUNT=10, WORKER_MAX_RSS=500,
+                             WORKER_MAX_RSS_GROWTH=100, WORKER_MAX_AGE=3600):
+        current_rss_mock.return_value = 300 * worker.MB
+        assert w.recycle_reason(now=101) is None
+        assert w.baseline_rss == 300 * worker.MB
+
+        current_rss_mock.return_value = 400 * worker.MB
+        assert w.recycle_reason(now=102) == 'rss_growth'
+        assert w.rss == 400 * worker.MB
+
+        current_rss_mock.return_value = 500 * worker.MB
+        assert w.recycle_reason(now=103) == 'rss'
+
+        current_rss_mock.return_value = 300 * worker.MB
+        assert w.recycle_reason(now=3700) == 'age'
+
+        w.job_count = 10
+        assert w.recycle_reason(now=104) == 'job_count'
+
+        conf.MAX_JOB_COUNT = 0
+        conf.WORKER_MAX_AGE = 0
+        assert w.recycle_reason(now=3700) is None
+
+
+def test_interrupt_job():
+    job_queue = Queue.Queue()
+    result_queue = Queue.Queue()
+    interrupter = worker.JobInterrupter()
+    thread = Thread(target=worker._run,
+                    args=(job_queue, result_queue, logging.getLogger(),
+                          interrupter))
+    thread.start()
+
+    try:
+        job_queue.put({'path': 'eventmq.tests.test_worker',
+                       'callable': 'spinning_job'})
+        time.sleep(0.1)
+
+        with mock.patch.object(conf, 'TIMEOUT_GRACE_PERIOD', 5):
+            assert worker.MultiprocessWorker.interrupt_job(interrupter,
+                                                           result_queue)
+
+        # The thread survives to run the next job
+        job_queue.put({'path': 'eventmq.tests.test_worker', 'callable': 'job'})
+        assert result_queue.get(timeout=5) == (True, False)
+    finally:
+        job_queue.put('DONE')
+        thread.join(5)
+
+    # Without a grace period the worker is replaced right away
+    with mock.patch.object(conf, 'TIMEOUT_GRACE_PERIOD', 0):
+        assert not worker.MultiprocessWorker.interrupt_job(interrupter,
+                                                           result_queue)
+
+
+@mock.patch('eventmq.worker.raise_in_thread', return_value=True)
+def test_job_interrupter(raise_mock):
+    interrupter = worker.JobInterrupter()
+    thread = current_thread()
+
+    interrupter.job_started()
+    assert interrupter.interrupt()
+    raise_mock.assert_called_once_with(thread, JobTimeoutError)
+
+    # A timeout that's still pending when the job returns is cancelled
+    interrupter.job_finished()
+    raise_mock.assert_called_with(thread, None)
+
+    # Once the job finished nothing is raised in the thread
+    raise_mock.reset_mock()
+    assert interrupter.interrupt()
+    assert not raise_mock.called
+
+    # A job that wasn't interrupted has nothing to cancel
+    interrupter.job_started()
+    interrupter.job_finished()
+    assert not raise_mock.called
+
+
+def test_thread_executor():
+    results = Queue.Queue()
+    executor = worker.ThreadExecutor(results, size=1)
+    executor.start()
+
+    try:
+        assert results.get(timeout=5) == {
+            'msgid': None, 'return': None, 'death': False,
+            'pid': os.getpid(), 'callback': 'worker_ready',
+            'executor': 'thread'}
+
+        # A job that runs past its timeout gets JobTimeoutError raised in it
+        executor.submit({'msgid': 'm1', 'callback': 'worker_done',
+                         'timeout': 1,
+                         'params': {'path': 'eventmq.tests.test_worker',
+                                    'callable': 'spinning_job'}})
+        resp = results.get(timeout=5)
+        assert resp['msgid'] == 'm1'
+        assert resp['failed']
+        assert resp['return'] == {'value': 'TimeoutError'}
+        assert resp['timeout'] == {'seconds': 1, 'hard': False}
+
+        # The thread survives to run the next job
+        executor.submit({'msgid': 'm2', 'callback': 'worker_done',
+                         'params': {'path': 'eventmq.tests.test_worker',
+                                    'callable': 'job'}})
+        resp = results.get(timeout=5)
+        assert resp['return'] == {'value': True}
+        assert not resp['failed']
+        assert resp['executor'] == 'thread'
+        assert 'timeout' not in resp
+    finally:
+        executor.stop()
+        executor.threads[0].join(5)
+
+    assert not executor.threads[0].is_alive()
+
+
+def test_asyncio_executor():
+    if worker.asyncio is None:
+        raise SkipTest('asyncio requires Python 3')
+
+    results = Queue.Queue()
+    executor = worker.AsyncioExecutor(results, size=2)
+    executor.start()
+
+    try:
+        for _ in range(2):
+            assert results.get(timeout=5)['callback'] == 'worker_ready'
+
+        # Callables that aren't coroutine functions run in a thread pool
+        executor.submit({'msgid': 'm1', 'callback': 'worker_done',
+                         'params': {'path': 'eventmq.tests.test_worker',
+                                    'callable': 'job'}})
+        resp = results.get(timeout=5)
+        assert resp['return'] == {'value': True}
+        assert resp['executor'] == 'asyncio'
+
+        # Coroutines are cancelled when they time out
+        with mock.patch.object(worker.asyncio, 'iscoroutinefunction',
+                               return_value=True):
+            executor.submit({'msgid': 'm2', 'callback': 'worker_done',
+                             'timeout': 1,
+                             'params': {'path': 'eventmq.tests.test_worker',
+                                        'callable': 'sleeping_coroutine',
+                                        'args': [30]}})
+            resp = results.get(timeout=5)
+        assert resp['failed']
+        assert resp['return'] == {'value': 'TimeoutError'}
+        assert resp['timeout'] == {'seconds': 1, 'hard': False}
+    finally:
+        executor.stop()
+        executor.thread.join(5)
+
+
+def test_current_rss():
+    assert worker.current_rss() > 0
+
+
 def job(sleep_time=0):
     time.sleep(sleep_time)
 
     return True
 
 
+def spinning_job():
+    while True:
+        pass
+
+
+def sleeping_coroutine(seconds):
+    return worker.asyncio.sleep(seconds)
+
+
+def failing_job():
+    raise ValueError('boom')
+
+
+def batch_job(x):
+    return x
+
+
+def _batch_job_batch(args_list):
+    return [args[0] + 10 for args in args_list]
+
+
+batch_job.batch = _batch_job_batch
+
+
 def pre_hook():
     return 1
 
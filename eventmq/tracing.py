@@ -0,0 +1,229 @@
+# This file is part of eventmq.
+#
+# eventmq is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 2.1 of the License, or (at your option)
+# any later version.
+#
+# eventmq is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with eventmq.  If not, see <http://www.gnu.org/licenses/>.
+"""
+:mod:`tracing` -- Tracing
+=========================
+Records when a sample of the jobs pass each stage of their life (client
+enqueue, router receive, buffering, forwarding, jobmanager receive, worker
+start and finish, reply) so the time spent in each stage can be broken down.
+
+Whether a job is sampled is decided from its msgid, so every device samples
+the same jobs without passing a flag around. When tracing is disabled (the
+default) :func:`trace` returns right away.
+
+Usage:
+    # Devices are configured with the trace_* settings. Clients configure
+    # tracing themselves:
+    tracing.configure(sample_rate=0.01,
+                      exporter=tracing.JSONLinesExporter('/tmp/trace.jsonl'))
+"""
+from collections import deque
+import json
+import logging
+import os
+import time
+import zlib
+
+from . import conf
+
+logger = logging.getLogger(__name__)
+
+#: The sample rate is applied to this many buckets of msgid hashes
+SAMPLE_BUCKETS = 10000
+
+
+class BaseExporter(object):
+    """
+    Interface for span exporters
+    """
+    def export(self, span):
+        """
+        Args:
+            span (dict): The span to export
+        """
+        raise NotImplementedError()
+
+    def close(self):
+        pass
+
+
+class JSONLinesExporter(BaseExporter):
+    """
+    Appends each span as a line of JSON to a file. Devices that fork (the
+    jobmanager's workers) share the file.
+    """
+    def __init__(self, path=None):
+        """
+        Args:
+            path (str): File to append to. Default: ``conf.TRACE_FILE``
+        """
+        self.path = path or conf.TRACE_FILE
+        # Line buffered so lines written by different processes don't mix
+        self._file = open(self.path, 'a', 1)
+
+    def export(self, span):
+        try:
+            self._file.write(json.dumps(span) + '\n')
+        except (IOError, OSError, ValueError) as e:
+            logger.warning('Unable to write span to {}: {}'.format(
+                self.path, e))
+
+    def close(self):
+        self._file.close()
+
+
+class RingBufferExporter(BaseExporter):
+    """
+    Keeps the most recent spans in memory of the process, e.g. to inspect
+    them from a debugger or the tests.
+    """
+    def __init__(self, size=None):
+        """
+        Args:
+            size (int): Max number of spans to keep. Default:
+                ``conf.TRACE_BUFFER_SIZE``
+        """
+        self.spans = deque(maxlen=size or conf.TRACE_BUFFER_SIZE)
+
+    def export(self, span):
+        self.spans.append(span)
+
+
+#: Exporters by the value of the ``trace_exporter`` setting
+EXPORTERS = {
+    'jsonl': JSONLinesExporter,
+    'memory': RingBufferExporter,
+}
+
+
+class Tracer(object):
+    """
+    Samples jobs by msgid and sends their spans to an exporter
+    """
+    def __init__(self, sample_rate=0.0, exporter=None, device=None):
+        """
+        Args:
+            sample_rate (float): Fraction of the jobs to trace, from 0 to 1
+            exporter (BaseExporter): Where to send the spans
+            device (str): Name of the device the spans are recorded by
+        """
+        self.exporter = exporter
+        self.device = device
+
+        #: Number of the :attr:`SAMPLE_BUCKETS` that are sampled. 0 when
+        #: tracing is disabled.
+        self.threshold = 0
+        if exporter is not None:
+            self.threshold = int(round(
+                min(max(sample_rate, 0), 1) * SAMPLE_BUCKETS))
+
+    def is_sampled(self, msgid):
+        """
+        Returns:
+            bool: True if the job `msgid` should be traced
+        """
+        if not self.threshold or not msgid:
+            return False
+
+        if not isinstance(msgid, bytes):
+            msgid = msgid.encode('utf-8')
+
+        return (zlib.crc32(msgid) & 0xffffffff) % SAMPLE_BUCKETS < \
+            self.threshold
+
+    def record(self, stage, msgid, attrs):
+        """
+        Export a span for `msgid` without checking if it's sampled
+        """
+        span = {
+            'msgid': msgid,
+            'stage': stage,
+            'ts': time.time(),
+            'device': self.device,
+            'pid': os.getpid(),
+        }
+        if attrs:
+            span.update(attrs)
+
+        try:
+            self.exporter.export(span)
+        except Exception:
+            logger.exception('Unable to export span')
+
+
+_tracer = Tracer()
+
+
+def trace(stage, msgid, **attrs):
+    """
+    Record that the job `msgid` reached `stage` if it's sampled
+
+    Args:
+        stage (str): Name of the stage, e.g. ``router.receive``
+        msgid (str): The msgid of the REQUEST
+        attrs: Extra values to add to the span
+    """
+    if _tracer.threshold and _tracer.is_sampled(msgid):
+        _tracer.record(stage, msgid, attrs)
+
+
+def configure(sample_rate=0.0, exporter=None, device=None):
+    """
+    Replace the tracer used by :func:`trace`
+
+    Returns:
+        Tracer: The new tracer
+    """
+    global _tracer
+
+    if _tracer.exporter is not None and _tracer.exporter is not exporter:
+        _tracer.exporter.close()
+
+    _tracer = Tracer(sample_rate=sample_rate, exporter=exporter,
+                     device=device)
+    return _tracer
+
+
+def get_tracer():
+    """
+    Returns:
+        Tracer: The tracer used by :func:`trace`
+    """
+    return _tracer
+
+
+def setup_tracing(device=None):
+    """
+    Configure tracing for a device from the ``trace_*`` settings
+
+    Args:
+        device (str): Name of the device the spans are recorded by
+    """
+    if conf.TRACE_SAMPLE_RATE <= 0:
+        return configure()
+
+    if conf.TRACE_EXPORTER not in EXPORTERS:
+        logger.error('Unknown trace exporter {}. Tracing is disabled.'.format(
+            conf.TRACE_EXPORTER))
+        return configure()
+
+    try:
+        exporter = EXPORTERS[conf.TRACE_EXPORTER]()
+    except (IOError, OSError) as e:
+        logger.error('Unable to set up tracing: {}'.format(e))
+        return configure()
+
+    return configure(sample_rate=conf.TRACE_SAMPLE_RATE, exporter=exporter,
+                     device=device)
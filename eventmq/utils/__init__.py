@@ -27,6 +27,47 @@ like creating message more simple.
    settings
    timeutils
 """
+import itertools
+import os
+import random
+import time
+
+
+#: State of :func:`generate_id` for the current process
+_id_pid = None
+_id_node = None
+_id_counter = None
+_id_last_ms = 0
+
+
+def generate_id():
+    """
+    Generate a unique id that sorts by the time it was generated. The id is
+    25 hex characters: the unix time in milliseconds (11), a random number
+    picked once per process (8) and a counter (6). This is much cheaper than
+    a uuid4 since it doesn't need fresh random bytes for every id.
+
+    Returns:
+        str: The id
+    """
+    global _id_pid, _id_node, _id_counter, _id_last_ms
+
+    pid = os.getpid()
+    if pid != _id_pid:
+        # New process (or forked from one that generated ids), so the
+        # random part and the counter can't be shared with the parent
+        _id_node = '%08x' % random.SystemRandom().getrandbits(32)
+        _id_counter = itertools.count()
+        _id_pid = pid
+
+    # Don't go back in time if the clock is adjusted, so the ids of a process
+    # keep sorting in order
+    now_ms = int(time.time() * 1000)
+    if now_ms > _id_last_ms:
+        _id_last_ms = now_ms
+
+    return '%011x%s%06x' % (_id_last_ms, _id_node,
+                            next(_id_counter) & 0xffffff)
 
 
 def random_characters():
@@ -18,14 +18,20 @@
 Defines some classes to use when implementing ZMQ devices
 """
 from collections import deque
+import heapq
+import itertools
 import json
 import logging
+import random
 import sys
 
 import zmq.error
 
 from .. import conf, constants, exceptions, poller, utils
-from ..utils.encoding import encodify
+from ..metrics import start_metrics_server
+from ..tracing import setup_tracing
+from ..utils.encoding import (
+    EMPTY_FRAME, encode_frame, encode_frames, PROTOCOL_VERSION_FRAME)
 from ..utils.messages import send_emqp_message as sendmsg
 from ..utils.timeutils import monotonic, timestamp
 
@@ -131,6 +137,13 @@ class EMQPService(object):
         Args:
             addr (str): connection string to connect to
         """
+        if conf.METRICS_PORT and getattr(self, 'metrics', None) and \
+           getattr(self, 'metrics_server', None) is None:
+            self.metrics_server = start_metrics_server(
+                self.metrics, conf.METRICS_PORT, host=conf.METRICS_HOST)
+
+        setup_tracing(device=getattr(self, 'name', None))
+
         while not self.received_disconnect:
             self.status = constants.STATUS.connecting
             self.outgoing.connect(addr)
@@ -215,8 +228,8 @@ class EMQPService(object):
             func = getattr(self, "on_%s" % command)
             func(msgid, message)
         else:
-            logger.warning('No handler for %s found (tried: %s)' %
-                           (command.upper(), ('on_%s' % command)))
+            logger.warning('No handler for %s found (tried: %s)',
+                           command.upper(), 'on_%s' % command)
 
     def on_ack(self, msgid, ackd_msgid):
         """
@@ -224,7 +237,7 @@ class EMQPService(object):
         """
         # The msgid is the only frame in the message
         ackd_msgid = ackd_msgid[0]
-        logger.info('Received ACK for router (or client) %s' % ackd_msgid)
+        logger.info('Received ACK for router (or client) %s', ackd_msgid)
         self.awaiting_startup_ack = False
 
     def on_disconnect(self, msgid, msg):
@@ -350,9 +363,10 @@ class ZMQReceiveMixin(object):
         else:
             msg = self.zsocket.recv_string()
 
-        if not ("HEARTBEAT" == msg[2] or "HEARTBEAT" == msg[3]) or \
-                not conf.HIDE_HEARTBEAT_LOGS:
-            logger.debug('Received message: {}'.format(msg))
+        if logger.isEnabledFor(logging.DEBUG) and \
+            (not ("HEARTBEAT" == msg[2] or "HEARTBEAT" == msg[3]) or
+             not conf.HIDE_HEARTBEAT_LOGS):
+            logger.debug('Received message: %s', msg)
         return msg
 
     def recv_multipart(self):
@@ -365,15 +379,31 @@ class ZMQReceiveMixin(object):
         if type(msg[0] in (bytes,)):
             msg = [m.decode() for m in msg]
 
-        # If it's not at least 4 frames long then most likely it isn't an
-        # eventmq message
-        if len(msg) >= 4 and \
-            not ("HEARTBEAT" == msg[2] or "HEARTBEAT" == msg[3]) or \
-                not conf.HIDE_HEARTBEAT_LOGS:
-            logger.debug('Received message: {}'.format(msg))
+        log_message('Received', msg)
         return msg
 
 
+def log_message(action, msg):
+    """
+    Log a message that was received or is being sent. This is called for
+    every message so it returns right away unless debug logging is enabled.
+
+    Args:
+        action (str): ``Received`` or ``Sending``
+        msg: The frames of the message
+    """
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
+
+    # If it's not at least 4 frames long then most likely it isn't an
+    # eventmq message
+    if conf.HIDE_HEARTBEAT_LOGS and \
+       (len(msg) < 4 or "HEARTBEAT" == msg[2] or "HEARTBEAT" == msg[3]):
+        return
+
+    logger.debug('%s message: %s', action, msg)
+
+
 class ZMQSendMixin(object):
     """
     Defines some methods for sending messages. This class will not work if used
@@ -388,7 +418,8 @@ class ZMQSendMixin(object):
             (_recipient_id, '', protocol_version) + (your, tuple)
 
         Args:
-            message (tuple): Raw message to send.
+            message (tuple): Raw message to send. Each item is one frame and
+                must be bytes or text (see :func:`encode_frame`).
             protocol_version (str): protocol version. it's good practice but
                 you may explicitly specify None to skip adding the version
             _recipient_id (object): When using a :attr:`zmq.ROUTER` you must
@@ -400,22 +431,19 @@ class ZMQSendMixin(object):
                 '%s message type not one of %s' %
                 (type(message), str(supported_msg_types)))
 
-        if isinstance(message, list):
-            message = tuple(message)
-
         if _recipient_id:
-            headers = (_recipient_id, '', protocol_version)
+            msg = [encode_frame(_recipient_id), EMPTY_FRAME]
         else:
-            headers = ('', protocol_version, )
+            msg = [EMPTY_FRAME]
+
+        if protocol_version == constants.PROTOCOL_VERSION:
+            msg.append(PROTOCOL_VERSION_FRAME)
+        elif protocol_version is not None:
+            msg.append(encode_frame(protocol_version))
 
-        msg = encodify(headers + message)
+        msg.extend(encode_frames(message))
 
-        # If it's not at least 4 frames long then most likely it isn't an
-        # eventmq message
-        if len(msg) > 4 and \
-            not ("HEARTBEAT" == msg[2] or "HEARTBEAT" == msg[3]) or \
-                not conf.HIDE_HEARTBEAT_LOGS:
-            logger.debug('Sending message: %s' % str(msg))
+        log_message('Sending', msg)
 
         try:
             self.zsocket.send_multipart(msg,
@@ -436,6 +464,350 @@ class ZMQSendMixin(object):
         self.send_multipart((message, ), protocol_version)
 
 
+class TokenBucket(object):
+    """
+    Token bucket rate limiter. Tokens are refilled lazily from the monotonic
+    clock when they are consumed, so checking the bucket is O(1) and nothing
+    needs to run in the background.
+    """
+    def __init__(self, rate, capacity=None):
+        """
+        Args:
+            rate (float): Number of tokens added to the bucket per second. A
+                value of 0 or less disables rate limiting.
+            capacity (float): Max number of tokens the bucket can hold, i.e.
+                the largest burst allowed. Default: ``rate`` (at least 1)
+        """
+        self.rate = rate
+        self.capacity = capacity or max(rate, 1)
+        self.tokens = self.capacity
+        self.last_refill = monotonic()
+
+    def consume(self, tokens=1, now=None):
+        """
+        Try to take `tokens` out of the bucket.
+
+        Args:
+            tokens (int): number of tokens to take
+            now (float): monotonic time to refill with. If this value is None,
+                :func:`utils.timeutils.monotonic` is used.
+
+        Returns:
+            bool: True if the tokens were taken, False if the rate has been
+                exceeded.
+        """
+        if self.rate <= 0:
+            return True
+
+        if not now:
+            now = monotonic()
+
+        self.tokens = min(self.capacity,
+                          self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return True
+
+        return False
+
+    def refund(self, tokens=1):
+        """
+        Put back `tokens` that were consumed but not used
+        """
+        self.tokens = min(self.capacity, self.tokens + tokens)
+
+
+class LivenessTracker(object):
+    """
+    Tracks when peers were last heard from and sent a message so dead peers
+    and peers that are due a HEARTBEAT are found without scanning all of
+    them. Traffic only updates a timestamp. Each peer has one entry in a heap
+    of deadlines and the timestamp is checked when the entry reaches the top,
+    so the checks only touch peers whose deadline has passed.
+    """
+    def __init__(self, timeout=None, interval=None):
+        """
+        Args:
+            timeout (float): A peer is dead after this many seconds without a
+                message from it. Default: ``conf.HEARTBEAT_TIMEOUT``
+            interval (float): A peer is due a HEARTBEAT after this many
+                seconds without a message sent to it. Default:
+                ``conf.HEARTBEAT_INTERVAL``
+        """
+        self._timeout = timeout
+        self._interval = interval
+
+        #: Key: peer, Value: monotonic time of the last message from the peer
+        self.last_received = {}
+        #: Key: peer, Value: monotonic time of the last message sent to it
+        self.last_sent = {}
+
+        # Heaps of [deadline, sequence #, peer]. The peer of an entry is set
+        # to None when the peer is removed.
+        self._expiry = []
+        self._heartbeats = []
+        # Key: peer, Value: the peer's entry in the heap
+        self._expiry_entries = {}
+        self._heartbeat_entries = {}
+        # Breaks ties in the heaps so peers are never compared
+        self._seq = itertools.count()
+
+    @property
+    def timeout(self):
+        return self._timeout if self._timeout is not None \
+            else conf.HEARTBEAT_TIMEOUT
+
+    @property
+    def interval(self):
+        return self._interval if self._interval is not None \
+            else conf.HEARTBEAT_INTERVAL
+
+    def __contains__(self, peer):
+        return peer in self.last_received
+
+    def __len__(self):
+        return len(self.last_received)
+
+    def _schedule(self, heap, entries, peer, deadline):
+        entry = [deadline, next(self._seq), peer]
+        entries[peer] = entry
+        heapq.heappush(heap, entry)
+
+    def add(self, peer, now=None):
+        """
+        Start tracking `peer`. Its first HEARTBEAT is due at a random point
+        in the interval so the HEARTBEATs of peers that connected at the same
+        time are spread out.
+        """
+        if not now:
+            now = monotonic()
+
+        if peer in self.last_received:
+            self.received(peer, now)
+            return
+
+        self.last_received[peer] = now
+        self.last_sent[peer] = now - random.uniform(0, self.interval)
+
+        self._schedule(self._expiry, self._expiry_entries, peer,
+                       now + self.timeout)
+        self._schedule(self._heartbeats, self._heartbeat_entries, peer,
+                       self.last_sent[peer] + self.interval)
+
+    def remove(self, peer):
+        """
+        Stop tracking `peer`
+        """
+        self.last_received.pop(peer, None)
+        self.last_sent.pop(peer, None)
+
+        for entries in (self._expiry_entries, self._heartbeat_entries):
+            entry = entries.pop(peer, None)
+            if entry:
+                entry[2] = None
+
+    def received(self, peer, now=None):
+        """
+        Record a message from `peer`. Any message counts as a HEARTBEAT.
+        """
+        if peer in self.last_received:
+            self.last_received[peer] = now or monotonic()
+
+    def sent(self, peer, now=None):
+        """
+        Record a message sent to `peer`. The peer treats any message as a
+        HEARTBEAT so it won't need one for another interval.
+        """
+        if peer in self.last_sent:
+            self.last_sent[peer] = now or monotonic()
+
+    def _pop_due(self, heap, entries, last, period, now):
+        """
+        Returns:
+            list: The peers whose time in `last` is at least `period` before
+                `now`. The entries of the other peers that were popped are
+                pushed back with their current deadline.
+        """
+        due = []
+        while heap and heap[0][0] <= now:
+            peer = heapq.heappop(heap)[2]
+            if peer is None:
+                continue
+
+            deadline = last[peer] + period
+            if deadline <= now:
+                due.append(peer)
+            else:
+                self._schedule(heap, entries, peer, deadline)
+
+        return due
+
+    def expired(self, now=None):
+        """
+        Find the peers that haven't sent a message in :attr:`timeout` and
+        stop tracking them.
+
+        Returns:
+            list: The dead peers
+        """
+        if not now:
+            now = monotonic()
+
+        dead = self._pop_due(self._expiry, self._expiry_entries,
+                             self.last_received, self.timeout, now)
+        for peer in dead:
+            self.remove(peer)
+
+        return dead
+
+    def due_heartbeats(self, now=None):
+        """
+        Find the peers that haven't been sent a message in :attr:`interval`.
+        They are recorded as sent at `now`, so the caller must send them a
+        HEARTBEAT.
+
+        Returns:
+            list: The idle peers
+        """
+        if not now:
+            now = monotonic()
+
+        idle = self._pop_due(self._heartbeats, self._heartbeat_entries,
+                             self.last_sent, self.interval, now)
+        for peer in idle:
+            self.last_sent[peer] = now
+            self._schedule(self._heartbeats, self._heartbeat_entries, peer,
+                           now + self.interval)
+
+        return idle
+
+
+class DeliveryTracker(object):
+    """
+    Tracks the jobs sent to workers until a worker reports them finished, so
+    they can be sent again if their worker goes away or they take longer
+    than their visibility timeout. Jobs are indexed by msgid and by worker,
+    and ordered by deadline in a heap, so finding the jobs to send again
+    only touches those jobs.
+    """
+    def __init__(self, timeout=None):
+        """
+        Args:
+            timeout (float): Seconds a job may run before it's sent again.
+                Default: ``conf.VISIBILITY_TIMEOUT``
+        """
+        self._timeout = timeout
+
+        #: Key: msgid, Value: [deadline, sequence #, msgid, worker id,
+        #: queue name, REQUEST frames (queue name, headers, body)]. The entry
+        #: is also in the heap of deadlines. Its msgid is set to None when
+        #: the job is removed.
+        self.jobs = {}
+        #: Key: worker id, Value: set of msgids of the jobs sent to it
+        self.worker_jobs = {}
+
+        self._deadlines = []
+        # Breaks ties in the heap so the entries are never compared
+        self._seq = itertools.count()
+
+    @property
+    def timeout(self):
+        return self._timeout if self._timeout is not None \
+            else conf.VISIBILITY_TIMEOUT
+
+    def __contains__(self, msgid):
+        return msgid in self.jobs
+
+    def __len__(self):
+        return len(self.jobs)
+
+    def add(self, msgid, worker_id, queue_name, msg, timeout=None, now=None):
+        """
+        Start tracking a job sent to `worker_id`
+
+        Args:
+            msgid (str): The msgid of the REQUEST
+            worker_id (str): The worker the job was sent to
+            queue_name (str): The queue of the job
+            msg (list): The REQUEST frames (queue name, headers, body)
+            timeout (float): Seconds the job may run for. Default:
+                :attr:`timeout`
+        """
+        if not now:
+            now = monotonic()
+
+        self.remove(msgid)
+
+        entry = [now + (timeout or self.timeout), next(self._seq), msgid,
+                 worker_id, queue_name, msg]
+        self.jobs[msgid] = entry
+        self.worker_jobs.setdefault(worker_id, set()).add(msgid)
+        heapq.heappush(self._deadlines, entry)
+
+    def worker_of(self, msgid):
+        """
+        Returns:
+            str: The worker the job was last sent to, or None if it isn't
+                tracked
+        """
+        entry = self.jobs.get(msgid)
+        return entry[3] if entry is not None else None
+
+    def remove(self, msgid):
+        """
+        Stop tracking a job, e.g. because it finished
+
+        Returns:
+            tuple: (queue name, msgid, REQUEST frames) of the job, or None if
+                it isn't tracked
+        """
+        entry = self.jobs.pop(msgid, None)
+        if entry is None:
+            return None
+
+        worker_id = entry[3]
+        msgids = self.worker_jobs.get(worker_id)
+        if msgids is not None:
+            msgids.discard(msgid)
+            if not msgids:
+                del self.worker_jobs[worker_id]
+
+        entry[2] = None
+        return entry[4], msgid, entry[5]
+
+    def remove_worker(self, worker_id):
+        """
+        Stop tracking the jobs sent to `worker_id`
+
+        Returns:
+            list: (queue name, msgid, REQUEST frames) of each job, in the
+                order they were sent
+        """
+        msgids = sorted(self.worker_jobs.get(worker_id, ()),
+                        key=lambda msgid: self.jobs[msgid][1])
+        return [self.remove(msgid) for msgid in msgids]
+
+    def expired(self, now=None):
+        """
+        Find the jobs that ran past their deadline and stop tracking them
+
+        Returns:
+            list: (queue name, msgid, REQUEST frames) of each job
+        """
+        if not now:
+            now = monotonic()
+
+        jobs = []
+        while self._deadlines and self._deadlines[0][0] <= now:
+            msgid = heapq.heappop(self._deadlines)[2]
+            if msgid is not None:
+                jobs.append(self.remove(msgid))
+
+        return jobs
+
+
 class EMQdeque(object):
     """
     EventMQ deque based on python's collections.deque with full and
@@ -16,6 +16,7 @@
 :mod:`devices` -- Device Utilities
 ==================================
 """
+from . import generate_id
 
 
 def generate_device_name(prefix=None):
@@ -29,8 +30,7 @@ def generate_device_name(prefix=None):
     Returns (str) An ascii encoded string that can be used as an IDENTITY for a
         ZMQ socket.
     """
-    import uuid
-    ret = str(uuid.uuid4()).encode('ascii')
+    ret = generate_id().encode('ascii')
     if prefix:
         ret = prefix + ret
     return ret
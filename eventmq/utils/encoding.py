@@ -12,9 +12,24 @@
 #
 # You should have received a copy of the GNU Lesser General Public License
 # along with eventmq.  If not, see <http://www.gnu.org/licenses/>.
-from past.builtins import basestring
+"""
+:mod:`encoding` -- Encoding
+===========================
+Helpers to turn messages into the bytes frames sent over 0mq sockets.
+"""
+from past.builtins import basestring, unicode
 
-from .. import conf
+from .. import conf, constants, exceptions
+
+#: Objects that are sent as frames without being converted
+FRAME_TYPES = (bytes, bytearray, memoryview)
+
+#: Frames that are the same in every message, encoded once
+EMPTY_FRAME = b''
+PROTOCOL_VERSION_FRAME = constants.PROTOCOL_VERSION.encode('ascii')
+
+#: Key: command passed to :func:`command_frame`, Value: the encoded frame
+_command_frames = {}
 
 
 def encodify(message):
@@ -46,3 +61,60 @@ def encodify(message):
     else:
         return message
     return message
+
+
+def encode_frame(frame, strict=None):
+    """
+    Encode a single frame of a message. Bytes are returned as is and text is
+    encoded to ``conf.DEFAULT_ENCODING``. Anything else is passed through
+    :func:`encodify` unless `strict` is enabled.
+
+    Args:
+        frame: The frame to encode
+        strict (bool): Raise :class:`MessageError` if `frame` isn't bytes or
+            text. Default: ``conf.STRICT_FRAMES``
+
+    Returns:
+        The encoded frame
+    """
+    if isinstance(frame, FRAME_TYPES):
+        return frame
+    elif isinstance(frame, unicode):
+        return frame.encode(conf.DEFAULT_ENCODING)
+
+    if strict is None:
+        strict = conf.STRICT_FRAMES
+
+    if strict:
+        raise exceptions.MessageError(
+            '{} is not a valid message frame'.format(type(frame)))
+
+    return encodify(frame)
+
+
+def encode_frames(frames, strict=None):
+    """
+    Encode each frame of a message once, without walking into the frames.
+
+    Args:
+        frames (list): The frames of the message
+        strict (bool): See :func:`encode_frame`
+
+    Returns:
+        list: The encoded frames
+    """
+    return [encode_frame(frame, strict) for frame in frames]
+
+
+def command_frame(command):
+    """
+    Returns:
+        bytes: The frame for the eMQP `command`, e.g. ``REQUEST``. Frames are
+            cached so each command is only encoded once.
+    """
+    try:
+        return _command_frames[command]
+    except KeyError:
+        frame = _command_frames[command] = \
+            str(command).upper().encode('ascii')
+        return frame
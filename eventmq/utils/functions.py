@@ -3,7 +3,9 @@ import importlib
 import inspect
 import json
 
-from .. import log
+from .headers import parse_headers
+from .timeutils import timestamp
+from .. import conf, log
 from ..exceptions import CallableFromPathError
 
 logger = log.setup_logger(__name__)
@@ -68,8 +70,8 @@ def arguments_hash(*args, **kwargs):
         'kwargs': kwargs,
     }
 
-    data = json.dumps(args, cls=IgnoreJSONEncoder)
-    return hashlib.sha1(data).hexdigest()
+    data = json.dumps(args, cls=IgnoreJSONEncoder, sort_keys=True)
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
 
 
 def name_from_callable(func):
@@ -212,8 +214,87 @@ def get_timeout_from_headers(headers):
     Retruns:
         timeout(int): The timeout if found, else None
     """
-    timeout = None
-    for header in headers.split(','):
-        if 'timeout:' in header:
-            timeout = int(header.split(':')[1])
-    return timeout
+    return parse_headers(headers).timeout
+
+
+def get_debounce_from_headers(headers):
+    """Return the debounce window if it exists in the given headers
+
+    Returns:
+        debounce(int): The debounce window in seconds if found, else None
+    """
+    return parse_headers(headers).debounce
+
+
+def get_dedupe_key_from_headers(headers):
+    """Return the dedupe key if it exists in the given headers
+
+    Returns:
+        dedupe_key(str): The dedupe key if found, else None
+    """
+    return parse_headers(headers).dedupe_key
+
+
+def get_retry_count_from_headers(headers):
+    """Return the number of retries if it exists in the given headers
+
+    Returns:
+        retry_count(int): The number of times to retry a failed job if found,
+            else 0
+    """
+    return parse_headers(headers).retry_count or 0
+
+
+def get_eta_from_headers(headers, now=None):
+    """Return when the job should run if the ``eta:<unix_ts>`` or
+    ``delay:<secs>`` header exists in the given headers
+
+    Args:
+        headers (str): comma separated headers
+        now (float): unix timestamp the delay is relative to. Default: now
+
+    Returns:
+        eta(float): Unix timestamp to run the job at if found, else None
+    """
+    return parse_headers(headers).eta_at(now or timestamp())
+
+
+def retry_backoff(attempt):
+    """
+    Returns:
+        float: The longest backoff before retry number `attempt` (starting
+            at 1) of a failed job: ``conf.RETRY_BACKOFF_BASE * 2^(attempt -
+            1)`` seconds, capped at ``conf.RETRY_BACKOFF_MAX``
+    """
+    if attempt < 1 or conf.RETRY_BACKOFF_BASE <= 0:
+        return 0
+
+    # Doubling stops at the cap so huge attempts don't build huge numbers
+    delay = conf.RETRY_BACKOFF_BASE
+    for _ in range(1, attempt):
+        if delay >= conf.RETRY_BACKOFF_MAX:
+            break
+        delay *= 2
+
+    return min(conf.RETRY_BACKOFF_MAX, delay)
+
+
+def max_retry_backoff(retries):
+    """
+    Returns:
+        float: The longest a job may wait between attempts in total when it
+            fails `retries` times
+    """
+    if conf.RETRY_BACKOFF_BASE <= 0:
+        return 0
+
+    total = 0
+    delay = conf.RETRY_BACKOFF_BASE
+    for attempt in range(1, retries + 1):
+        if delay >= conf.RETRY_BACKOFF_MAX:
+            # Every later retry waits the max
+            return total + conf.RETRY_BACKOFF_MAX * (retries - attempt + 1)
+        total += delay
+        delay *= 2
+
+    return total
@@ -0,0 +1,241 @@
+# This file is part of eventmq.
+#
+# eventmq is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 2.1 of the License, or (at your option)
+# any later version.
+#
+# eventmq is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with eventmq.  If not, see <http://www.gnu.org/licenses/>.
+"""
+:mod:`headers` -- Message Headers
+=================================
+Headers of REQUEST and SCHEDULE messages travel as one comma separated frame
+of flags (``reply-requested``) and ``key:value`` pairs (``timeout:30``). The
+frame is parsed once into a :class:`Headers` object by the device that
+receives it, so checking a header is an attribute lookup and keys are
+matched exactly.
+
+Usage:
+    headers = parse_headers('reply-requested,timeout:30')
+    if headers.reply_requested:
+        ...
+"""
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+_UNESCAPES = {'%25': '%', '%2C': ','}
+_escaped = re.compile('%25|%2C')
+
+
+def _text(value):
+    return value
+
+
+def _escape(value):
+    # Commas separate headers, so they are escaped in free text values, as is
+    # the escape character
+    return value.replace('%', '%25').replace(',', '%2C')
+
+
+def _unescape(value):
+    return _escaped.sub(lambda match: _UNESCAPES[match.group(0)], value)
+
+
+def _format_float(value):
+    return ('%.3f' % value).rstrip('0').rstrip('.')
+
+
+#: Headers without a value. Key: header, Value: attribute
+FLAGS = (
+    ('reply-requested', 'reply_requested'),
+    ('guarantee', 'guarantee'),
+    ('nohaste', 'nohaste'),
+)
+
+#: Headers with a value. (header, attribute, parser, formatter). This is also
+#: the order they are encoded in.
+VALUES = (
+    ('retry-count', 'retry_count', int, '%d'.__mod__),
+    ('timeout', 'timeout', int, '%d'.__mod__),
+    ('debounce', 'debounce', int, '%d'.__mod__),
+    ('dedupe-key', 'dedupe_key', _unescape, _escape),
+    ('eta', 'eta', float, '%.3f'.__mod__),
+    ('delay', 'delay', float, _format_float),
+    ('run_count', 'run_count', int, '%d'.__mod__),
+    ('misfire', 'misfire', _text, _text),
+    ('jitter', 'jitter', float, _format_float),
+)
+
+_flags = dict(FLAGS)
+_values = dict((header, (attr, parser)) for header, attr, parser, _ in VALUES)
+
+#: Max number of parsed headers kept by :func:`parse_headers`
+CACHE_SIZE = 1024
+
+#: Key: headers frame, Value: Headers
+_cache = {}
+
+
+class Headers(object):
+    """
+    The parsed headers of a message. Flags that aren't set are False and
+    values that aren't set are None. Headers eventmq doesn't know about are
+    kept in :attr:`other` so they are sent on unchanged.
+
+    Objects returned by :func:`parse_headers` are shared between messages
+    with the same headers, so use :meth:`replace` instead of modifying them.
+    """
+    __slots__ = tuple(attr for _, attr in FLAGS) + \
+        tuple(attr for _, attr, _, _ in VALUES) + ('other', )
+
+    def __init__(self, other=(), **kwargs):
+        """
+        Args:
+            other (tuple): Unknown headers, as they were on the wire
+            kwargs: Values of the attributes, e.g. ``timeout=30``
+        """
+        for _, attr in FLAGS:
+            setattr(self, attr, kwargs.pop(attr, False))
+        for _, attr, _, _ in VALUES:
+            setattr(self, attr, kwargs.pop(attr, None))
+        self.other = tuple(other)
+
+        if kwargs:
+            raise TypeError('Unknown headers: {}'.format(
+                ', '.join(sorted(kwargs))))
+
+    @classmethod
+    def parse(cls, raw):
+        """
+        Parse a headers frame. Values that can't be parsed are logged and
+        ignored.
+
+        Args:
+            raw (str): The comma separated headers
+
+        Returns:
+            Headers: The parsed headers
+        """
+        headers = cls()
+        if not raw:
+            return headers
+
+        other = []
+        for item in raw.split(','):
+            if not item:
+                continue
+
+            key, sep, value = item.partition(':')
+            if not sep:
+                attr = _flags.get(key)
+                if attr:
+                    setattr(headers, attr, True)
+                else:
+                    other.append(item)
+                continue
+
+            try:
+                attr, parser = _values[key]
+            except KeyError:
+                other.append(item)
+                continue
+
+            try:
+                setattr(headers, attr, parser(value))
+            except ValueError:
+                logger.warning('Ignoring invalid header %s', item)
+
+        headers.other = tuple(other)
+        return headers
+
+    def encode(self):
+        """
+        Returns:
+            str: The headers as a frame to send
+        """
+        items = [header for header, attr in FLAGS if getattr(self, attr)]
+        for header, attr, _, formatter in VALUES:
+            value = getattr(self, attr)
+            if value is not None:
+                items.append('{}:{}'.format(header, formatter(value)))
+        items.extend(self.other)
+
+        return ','.join(items)
+
+    def replace(self, **kwargs):
+        """
+        Returns:
+            Headers: A copy of these headers with the attributes in `kwargs`
+                changed
+        """
+        values = dict((attr, getattr(self, attr)) for attr in self.__slots__)
+        values.update(kwargs)
+        return Headers(**values)
+
+    def eta_at(self, now):
+        """
+        Args:
+            now (float): Unix timestamp a ``delay`` is relative to
+
+        Returns:
+            float: Unix timestamp to run the job at from the ``eta`` or
+                ``delay`` header, or None if neither is set
+        """
+        if self.eta is not None:
+            return self.eta
+        elif self.delay is not None:
+            return now + self.delay
+        return None
+
+    def __eq__(self, other):
+        return isinstance(other, Headers) and \
+            all(getattr(self, attr) == getattr(other, attr)
+                for attr in self.__slots__)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return 'Headers({!r})'.format(self.encode())
+
+
+def parse_headers(raw):
+    """
+    Parse a headers frame, reusing the result for frames that were seen
+    before. Most messages are sent with one of a handful of headers so they
+    are rarely parsed more than once.
+
+    Args:
+        raw (str): The comma separated headers. A :class:`Headers` object is
+            returned as is.
+
+    Returns:
+        Headers: The parsed headers
+    """
+    if isinstance(raw, Headers):
+        return raw
+
+    try:
+        return _cache[raw]
+    except KeyError:
+        pass
+    except TypeError:
+        # Not hashable, so it isn't a headers frame
+        raise ValueError('Invalid headers {!r}'.format(raw))
+
+    headers = Headers.parse(raw)
+    if len(_cache) >= CACHE_SIZE:
+        # Headers with per-job values (e.g. eta) would otherwise fill the
+        # cache. Starting over is cheaper than tracking what's least used.
+        _cache.clear()
+    _cache[raw] = headers
+
+    return headers
@@ -18,7 +18,8 @@
 """
 import logging
 
-from . import random_characters
+from . import generate_id
+from .encoding import command_frame
 from .. import conf, constants, exceptions
 
 logger = logging.getLogger(__name__)
@@ -77,14 +78,15 @@ def parse_message(message):
 
 def generate_msgid(prefix=None):
     """
-    Returns a random string to be used for message ids. Optionally the ID can
-    be prefixed with `prefix`.
+    Returns a unique string to be used for message ids. The ids sort by the
+    time they were generated (see :func:`eventmq.utils.generate_id`).
+    Optionally the ID can be prefixed with `prefix`.
 
     Args:
         prefix (str): Value to prefix on to the random part of the id. Useful
             for prefixing some meta data to use for things
     """
-    id = random_characters()
+    id = generate_id()
     return id if not prefix else str(prefix) + id
 
 
@@ -102,11 +104,11 @@ def send_emqp_message(socket, command, message=None):
         str: Message id for this message
     """
     msgid = generate_msgid()
-    msg = (str(command).upper(), msgid)
+    msg = [command_frame(command), msgid]
     if message and isinstance(message, (tuple, list)):
-        msg += tuple(message)
+        msg.extend(message)
     elif message:
-        msg += (message,)
+        msg.append(message)
 
     socket.send_multipart(msg, constants.PROTOCOL_VERSION)
 
@@ -128,11 +130,11 @@ def send_emqp_router_message(socket, recipient_id, command, message=None):
         str: Message id for this message
     """
     msgid = generate_msgid()
-    msg = (str(command).upper(), msgid)
+    msg = [command_frame(command), msgid]
     if message and isinstance(message, (tuple, list)):
-        msg += message
+        msg.extend(message)
     elif message:
-        msg += (message,)
+        msg.append(message)
 
     socket.send_multipart(msg, constants.PROTOCOL_VERSION,
                           _recipient_id=recipient_id)
@@ -164,7 +166,7 @@ def fwd_emqp_router_message(socket, recipient_id, payload):
 
     payload = [recipient_id, ] + payload
     if conf.SUPER_DEBUG:
-        logger.debug('Forwarding message: {}'.format(str(payload)))
+        logger.debug('Forwarding message: %s', payload)
     try:
         socket.zsocket.send_multipart(payload,
                                       flags=zmq.NOBLOCK)
@@ -58,12 +58,23 @@ def import_settings(section='global'):
                     # json.loads coverts all arrays to lists, but if the first
                     # element in the default is a tuple (like in QUEUES) then
                     # convert those elements, otherwise whatever it's type is
-                    # correct
-                    if isinstance(default_value[0], tuple):
+                    # correct. Empty defaults (like PRELOAD_MODULES) are
+                    # taken as is.
+                    if default_value and isinstance(default_value[0], tuple):
                         setattr(conf, name.upper(),
                                 t(map(tuplify, value)))
                     else:
                         setattr(conf, name.upper(), t(value))
+                elif isinstance(default_value, dict):
+                    try:
+                        value = json.loads(value)
+                    except ValueError:
+                        raise ValueError(
+                            "Invalid JSON syntax for {} setting".format(name))
+                    if not isinstance(value, dict):
+                        raise ValueError(
+                            "{} setting must be a JSON object".format(name))
+                    setattr(conf, name.upper(), value)
                 elif isinstance(default_value, bool):
                     setattr(conf, name.upper(),
                             True if 't' in value.lower() else False)
@@ -0,0 +1,87 @@
+# This file is part of eventmq.
+#
+# eventmq is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 2.1 of the License, or (at your option)
+# any later version.
+#
+# eventmq is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with eventmq.  If not, see <http://www.gnu.org/licenses/>.
+"""
+:mod:`sharedmem` -- Shared Memory
+=================================
+Hands large job bodies from the jobmanager to its worker processes through
+files in ``conf.SHARED_MEMORY_DIR`` (a tmpfs, so the files stay in memory)
+instead of pickling them through the multiprocessing queue. Only the path of
+the file is sent to the worker, which reads the body straight from it.
+"""
+import errno
+import os
+import tempfile
+
+from .. import conf
+
+
+def shared_memory_dir():
+    """
+    Returns:
+        str: ``conf.SHARED_MEMORY_DIR``, or the temp directory if it doesn't
+            exist
+    """
+    if conf.SHARED_MEMORY_DIR and os.path.isdir(conf.SHARED_MEMORY_DIR):
+        return conf.SHARED_MEMORY_DIR
+
+    return tempfile.gettempdir()
+
+
+def write_shared(data):
+    """
+    Write `data` to a new file in shared memory
+
+    Args:
+        data (bytes): The data to share
+
+    Raises:
+        IOError, OSError: The file couldn't be written
+
+    Returns:
+        str: Path of the file, for :func:`read_shared` and
+            :func:`unlink_shared`
+    """
+    fd, path = tempfile.mkstemp(
+        prefix='eventmq-{}-'.format(os.getpid()), dir=shared_memory_dir())
+
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+    except Exception:
+        unlink_shared(path)
+        raise
+
+    return path
+
+
+def read_shared(path):
+    """
+    Returns:
+        bytes: The data written to `path` by :func:`write_shared`
+    """
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def unlink_shared(path):
+    """
+    Remove a file written by :func:`write_shared`. It's fine if it's already
+    gone.
+    """
+    try:
+        os.unlink(path)
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            raise
@@ -86,3 +86,22 @@ class IntervalIter(object):
 
     def next(self):
         return self.__next__()
+
+    def next_after(self, ts):
+        """
+        Skip any intervals that fall on or before `ts` and return the first
+        execution time after it. The cadence of the iterator is kept, so the
+        result is always ``start_value + (n * interval_secs)``.
+
+        Args:
+            ts (numeric) - the timestamp to skip past. Uses the same clock as
+                ``start_value``
+
+        Returns:
+            numeric: the next execution time after `ts`
+        """
+        if self.interval_secs > 0 and self.current <= ts:
+            missed = int((ts - self.current) // self.interval_secs) + 1
+            self.current += missed * self.interval_secs
+
+        return self.__next__()
@@ -17,24 +17,42 @@
 ===============================
 Defines different short-lived workers that execute jobs
 """
+import functools
+import gc
 from importlib import import_module
+from json import loads as deserializer
 
 import logging
 
 from multiprocessing import Process
 
 import os
+import resource
 import sys
 
-from threading import Thread
+from threading import current_thread, Lock, Thread, Timer
 
 from . import conf
+from .exceptions import JobTimeoutError
+from .tracing import trace
+from .utils.sharedmem import read_shared
+from .utils.timeutils import monotonic
 
 if sys.version[0] == '2':
     import Queue
 else:
     import queue as Queue
 
+try:
+    import asyncio
+except ImportError:
+    # Python 2
+    asyncio = None
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
 
 class MultiprocessWorker(Process):
     """
@@ -49,6 +67,67 @@ class MultiprocessWorker(Process):
         self.run_setup = run_setup
         self.ppid = ppid
 
+        #: Resident memory of the process in bytes after its last job
+        self.rss = 0
+        #: Resident memory after the first job, once the job's modules are
+        #: imported. Growth is measured from here.
+        self.baseline_rss = None
+        #: monotonic time the process started
+        self.started_at = None
+
+    def recycle_reason(self, now=None):
+        """
+        Sample the memory of the process and check the recycling policies.
+        Called between jobs.
+
+        Returns:
+            str: Why the process should exit (``job_count``, ``rss``,
+                ``rss_growth`` or ``age``), or None if it should keep running
+        """
+        self.rss = current_rss()
+        if self.baseline_rss is None:
+            self.baseline_rss = self.rss
+
+        if conf.MAX_JOB_COUNT and self.job_count >= conf.MAX_JOB_COUNT:
+            return 'job_count'
+        if conf.WORKER_MAX_RSS and self.rss >= conf.WORKER_MAX_RSS * MB:
+            return 'rss'
+        if conf.WORKER_MAX_RSS_GROWTH and \
+           self.rss - self.baseline_rss >= conf.WORKER_MAX_RSS_GROWTH * MB:
+            return 'rss_growth'
+        if conf.WORKER_MAX_AGE and self.started_at is not None and \
+           (now or monotonic()) - self.started_at >= conf.WORKER_MAX_AGE:
+            return 'age'
+
+        return None
+
+    @staticmethod
+    def interrupt_job(interrupter, result_queue):
+        """
+        Raise :class:`JobTimeoutError` in the thread running a job that ran
+        past its timeout, and give the job ``conf.TIMEOUT_GRACE_PERIOD``
+        seconds to stop.
+
+        Args:
+            interrupter (JobInterrupter): The interrupter of the worker thread
+            result_queue: The queue the worker thread puts results on
+
+        Returns:
+            bool: True if the job stopped. If it didn't, the process has to
+                exit to stop it.
+        """
+        if conf.TIMEOUT_GRACE_PERIOD <= 0 or not interrupter.interrupt():
+            return False
+
+        # Wait for the result of the interrupted job, or of a job that
+        # finished just before it could be interrupted
+        try:
+            result_queue.get(timeout=conf.TIMEOUT_GRACE_PERIOD)
+        except Queue.Empty:
+            return False
+
+        return True
+
     @property
     def logger(self):
         return logging.getLogger(__name__ + '.' + str(os.getpid()))
@@ -61,26 +140,21 @@ class MultiprocessWorker(Process):
         """
         # Define the 2 queues for communicating with the worker thread
         logger = self.logger
+        self.started_at = monotonic()
 
         worker_queue = Queue.Queue(1)
         worker_result_queue = Queue.Queue(1)
+        interrupter = JobInterrupter()
         worker_thread = Thread(target=_run,
                                args=(worker_queue,
                                      worker_result_queue,
-                                     logger))
+                                     logger,
+                                     interrupter))
 
         import zmq
         zmq.Context.instance().term()
 
-        self.output_queue.put(
-            {'msgid': None,
-             'return': None,
-             'death': False,
-             'pid': os.getpid(),
-             'callback': 'worker_ready'}
-        )
-
-        callback = 'premature_death'
+        self.output_queue.put(_ready_response())
 
         worker_thread.start()
 
@@ -105,50 +179,64 @@ class MultiprocessWorker(Process):
 
             try:
                 return_val = 'None'
+                failed = False
+                timed_out = False
+                hard_timeout = False
                 self.job_count += 1
                 timeout = payload.get("timeout") or conf.GLOBAL_TIMEOUT
                 msgid = payload.get('msgid', '')
-                callback = payload.get('callback', '')
 
                 if conf.SUPER_DEBUG:
                     logger.debug("Putting on thread queue msgid: {}".format(
                         msgid))
 
+                for job_msgid in payload.get('batch', (msgid, )):
+                    trace('worker.start', job_msgid)
+
                 worker_queue.put(payload['params'])
 
                 try:
-                    return_val = worker_result_queue.get(timeout=timeout)
+                    return_val, failed = worker_result_queue.get(
+                        timeout=timeout)
 
                     if conf.SUPER_DEBUG:
                         logger.debug("Got from result queue msgid: {}".format(
                             msgid))
                 except Queue.Empty:
                     return_val = 'TimeoutError'
-
-                return_val = {"value": return_val}
+                    failed = True
+                    timed_out = True
+                    hard_timeout = not self.interrupt_job(
+                        interrupter, worker_result_queue)
+
+                recycle = self.recycle_reason()
+                response = _job_response(payload, return_val, failed,
+                                         timed_out=timed_out)
+                response.update({
+                    'death': recycle is not None or hard_timeout,
+                    'rss': self.rss,
+                    'recycle': recycle,
+                })
+                if timed_out:
+                    response['timeout'] = {'seconds': timeout,
+                                           'hard': hard_timeout}
 
                 try:
-                    self.output_queue.put_nowait(
-                        {'msgid': msgid,
-                         'return': return_val,
-                         'death': self.job_count >= conf.MAX_JOB_COUNT or
-                         return_val["value"] == 'TimeoutError',
-                         'pid': os.getpid(),
-                         'callback': callback}
-                    )
+                    self.output_queue.put_nowait(response)
                 except Exception:
                     break
 
-                if return_val["value"] == 'TimeoutError':
+                if hard_timeout:
+                    break
+
+                if recycle is not None:
+                    logger.debug("Worker is being recycled ({}), exiting"
+                                 .format(recycle))
                     break
 
             except Exception as e:
                 return_val = str(e)
 
-            if self.job_count >= conf.MAX_JOB_COUNT:
-                logger.debug("Worker reached job limit, exiting")
-                break
-
         worker_queue.put('DONE')
         worker_thread.join(timeout=5)
 
@@ -166,10 +254,305 @@ class MultiprocessWorker(Process):
             logger.debug("Worker thread did not die gracefully")
 
 
-def _run(queue, result_queue, logger):
+class ThreadExecutor(object):
+    """
+    Runs jobs in a pool of threads in the jobmanager process. The threads
+    share the jobmanager's memory, so it can run many more jobs that mostly
+    wait on I/O (e.g. webhooks) at once than with a process per job.
+
+    A job that runs past its timeout gets :class:`JobTimeoutError` raised in
+    it. A thread can't be killed, so a job that ignores it keeps its thread.
+    """
+    def __init__(self, output_queue, size=None, name='thread'):
+        """
+        Args:
+            output_queue: Queue to put the responses for the jobmanager on
+            size (int): Number of threads. Default: ``conf.THREAD_POOL_SIZE``
+            name (str): Name of the executor, sent with each response
+        """
+        self.output_queue = output_queue
+        self.size = size or conf.THREAD_POOL_SIZE
+        self.name = name
+        self.input_queue = Queue.Queue()
+        self.threads = []
+
+        #: Number of payloads submitted that haven't finished. Only updated
+        #: by the jobmanager's event loop.
+        self.busy = 0
+
+    def start(self):
+        """
+        Start the threads. Each thread sends READY once it's running.
+        """
+        for i in range(self.size):
+            thread = Thread(target=self._work,
+                            name='eventmq-{}-{}'.format(self.name, i))
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self):
+        """
+        Stop the threads once they finish the jobs they have
+        """
+        for _ in self.threads:
+            self.input_queue.put('DONE')
+
+    def submit(self, payload):
+        """
+        Args:
+            payload (dict): A payload from the jobmanager
+        """
+        self.busy += 1
+        self.input_queue.put(payload)
+
+    def take_queued(self):
+        """
+        Returns:
+            list: The payloads no thread has started, in the order they were
+                submitted
+        """
+        payloads = []
+        stop_requests = 0
+        while True:
+            try:
+                payload = self.input_queue.get_nowait()
+            except Queue.Empty:
+                break
+
+            if payload == 'DONE':
+                stop_requests += 1
+            else:
+                payloads.append(payload)
+
+        for _ in range(stop_requests):
+            self.input_queue.put('DONE')
+
+        self.busy = max(0, self.busy - len(payloads))
+        return payloads
+
+    def _work(self):
+        self.output_queue.put(_ready_response(self.name))
+
+        while True:
+            payload = self.input_queue.get()
+            if payload == 'DONE':
+                break
+
+            self.output_queue.put(self.run_payload(payload))
+
+        logger.debug('{} thread death'.format(self.name))
+
+    def run_payload(self, payload):
+        """
+        Run a payload in this thread
+
+        Returns:
+            dict: The response for the jobmanager
+        """
+        msgid = payload.get('msgid', '')
+        timeout = payload.get('timeout') or conf.GLOBAL_TIMEOUT
+        thread = current_thread()
+        lock = Lock()
+        # Whether the job finished and whether it timed out. The timer only
+        # raises in the thread while the job is running.
+        state = {'finished': False, 'timed_out': False}
+
+        def interrupt():
+            with lock:
+                if not state['finished']:
+                    state['timed_out'] = True
+                    raise_in_thread(thread, JobTimeoutError)
+
+        for job_msgid in payload.get('batch', (msgid, )):
+            trace('worker.start', job_msgid)
+
+        timer = Timer(timeout, interrupt)
+        timer.daemon = True
+
+        return_val, failed = 'TimeoutError', True
+        try:
+            try:
+                timer.start()
+                return_val, failed = _execute(payload['params'], logger)
+            finally:
+                with lock:
+                    state['finished'] = True
+                timer.cancel()
+                if state['timed_out']:
+                    # Cancel the exception if the job finished first
+                    raise_in_thread(thread, None)
+        except JobTimeoutError:
+            pass
+
+        timed_out = state['timed_out']
+        if timed_out:
+            return_val, failed = 'TimeoutError', True
+
+        response = _job_response(payload, return_val, failed,
+                                 timed_out=timed_out, executor=self.name)
+        if timed_out:
+            response['timeout'] = {'seconds': timeout, 'hard': False}
+
+        return response
+
+
+class AsyncioExecutor(object):
+    """
+    Runs jobs on an asyncio event loop in a thread of the jobmanager
+    process, so thousands of jobs that wait on I/O can run at once. Coroutine
+    functions run on the loop. Other callables (and batches) run in the
+    loop's default thread pool so they don't block it.
+
+    A job that runs past its timeout is cancelled. Only coroutines can be
+    cancelled, so a callable running in the thread pool keeps running.
+
+    Requires Python 3.
+    """
+    def __init__(self, output_queue, size=None, name='asyncio'):
+        """
+        Args:
+            output_queue: Queue to put the responses for the jobmanager on
+            size (int): Max number of jobs running at once. Default:
+                ``conf.ASYNCIO_CONCURRENCY``
+            name (str): Name of the executor, sent with each response
+
+        Raises:
+            ImportError: asyncio isn't available
+        """
+        if asyncio is None:
+            raise ImportError('asyncio is not available')
+
+        self.output_queue = output_queue
+        self.size = size or conf.ASYNCIO_CONCURRENCY
+        self.name = name
+        self.loop = asyncio.new_event_loop()
+        self.thread = None
+
+        #: Number of payloads submitted that haven't finished. Only updated
+        #: by the jobmanager's event loop.
+        self.busy = 0
+
+    def start(self):
+        """
+        Start the event loop. It sends READY for each of its slots once it's
+        running.
+        """
+        self.thread = Thread(target=self._work,
+                             name='eventmq-{}'.format(self.name))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        """
+        Stop the event loop. Jobs that are still running are dropped.
+        """
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+    def submit(self, payload):
+        """
+        Args:
+            payload (dict): A payload from the jobmanager
+        """
+        self.busy += 1
+        self.loop.call_soon_threadsafe(self.start_job, payload)
+
+    def take_queued(self):
+        """
+        Returns:
+            list: Always empty, jobs start as soon as they're submitted
+        """
+        return []
+
+    def _work(self):
+        asyncio.set_event_loop(self.loop)
+        for _ in range(self.size):
+            self.output_queue.put(_ready_response(self.name))
+
+        self.loop.run_forever()
+        logger.debug('{} loop death'.format(self.name))
+
+    def start_job(self, payload):
+        """
+        Start a payload on the event loop. Called in the loop's thread.
+        """
+        params = payload['params']
+        timeout = payload.get('timeout') or conf.GLOBAL_TIMEOUT
+
+        for job_msgid in payload.get('batch', (payload.get('msgid', ''), )):
+            trace('worker.start', job_msgid)
+
+        try:
+            if 'batch' in params:
+                future = self.loop.run_in_executor(
+                    None, _execute, params, logger)
+            else:
+                callable_ = _import_callable(params)
+                args = params.get('args', ())
+                kwargs = params.get('kwargs', {})
+
+                if asyncio.iscoroutinefunction(callable_):
+                    future = callable_(*args, **kwargs)
+                else:
+                    future = self.loop.run_in_executor(
+                        None, functools.partial(callable_, *args, **kwargs))
+
+            task = self.loop.create_task(asyncio.wait_for(future, timeout))
+        except Exception as e:
+            logger.exception(e)
+            self.output_queue.put(_job_response(
+                payload, str(e), True, executor=self.name))
+            return
+
+        task.add_done_callback(
+            functools.partial(self.finish_job, payload, timeout))
+
+    def finish_job(self, payload, timeout, task):
+        """
+        Report a job started by :meth:`start_job` that finished
+        """
+        timed_out = False
+        if task.cancelled():
+            return_val, failed = 'CancelledError', True
+        elif isinstance(task.exception(), asyncio.TimeoutError):
+            return_val, failed = 'TimeoutError', True
+            timed_out = True
+        elif task.exception() is not None:
+            logger.error('Job {} failed: {!r}'.format(
+                payload.get('msgid'), task.exception()))
+            return_val, failed = str(task.exception()), True
+        elif 'batch' in payload['params']:
+            return_val, failed = task.result()
+        else:
+            return_val, failed = task.result(), False
+
+        response = _job_response(payload, return_val, failed,
+                                 timed_out=timed_out, executor=self.name)
+        if timed_out:
+            response['timeout'] = {'seconds': timeout, 'hard': False}
+
+        self.output_queue.put(response)
+
+
+#: Executors by the values of the ``queue_executors`` setting, other than the
+#: process pool
+EXECUTORS = {
+    'thread': ThreadExecutor,
+    'asyncio': AsyncioExecutor,
+}
+
+
+def _run(queue, result_queue, logger, interrupter=None):
     """
     Takes care of actually executing the code given a message payload
 
+    Args:
+        queue: The queue to read payloads from
+        result_queue: The queue to put ``(return_val, failed)`` on
+        logger: The logger of the worker process
+        interrupter (JobInterrupter): Used to raise :class:`JobTimeoutError`
+            in the thread when a job times out
+
     Example payload:
     {
         "path": "path_to_callable",
@@ -180,7 +563,10 @@ def _run(queue, result_queue, logger):
         "class_kwargs": {"value": 2}
     }
     """
-    if any(conf.SETUP_CALLABLE) and any(conf.SETUP_PATH):
+    # With PRELOAD_SETUP the setup already ran in the jobmanager this
+    # process was forked from
+    if any(conf.SETUP_CALLABLE) and any(conf.SETUP_PATH) and \
+       not conf.PRELOAD_SETUP:
         try:
             logger.debug("Running setup ({}.{}) for worker id {}"
                          .format(
@@ -193,6 +579,9 @@ def _run(queue, result_queue, logger):
                            .format(conf.SETUP_PATH,
                                    conf.SETUP_CALLABLE, str(e)))
 
+    if interrupter is None:
+        interrupter = JobInterrupter()
+
     while True:
         # Blocking get so we don't spin cycles reading over and over
         try:
@@ -204,44 +593,129 @@ def _run(queue, result_queue, logger):
         if payload == 'DONE':
             break
 
-        return_val = _run_job(payload, logger)
+        return_val, failed = 'TimeoutError', True
+        try:
+            try:
+                interrupter.job_started()
+                return_val, failed = _execute(payload, logger)
+            finally:
+                interrupter.job_finished()
+        except JobTimeoutError:
+            # The job returned, but the timeout landed before it was marked
+            # finished
+            interrupter.job_finished()
+            return_val, failed = 'TimeoutError', True
+
         # Signal that we're done with this job and put its return value on the
         # result queue
-        result_queue.put(return_val)
+        result_queue.put((return_val, failed))
 
     logger.debug("Worker thread death")
 
 
-def _run_job(payload, logger):
-    try:
-        if ":" in payload["path"]:
-            _pkgsplit = payload["path"].split(':')
-            s_package = _pkgsplit[0]
-            s_cls = _pkgsplit[1]
-        else:
-            s_package = payload["path"]
-            s_cls = None
+def _execute(params, logger):
+    """
+    Run the job, or batch of jobs, described by the ``params`` of a payload.
+    Large bodies are decoded here from the ``shared_body`` the jobmanager
+    wrote them to, encoded to ``conf.DEFAULT_ENCODING``.
+
+    Returns:
+        tuple: (return value, True if the job failed). For a batch the return
+            value is the list returned by :func:`_run_batch`, and the batch
+            failed if any of its jobs did.
+    """
+    if 'shared_body' in params:
+        try:
+            body = read_shared(params['shared_body'])
+            params = deserializer(body.decode(conf.DEFAULT_ENCODING))[1]
+        except Exception as e:
+            logger.exception(e)
+            return str(e), True
 
-        s_callable = payload["callable"]
+    if 'batch' in params:
+        return_val = _run_batch(params['batch'], logger)
+        return return_val, any(job_failed for _, job_failed in return_val)
 
-        package = import_module(s_package)
-        if s_cls:
-            cls = getattr(package, s_cls)
+    return _run_job(params, logger)
 
-            if "class_args" in payload:
-                class_args = payload["class_args"]
-            else:
-                class_args = ()
 
-            if "class_kwargs" in payload:
-                class_kwargs = payload["class_kwargs"]
-            else:
-                class_kwargs = {}
+def _job_response(payload, return_val, failed, timed_out=False,
+                  executor=None):
+    """
+    Build the response sent to the jobmanager for a finished payload
+
+    Args:
+        payload (dict): The payload from the jobmanager
+        return_val: What :func:`_execute` returned for it, or the error of a
+            job that timed out
+        failed (bool): True if the job failed
+        timed_out (bool): True if the job ran past its timeout
+        executor (str): Name of the executor that ran the job. None for the
+            process pool.
+
+    Returns:
+        dict: The response
+    """
+    msgid = payload.get('msgid', '')
+    response = {
+        'msgid': msgid,
+        'death': False,
+        'failed': failed,
+        'pid': os.getpid(),
+        'callback': payload.get('callback', ''),
+    }
+    if executor is not None:
+        response['executor'] = executor
+
+    if 'batch' in payload:
+        # The results of a batch are reported in one message
+        if timed_out:
+            return_val = [(return_val, True)] * len(payload['batch'])
+
+        response['return'] = None
+        response['batch'] = [
+            {'msgid': job_msgid,
+             'return': {'value': job_return_val},
+             'failed': job_failed}
+            for job_msgid, (job_return_val, job_failed) in
+            zip(payload['batch'], return_val)]
+
+        for job in response['batch']:
+            trace('worker.finish', job['msgid'], failed=job['failed'])
+    else:
+        response['return'] = {'value': return_val}
+        trace('worker.finish', msgid, failed=failed)
 
-            obj = cls(*class_args, **class_kwargs)
-            callable_ = getattr(obj, s_callable)
-        else:
-            callable_ = getattr(package, s_callable)
+    return response
+
+
+def _ready_response(executor=None):
+    """
+    Returns:
+        dict: The response telling the jobmanager a slot is ready for a job
+    """
+    response = {'msgid': None,
+                'return': None,
+                'death': False,
+                'pid': os.getpid(),
+                'callback': 'worker_ready'}
+    if executor is not None:
+        response['executor'] = executor
+
+    return response
+
+
+def _run_job(payload, logger):
+    """
+    Import and call the callable described by `payload`
+
+    Returns:
+        tuple: (return value, True if the job raised an exception). The return
+            value is the exception message for failed jobs.
+    """
+    failed = False
+    try:
+        callable_ = _import_callable(payload)
 
         if "args" in payload:
             args = payload["args"]
@@ -257,8 +731,176 @@ def _run_job(payload, logger):
     except Exception as e:
         logger.exception(e)
         return_val = str(e)
+        failed = True
+
+    return return_val, failed
+
+
+def _run_batch(payloads, logger):
+    """
+    Run several jobs for the same callable back to back. If the callable has
+    a ``batch`` attribute and none of the jobs have kwargs, it's called once
+    with the list of args of all the jobs instead, and must return a list with
+    the return value of each job.
+
+    Returns:
+        list: (return value, True if the job raised an exception) for each job
+    """
+    batch_callable = None
+    if not any(payload.get('kwargs') for payload in payloads):
+        try:
+            batch_callable = getattr(_import_callable(payloads[0]), 'batch',
+                                     None)
+        except Exception:
+            # Each job will report the error
+            pass
+
+    if not callable(batch_callable):
+        return [_run_job(payload, logger) for payload in payloads]
+
+    try:
+        return_vals = list(batch_callable(
+            [payload.get('args', ()) for payload in payloads]))
+
+        if len(return_vals) != len(payloads):
+            raise ValueError(
+                'batch returned {} values for {} jobs'.format(
+                    len(return_vals), len(payloads)))
+    except Exception as e:
+        logger.exception(e)
+        return [(str(e), True)] * len(payloads)
+
+    return [(return_val, False) for return_val in return_vals]
+
 
-    return return_val
+def _import_callable(payload):
+    """
+    Import the callable described by `payload`. If it is a method, its class
+    is instantiated with the ``class_args`` and ``class_kwargs`` of the
+    payload.
+    """
+    if ":" in payload["path"]:
+        _pkgsplit = payload["path"].split(':')
+        s_package = _pkgsplit[0]
+        s_cls = _pkgsplit[1]
+    else:
+        s_package = payload["path"]
+        s_cls = None
+
+    s_callable = payload["callable"]
+
+    package = import_module(s_package)
+    if s_cls:
+        cls = getattr(package, s_cls)
+
+        if "class_args" in payload:
+            class_args = payload["class_args"]
+        else:
+            class_args = ()
+
+        if "class_kwargs" in payload:
+            class_kwargs = payload["class_kwargs"]
+        else:
+            class_kwargs = {}
+
+        obj = cls(*class_args, **class_kwargs)
+        return getattr(obj, s_callable)
+
+    return getattr(package, s_callable)
+
+
+class JobInterrupter(object):
+    """
+    Raises :class:`JobTimeoutError` in the thread running a job, but only
+    while the job is running, so the exception can't land in the code that
+    hands off the job's result.
+    """
+    def __init__(self):
+        self.lock = Lock()
+        #: The thread running a job, or None between jobs
+        self.thread = None
+        #: Whether the exception was raised for the current job
+        self.interrupted = False
+
+    def job_started(self):
+        """
+        Called by the thread running the job before it starts
+        """
+        with self.lock:
+            self.thread = current_thread()
+            self.interrupted = False
+
+    def job_finished(self):
+        """
+        Called by the thread running the job once it returns. Cancels the
+        exception if it's still pending.
+        """
+        with self.lock:
+            if self.interrupted and self.thread is not None:
+                raise_in_thread(self.thread, None)
+            self.thread = None
+
+    def interrupt(self):
+        """
+        Raise :class:`JobTimeoutError` in the thread if it's running a job
+
+        Returns:
+            bool: True if the exception was raised or the job already
+                finished. False if the exception can't be raised.
+        """
+        with self.lock:
+            if self.thread is None:
+                return True
+            self.interrupted = raise_in_thread(self.thread, JobTimeoutError)
+            return self.interrupted
+
+
+def raise_in_thread(thread, exc_type):
+    """
+    Raise `exc_type` in `thread` the next time it runs python code. A thread
+    blocked in C code (e.g. a socket read) gets it once the call returns.
+
+    Args:
+        thread (Thread): The thread to raise the exception in
+        exc_type: The exception class, or None to cancel a pending exception
+
+    Returns:
+        bool: True if the exception was set. Only CPython supports it.
+    """
+    try:
+        import ctypes
+        set_async_exc = ctypes.pythonapi.PyThreadState_SetAsyncExc
+    except (ImportError, AttributeError):
+        return False
+
+    thread_id = ctypes.c_long(thread.ident)
+    exc = ctypes.py_object(exc_type) if exc_type is not None else None
+
+    count = set_async_exc(thread_id, exc)
+    if count > 1:
+        # Never expected, but it's what the API docs say to do
+        set_async_exc(thread_id, None)
+        return False
+
+    return count == 1
+
+
+def current_rss():
+    """
+    Returns:
+        int: Resident memory of this process in bytes. Read from
+            ``/proc/self/statm`` where it exists, otherwise the peak resident
+            memory reported by :func:`resource.getrusage`.
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except (IOError, OSError, IndexError, ValueError):
+        pass
+
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KB, macOS bytes
+    return maxrss if sys.platform == 'darwin' else maxrss * 1024
 
 
 def run_setup(setup_path, setup_callable):
@@ -279,3 +921,39 @@ def run_setup(setup_path, setup_callable):
         setup_callable_ = getattr(setup_package, setup_callable)
 
         setup_callable_()
+
+
+def preload():
+    """
+    Import the job modules in ``conf.PRELOAD_MODULES``, and run the setup
+    callable if ``conf.PRELOAD_SETUP`` is set, in the jobmanager before it
+    forks its workers. The workers inherit them copy-on-write, so a new
+    worker doesn't import them or run the setup again.
+
+    Returns:
+        list: The modules that couldn't be imported
+    """
+    failed = []
+    for module in conf.PRELOAD_MODULES:
+        try:
+            import_module(module.split(':')[0])
+        except Exception as e:
+            logger.warning('Unable to preload {}: {}'.format(module, e))
+            failed.append(module)
+
+    if conf.PRELOAD_SETUP and any(conf.SETUP_CALLABLE) and \
+       any(conf.SETUP_PATH):
+        try:
+            run_setup(conf.SETUP_PATH, conf.SETUP_CALLABLE)
+        except Exception as e:
+            logger.warning('Unable to do setup task ({}.{}): {}'
+                           .format(conf.SETUP_PATH, conf.SETUP_CALLABLE,
+                                   str(e)))
+
+    # Keep the garbage collector of the workers from writing to the pages of
+    # the preloaded objects (python 3.7+)
+    gc.collect()
+    if hasattr(gc, 'freeze'):
+        gc.freeze()
+
+    return failed